@@ -1 +1,5 @@
+"""Ringo Kai backend. ``.env`` is loaded here, before any module reads its settings."""
 
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -0,0 +1,100 @@
+"""The りんごちゃん support chatbot: prompts, per-status fallbacks and the model call."""
+
+from __future__ import annotations
+
+from .clients import openai_client
+from .db import run_openai, track_http
+
+
+STATUS_HINTS = {
+    "guest": "ユーザーは未ログインです。まずは新規登録や利用規約案内をしてください。",
+    "registered": "利用規約への同意を促し、terms ページへ進んでもらいます。",
+    "terms_agreed": "チュートリアル完了とチェックリストの確認方法を案内してください。",
+    "tutorial_completed": "購入対象の割り当てを待っている状態。Amazon購入とスクショ提出の手順を丁寧に説明。",
+    "ready_to_purchase": "割り当てられたリストの商品購入とスクショ撮影の注意点を説明。",
+    "verifying": "AI+管理者がスクショ確認中であること、待ち時間中にできることをガイド。",
+    "first_purchase_completed": "自分の欲しいものリストを登録し、ready_to_draw までの残り作業を伝える。",
+    "ready_to_draw": "24時間かけて開くりんごカードや友達紹介による確率アップを案内。",
+    "active": "ダッシュボードや紹介機能、チケット消化のベストプラクティスを共有。",
+}
+
+
+CHATBOT_SYSTEM_PROMPT = """
+あなたは「りんご会♪」の公式キャラクター「りんごちゃん」です。口調は柔らかく丁寧、語尾は優しく、絵文字を多用せずに 2〜4 文で端的に回答してください。
+- ユーザーの現在ステータスに応じて、次のアクションや注意点を優先的に案内する
+- スクリーンショットや購入内容などの個人情報を直接尋ねない
+- 不明点が多い場合は、@support に連絡するよう案内する
+- 動的RTPやりんご抽選のルールは仕様書通りに説明する
+"""
+
+
+STATUS_FALLBACK_RESPONSES = {
+    "guest": "こんにちは♪ まずは新規登録して、利用規約へ進んでくださいね。",
+    "registered": "利用規約ページで同意ボタンを押すと次に進めます。わからない所はなんでも聞いてください。",
+    "terms_agreed": "使い方ページでチェックリストを終えたら、購入ステップへ進みましょう。",
+    "tutorial_completed": "誰かの欲しいものリストが割り当たると通知されます。Amazonで購入したらスクショも忘れずに。",
+    "ready_to_purchase": "割り当てられた商品を購入して、注文番号が写ったスクショを提出してください。",
+    "verifying": "現在スクショを確認中です。通常は数時間で完了するので、少しだけ待っていてくださいね。",
+    "first_purchase_completed": "おめでとう！ 次は自分の欲しいものリストURLを登録して、抽選の準備を整えましょう。",
+    "ready_to_draw": "りんごを引いて24時間のワクワクを楽しんでください。友達紹介で確率もアップします。",
+    "active": "ステータスはアクティブです。ダッシュボードからチケット状況や紹介実績をチェックしてみてください。",
+}
+
+
+def build_chatbot_messages(message: str, status: str | None, user_email: str | None, user_id: str | None) -> list[dict[str, str]]:
+    status = status or "guest"
+    status_hint = STATUS_HINTS.get(status, STATUS_HINTS["guest"])
+    context_lines = [
+        f"User ID: {user_id or 'guest'}",
+        f"Status: {status}",
+        f"Status Hint: {status_hint}",
+        f"Email: {user_email or '不明'}",
+    ]
+    user_message = "\n".join(context_lines + ["---", message.strip()])
+    return [
+        {"role": "system", "content": CHATBOT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def extract_chatbot_reply(choice) -> str:
+    message = getattr(choice, "message", None)
+    if message is None:
+        return ""
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content.strip()
+    if isinstance(content, list):
+        text_parts: list[str] = []
+        for block in content:
+            if isinstance(block, dict):
+                text_parts.append(str(block.get("text", "")))
+            else:
+                text_parts.append(str(block))
+        return "".join(text_parts).strip()
+    return str(content).strip()
+
+
+def fallback_chatbot_reply(status: str | None) -> str:
+    return STATUS_FALLBACK_RESPONSES.get(status or "guest", STATUS_FALLBACK_RESPONSES["guest"])
+
+
+async def generate_chatbot_reply(message: str, status: str | None, user_email: str | None, user_id: str | None) -> str:
+    """The model's reply, or the canned reply for ``status`` when OpenAI is not configured or fails."""
+
+    if openai_client is None:
+        return fallback_chatbot_reply(status)
+
+    try:
+        with track_http("openai"):
+            completion = await run_openai(
+                openai_client.chat.completions.create,
+                model="gpt-4o-mini",
+                messages=build_chatbot_messages(message, status, user_email, user_id),
+                temperature=0.4,
+                max_tokens=400,
+            )
+        return extract_chatbot_reply(completion.choices[0]) or fallback_chatbot_reply(status)
+    except Exception as exc:  # pragma: no cover - network failure path
+        print(f"[Chatbot] OpenAI error: {exc}")
+        return fallback_chatbot_reply(status)
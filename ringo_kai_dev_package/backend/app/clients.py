@@ -0,0 +1,100 @@
+"""Supabase, Postgres and OpenAI clients, built on first use instead of at import.
+
+Importing the app, or a script that borrows its helpers, only reads configuration here.
+supabase-py, the OpenAI SDK and psycopg are imported, and their clients constructed, the first time
+something touches them, or up front by :func:`warm_up`, which the API's lifespan runs so the
+first request does not pay for it. Missing Supabase credentials therefore fail at startup (or at
+the first query of a script) rather than at import.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from .db import CountingClient
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+# "memory" runs against app/fake_supabase.py instead of a Supabase project (tests, offline benchmarks).
+SUPABASE_BACKEND = os.environ.get("SUPABASE_BACKEND", "supabase").lower()
+FAKE_SUPABASE_SEED = os.environ.get("FAKE_SUPABASE_SEED")
+FAKE_SUPABASE_LATENCY_MS = float(os.environ.get("FAKE_SUPABASE_LATENCY_MS", "0"))
+# "postgres" serves the hot read paths (user row, current apple/purchase, assignable wishlist items,
+# balance totals) straight from Postgres via SUPABASE_DB_URL; everything else stays on PostgREST.
+DATA_BACKEND = os.environ.get("DATA_BACKEND", "postgrest").lower()
+SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
+if DATA_BACKEND == "postgres" and not SUPABASE_DB_URL:
+    raise RuntimeError("DATA_BACKEND=postgres requires SUPABASE_DB_URL.")
+
+
+class LazyClient:
+    """Stands in for a client: builds it with ``factory`` on first attribute access (once, thread-safe) and delegates."""
+
+    def __init__(self, factory: Callable[[], Any], name: str) -> None:
+        self._factory = factory
+        self._name = name
+        self._instance: Any = None
+        self._build_lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    def instance(self) -> Any:
+        if self._instance is None:
+            with self._build_lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    print(f"[Clients] {self._name} ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.instance(), name)
+
+
+def _create_supabase() -> Any:
+    if SUPABASE_BACKEND == "memory":
+        from .fake_supabase import FakeSupabase
+
+        print(f"[Supabase] Using the in-memory fake (seed={FAKE_SUPABASE_SEED or 'empty'}, latency={FAKE_SUPABASE_LATENCY_MS}ms)")
+        if FAKE_SUPABASE_SEED:
+            return FakeSupabase.from_file(FAKE_SUPABASE_SEED, latency=FAKE_SUPABASE_LATENCY_MS / 1000)
+        return FakeSupabase(latency=FAKE_SUPABASE_LATENCY_MS / 1000)
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        raise RuntimeError("Supabase credentials are not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY.")
+    from supabase import create_client
+
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+
+def _create_pg_hot_paths() -> Any:
+    from .pg_backend import PostgresHotPaths
+
+    return PostgresHotPaths(SUPABASE_DB_URL)
+
+
+def _create_openai() -> Any:
+    from openai import OpenAI
+
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+supabase_client = LazyClient(_create_supabase, "supabase")
+supabase = CountingClient(supabase_client)
+pg_hot_paths = LazyClient(_create_pg_hot_paths, "postgres") if DATA_BACKEND == "postgres" else None
+openai_client = LazyClient(_create_openai, "openai") if OPENAI_API_KEY else None
+
+
+def warm_up() -> None:
+    """Build every configured client now (blocking), so a bad configuration fails at startup."""
+
+    supabase_client.instance()
+    if pg_hot_paths is not None:
+        pg_hot_paths.instance()
+    if openai_client is not None:
+        openai_client.instance()
@@ -0,0 +1,140 @@
+"""Response compression: brotli when the optional ``brotli`` package is installed and accepted, else gzip.
+
+Works like Starlette's GZipMiddleware (small bodies and responses that already carry a
+Content-Encoding pass through untouched, streamed bodies are compressed chunk by chunk), but
+negotiates the encoding from Accept-Encoding, and holds back the first body chunks until
+``minimum_size`` bytes have arrived or the body ended. Every response here is streamed through the
+``@api.middleware("http")`` layers, so deciding on the first chunk alone would compress even tiny
+bodies.
+"""
+
+from __future__ import annotations
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None  # type: ignore[assignment]
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Codings listed in Accept-Encoding, minus the ones refused with ``q=0``."""
+
+    accepted: set[str] = set()
+    for part in header.lower().split(","):
+        coding, _, params = part.partition(";")
+        coding, params = coding.strip(), params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if coding and quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def choose_encoding(header: str) -> str | None:
+    accepted = accepted_encodings(header)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=brotli_quality)
+            self._process, self._finish = compressor.process, compressor.finish
+        else:
+            # wbits=31 writes the gzip header and trailer.
+            compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._process, self._finish = compressor.compress, compressor.flush
+
+    def compress(self, data: bytes, *, final: bool) -> bytes:
+        chunk = self._process(data) if data else b""
+        return chunk + self._finish() if final else chunk
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, self.minimum_size, self.gzip_level, self.brotli_quality)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int, gzip_level: int, brotli_quality: int) -> None:
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.pending: list[bytes] = []
+        self.pending_size = 0
+        self.compressor: _Compressor | None = None
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Held back until the first body chunk decides whether the headers change.
+            self.initial_message = message
+            self.passthrough = "content-encoding" in Headers(raw=message["headers"])
+            return
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            if not self.passthrough:
+                self.pending.append(body)
+                self.pending_size += len(body)
+                if more_body and self.pending_size < self.minimum_size:
+                    return
+                body = b"".join(self.pending)
+                message = {**message, "body": body}
+                self.pending = []
+            self.started = True
+            if self.passthrough or len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(self.initial_message)
+                await self._send(message)
+                return
+            self.compressor = _Compressor(self.encoding, self.gzip_level, self.brotli_quality)
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            message["body"] = self.compressor.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            await self._send(self.initial_message)
+            await self._send(message)
+            return
+
+        if not self.passthrough and self.compressor is not None:
+            message["body"] = self.compressor.compress(body, final=not more_body)
+        await self._send(message)
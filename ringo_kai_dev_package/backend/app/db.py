@@ -0,0 +1,258 @@
+"""Thread pools for the blocking Supabase and OpenAI clients, so async endpoints never stall the loop.
+
+supabase-py and the OpenAI SDK are used through their synchronous clients. Every call from async
+code goes through :func:`execute` / :func:`run_blocking` (database) or :func:`run_openai` (model
+calls, which take seconds and get their own pool so they cannot starve database work).
+Health probes get a third, small pool (:func:`run_probe`): a probe that hangs past its timeout keeps
+its thread, and it must not keep one the API's own queries need.
+
+Calls run with a copy of the caller's context, so the per-request :class:`RequestScope` (database
+and outbound HTTP call counters, user row cache) is visible from the pool threads as well. Every
+call is also recorded in the process-wide :mod:`.metrics` registry, and every Supabase query in the
+:mod:`.query_trace` slow-query log.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterator, TypeVar
+
+from .metrics import registry
+from .query_trace import Step, tracer
+
+T = TypeVar("T")
+
+# 0 runs calls inline on the event loop (the old behaviour); only useful for comparisons.
+DB_THREADS = int(os.environ.get("DB_THREADS", "16"))
+OPENAI_THREADS = int(os.environ.get("OPENAI_THREADS", "8"))
+# Enough for one round of /health/ready + /health/deep probes; hung probes queue up here, not in the db pool.
+HEALTH_PROBE_THREADS = int(os.environ.get("HEALTH_PROBE_THREADS", "3"))
+
+
+class RequestScope:
+    """State shared by everything that runs on behalf of one HTTP request."""
+
+    __slots__ = ("db_calls", "db_ops", "http_calls", "user_rows", "_lock")
+
+    def __init__(self) -> None:
+        self.db_calls = 0
+        # (table, operation) / service -> [calls, seconds]
+        self.db_ops: dict[tuple[str, str], list[float]] = {}
+        self.http_calls: dict[str, list[float]] = {}
+        # user_id -> full users row (None when the row does not exist)
+        self.user_rows: dict[str, dict[str, Any] | None] = {}
+        self._lock = threading.Lock()
+
+    def record_db_call(self, table: str, operation: str, seconds: float) -> None:
+        with self._lock:
+            self.db_calls += 1
+            entry = self.db_ops.setdefault((table, operation), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def record_http_call(self, service: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.http_calls.setdefault(service, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+
+_request_scope: contextvars.ContextVar[RequestScope | None] = contextvars.ContextVar("request_scope", default=None)
+
+
+def begin_request_scope() -> tuple[RequestScope, contextvars.Token[RequestScope | None]]:
+    scope = RequestScope()
+    return scope, _request_scope.set(scope)
+
+
+def end_request_scope(token: contextvars.Token[RequestScope | None]) -> None:
+    _request_scope.reset(token)
+
+
+def current_request_scope() -> RequestScope | None:
+    return _request_scope.get()
+
+
+def record_db_call(table: str, operation: str, seconds: float) -> None:
+    registry.observe_db(table, operation, seconds)
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.record_db_call(table, operation, seconds)
+
+
+@contextmanager
+def track_http(service: str) -> Iterator[None]:
+    """Time an outbound HTTP call (``with track_http("amazon"): ...``), sync or async code alike."""
+
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe_http(service, seconds, error)
+        scope = _request_scope.get()
+        if scope is not None:
+            scope.record_http_call(service, seconds)
+
+
+_QUERY_OPERATIONS = frozenset({"select", "insert", "update", "upsert", "delete"})
+
+
+class _CountingQuery:
+    """Wraps a postgrest request builder; counts and traces its ``execute()`` calls by table and operation.
+
+    The builder calls made on the way (filters, order, range) are kept as ``steps`` for the trace.
+    """
+
+    __slots__ = ("_query", "_table", "_operation", "_steps")
+
+    def __init__(self, query: Any, table: str, operation: str = "select", steps: tuple[Step, ...] = ()) -> None:
+        self._query = query
+        self._table = table
+        self._operation = operation
+        self._steps = steps
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            # e.g. the ``not_`` property, which returns the (negated) builder itself
+            if hasattr(attr, "execute"):
+                return _CountingQuery(attr, self._table, self._operation, (*self._steps, (name, (), {})))
+            return attr
+        operation = name if name in _QUERY_OPERATIONS else self._operation
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return _CountingQuery(result, self._table, operation, (*self._steps, (name, args, kwargs)))
+            return result
+
+        return call
+
+    def execute(self) -> Any:
+        started = time.perf_counter()
+        response = None
+        error: BaseException | None = None
+        try:
+            response = self._query.execute()
+            return response
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            record_db_call(self._table, self._operation, seconds)
+            tracer.record(self._table, self._operation, self._steps, seconds, response, error)
+
+
+class CountingClient:
+    """Supabase client proxy whose table queries are counted per request; everything else passes through."""
+
+    def __init__(self, client: Any) -> None:
+        self._client = client
+
+    def table(self, name: str) -> _CountingQuery:
+        return _CountingQuery(self._client.table(name), name)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class _Pool:
+    def __init__(self, name: str, threads: int) -> None:
+        self.name = name
+        self.threads = threads
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    def configure(self, threads: int) -> None:
+        self.shutdown()
+        self.threads = threads
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=self.name)
+            return self._executor
+
+    def _track(self, delta: int) -> None:
+        with self._lock:
+            self._stats["in_flight"] += delta
+            if delta > 0:
+                self._stats["calls"] += 1
+                self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        call = partial(func, *args, **kwargs)
+        self._track(1)
+        try:
+            if self.threads <= 0:
+                return call()
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), context.run, call)
+        finally:
+            self._track(-1)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"threads": self.threads, **self._stats}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+db_pool = _Pool("db", DB_THREADS)
+openai_pool = _Pool("openai", OPENAI_THREADS)
+probe_pool = _Pool("health", HEALTH_PROBE_THREADS)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking helper (one or more Supabase queries) on the database pool."""
+
+    return await db_pool.run(func, *args, **kwargs)
+
+
+async def execute(query: Any) -> Any:
+    """``await execute(supabase.table(...).select(...))`` instead of calling ``.execute()`` inline."""
+
+    return await db_pool.run(query.execute)
+
+
+async def run_openai(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await openai_pool.run(func, *args, **kwargs)
+
+
+async def run_probe(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await probe_pool.run(func, *args, **kwargs)
+
+
+def configure(*, db_threads: int | None = None, openai_threads: int | None = None) -> None:
+    if db_threads is not None:
+        db_pool.configure(db_threads)
+    if openai_threads is not None:
+        openai_pool.configure(openai_threads)
+
+
+def stats() -> dict[str, dict[str, int]]:
+    return {"db": db_pool.stats(), "openai": openai_pool.stats(), "health": probe_pool.stats()}
+
+
+def shutdown() -> None:
+    db_pool.shutdown()
+    openai_pool.shutdown()
+    probe_pool.shutdown()
@@ -0,0 +1,529 @@
+"""In-memory stand-in for the part of the supabase-py client the backend uses.
+
+Covers ``table()`` with ``select/insert/upsert/update/delete``, the filters ``eq/neq/gt/gte/lt/lte/
+like/ilike/in_/is_/filter/or_`` (and ``not_``), ``order/range/limit/single/maybe_single``,
+``count="exact"``, and ``storage`` buckets with ``upload``/``get_public_url``. Behaviour follows
+PostgREST where the code depends on it: writes return the affected rows, ``single()`` raises when
+the result is not exactly one row, nulls sort last ascending and first descending.
+
+Run the API against it with ``SUPABASE_BACKEND=memory`` (optionally ``FAKE_SUPABASE_SEED=rows.json``
+and ``FAKE_SUPABASE_LATENCY_MS``), or build one directly::
+
+    app.main.supabase = CountingClient(FakeSupabase({"users": [...]}, latency=0.02))
+
+Every ``execute()`` blocks for ``latency`` seconds (or ``latency(table, operation)``), the way the
+sync client blocks on the network, so thread-pool and load behaviour stay realistic.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from postgrest.exceptions import APIError
+from storage3.utils import StorageException
+
+Latency = float | Callable[[str, str], float]
+Predicate = Callable[[dict[str, Any]], bool]
+
+# Tables whose primary key is a uuid string; everything else gets an integer sequence.
+UUID_ID_TABLES = frozenset({"users"})
+
+
+class FakeResponse:
+    __slots__ = ("data", "count")
+
+    def __init__(self, data: Any, count: int | None = None) -> None:
+        self.data = data
+        self.count = count
+
+
+def _timestamp(value: str) -> datetime | None:
+    if len(value) < 10 or value[4] != "-" or value[7] != "-":
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _coerce(left: Any, right: Any) -> tuple[Any, Any]:
+    if isinstance(left, bool) and isinstance(right, str):
+        return left, right.lower() == "true"
+    if isinstance(left, (int, float)) and isinstance(right, str):
+        try:
+            return left, float(right)
+        except ValueError:
+            return str(left), right
+    if isinstance(left, str) and isinstance(right, (int, float)) and not isinstance(right, bool):
+        try:
+            return float(left), right
+        except ValueError:
+            return left, str(right)
+    if isinstance(left, str) and isinstance(right, str):
+        left_ts, right_ts = _timestamp(left), _timestamp(right)
+        if left_ts and right_ts:
+            return left_ts, right_ts
+    return left, right
+
+
+def _compare(left: Any, right: Any) -> int | None:
+    """-1/0/1, or None when either side is NULL (SQL comparisons with NULL are never true)."""
+
+    if left is None or right is None:
+        return None
+    left, right = _coerce(left, right)
+    try:
+        return (left > right) - (left < right)
+    except TypeError:
+        return None
+
+
+def _like(value: Any, pattern: str, *, ignore_case: bool) -> bool:
+    if value is None:
+        return False
+    regex = "".join(".*" if ch in "%*" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+    return re.fullmatch(regex, str(value), re.IGNORECASE if ignore_case else 0) is not None
+
+
+def _is(value: Any, target: Any) -> bool:
+    if target is None or target == "null":
+        return value is None
+    if isinstance(target, str):
+        target = {"true": True, "false": False}.get(target.lower(), target)
+    return value is target
+
+
+def _condition(column: str, operator: str, value: Any) -> Predicate:
+    if operator == "eq":
+        return lambda row: _compare(row.get(column), value) == 0
+    if operator == "neq":
+        return lambda row: _compare(row.get(column), value) not in (0, None)
+    if operator in {"gt", "gte", "lt", "lte"}:
+        accepted = {"gt": (1,), "gte": (0, 1), "lt": (-1,), "lte": (-1, 0)}[operator]
+        return lambda row: _compare(row.get(column), value) in accepted
+    if operator in {"like", "ilike"}:
+        return lambda row: _like(row.get(column), str(value), ignore_case=operator == "ilike")
+    if operator == "is":
+        return lambda row: _is(row.get(column), value)
+    if operator == "in":
+        values = list(value) if not isinstance(value, str) else _split(value.strip("()"))
+        return lambda row: any(_compare(row.get(column), candidate) == 0 for candidate in values)
+    raise NotImplementedError(f"FakeSupabase does not support the {operator!r} operator")
+
+
+def _split(expression: str) -> list[str]:
+    """Split on top-level commas, leaving parentheses and double-quoted values intact."""
+
+    parts: list[str] = []
+    depth = 0
+    quoted = False
+    current = ""
+    for ch in expression:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    if current:
+        parts.append(current)
+    return [part.strip().strip('"') if part.strip().startswith('"') else part.strip() for part in parts]
+
+
+def _negated(predicate: Predicate) -> Predicate:
+    return lambda row: not predicate(row)
+
+
+def _operator_filter(column: str, operator: str, criteria: Any) -> Predicate:
+    """``filter("col", "not.is", "null")`` style filters, as in PostgREST query strings."""
+
+    negate = operator.startswith("not.")
+    if negate:
+        operator = operator[len("not.") :]
+    if isinstance(criteria, str) and len(criteria) >= 2 and criteria[0] == criteria[-1] == '"':
+        criteria = criteria[1:-1]
+    predicate = _condition(column, operator, criteria)
+    return _negated(predicate) if negate else predicate
+
+
+def _logic_tree(expression: str, *, any_of: bool) -> Predicate:
+    """``or_("a.is.null,and(b.eq.1,c.gt.2)")``: PostgREST logic trees."""
+
+    predicates: list[Predicate] = []
+    for part in _split(expression):
+        negate = part.startswith("not.")
+        if negate:
+            part = part[len("not.") :]
+        if part.startswith(("and(", "or(")) and part.endswith(")"):
+            inner = part[part.index("(") + 1 : -1]
+            predicate = _logic_tree(inner, any_of=part.startswith("or("))
+        else:
+            column, operator, criteria = part.split(".", 2)
+            if operator == "not":
+                operator, criteria = criteria.split(".", 1)
+                operator = f"not.{operator}"
+            predicate = _operator_filter(column, operator, criteria)
+        predicates.append(_negated(predicate) if negate else predicate)
+    if any_of:
+        return lambda row: any(predicate(row) for predicate in predicates)
+    return lambda row: all(predicate(row) for predicate in predicates)
+
+
+def _project(row: dict[str, Any], columns: list[str] | None) -> dict[str, Any]:
+    if columns is None:
+        return copy.deepcopy(row)
+    return {column: copy.deepcopy(row.get(column)) for column in columns}
+
+
+class FakeQuery:
+    """One ``supabase.table(name)`` request; builder methods return ``self`` like postgrest-py."""
+
+    def __init__(self, client: FakeSupabase, table: str) -> None:
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._columns: list[str] | None = None
+        self._payload: Any = None
+        self._on_conflict: list[str] = ["id"]
+        self._ignore_duplicates = False
+        self._count: str | None = None
+        self._filters: list[Predicate] = []
+        self._orders: list[tuple[str, bool, bool]] = []
+        self._offset = 0
+        self._limit: int | None = None
+        self._single: str | None = None
+        self._negate_next = False
+
+    # -- operations -------------------------------------------------------------------------
+
+    def select(self, *columns: str, count: str | None = None) -> FakeQuery:
+        names = [name.strip() for column in columns for name in column.split(",") if name.strip()]
+        self._columns = None if not names or "*" in names else names
+        self._count = count
+        return self
+
+    def insert(self, json: dict | list, *, count: str | None = None, upsert: bool = False, **_: Any) -> FakeQuery:
+        self._operation = "upsert" if upsert else "insert"
+        self._payload = json
+        self._count = count
+        return self
+
+    def upsert(
+        self, json: dict | list, *, count: str | None = None, ignore_duplicates: bool = False, on_conflict: str = "", **_: Any
+    ) -> FakeQuery:
+        self._operation = "upsert"
+        self._payload = json
+        self._count = count
+        self._ignore_duplicates = ignore_duplicates
+        if on_conflict:
+            self._on_conflict = [column.strip() for column in on_conflict.split(",")]
+        return self
+
+    def update(self, json: dict, *, count: str | None = None, **_: Any) -> FakeQuery:
+        self._operation = "update"
+        self._payload = json
+        self._count = count
+        return self
+
+    def delete(self, *, count: str | None = None, **_: Any) -> FakeQuery:
+        self._operation = "delete"
+        self._count = count
+        return self
+
+    # -- filters ----------------------------------------------------------------------------
+
+    def _add(self, predicate: Predicate) -> FakeQuery:
+        if self._negate_next:
+            predicate = _negated(predicate)
+            self._negate_next = False
+        self._filters.append(predicate)
+        return self
+
+    @property
+    def not_(self) -> FakeQuery:
+        self._negate_next = True
+        return self
+
+    def eq(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "eq", value))
+
+    def neq(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "neq", value))
+
+    def gt(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "gt", value))
+
+    def gte(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "gte", value))
+
+    def lt(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "lt", value))
+
+    def lte(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "lte", value))
+
+    def like(self, column: str, pattern: str) -> FakeQuery:
+        return self._add(_condition(column, "like", pattern))
+
+    def ilike(self, column: str, pattern: str) -> FakeQuery:
+        return self._add(_condition(column, "ilike", pattern))
+
+    def is_(self, column: str, value: Any) -> FakeQuery:
+        return self._add(_condition(column, "is", value))
+
+    def in_(self, column: str, values: Iterable[Any]) -> FakeQuery:
+        return self._add(_condition(column, "in", list(values)))
+
+    def filter(self, column: str, operator: str, criteria: Any) -> FakeQuery:
+        return self._add(_operator_filter(column, operator, criteria))
+
+    def or_(self, filters: str, reference_table: str | None = None) -> FakeQuery:
+        return self._add(_logic_tree(filters, any_of=True))
+
+    # -- shaping ----------------------------------------------------------------------------
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: bool = False, foreign_table: str | None = None) -> FakeQuery:
+        self._orders.append((column, desc, nullsfirst))
+        return self
+
+    def range(self, start: int, end: int, foreign_table: str | None = None) -> FakeQuery:
+        self._offset = start
+        self._limit = max(end - start + 1, 0)
+        return self
+
+    def limit(self, size: int, *, foreign_table: str | None = None) -> FakeQuery:
+        self._limit = size
+        return self
+
+    def single(self) -> FakeQuery:
+        self._single = "single"
+        return self
+
+    def maybe_single(self) -> FakeQuery:
+        self._single = "maybe_single"
+        return self
+
+    # -- execution --------------------------------------------------------------------------
+
+    def _matches(self, row: dict[str, Any]) -> bool:
+        return all(predicate(row) for predicate in self._filters)
+
+    def _sorted(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        for column, desc, nullsfirst in reversed(self._orders):
+            # Postgres defaults: NULLS LAST ascending, NULLS FIRST descending.
+            nulls_first = nullsfirst or desc
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: _SortKey(row.get(column)), reverse=desc)
+            rows = missing + present if nulls_first else present + missing
+        return rows
+
+    def execute(self) -> FakeResponse:
+        self._client.delay(self._table, self._operation)
+        with self._client._lock:
+            rows = self._client.tables.setdefault(self._table, [])
+            if self._operation == "select":
+                result = self._sorted([row for row in rows if self._matches(row)])
+                total = len(result)
+                end = None if self._limit is None else self._offset + self._limit
+                result = [_project(row, self._columns) for row in result[self._offset : end]]
+            elif self._operation in {"insert", "upsert"}:
+                result = self._write(rows)
+                total = len(result)
+            elif self._operation == "update":
+                result = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(copy.deepcopy(self._payload))
+                        result.append(copy.deepcopy(row))
+                total = len(result)
+            else:  # delete
+                kept = [row for row in rows if not self._matches(row)]
+                result = [copy.deepcopy(row) for row in rows if self._matches(row)]
+                rows[:] = kept
+                total = len(result)
+        count = total if self._count == "exact" else None
+        if self._single:
+            if len(result) == 1:
+                return FakeResponse(result[0], count)
+            if self._single == "maybe_single" and not result:
+                return FakeResponse(None, count)
+            raise APIError(
+                {
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "code": "PGRST116",
+                    "hint": None,
+                    "details": f"The result contains {len(result)} rows",
+                }
+            )
+        return FakeResponse(result, count)
+
+    def _write(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        written: list[dict[str, Any]] = []
+        for values in payload:
+            values = copy.deepcopy(values)
+            existing = None
+            if self._operation == "upsert" and all(column in values for column in self._on_conflict):
+                existing = next(
+                    (row for row in rows if all(_compare(row.get(column), values[column]) == 0 for column in self._on_conflict)),
+                    None,
+                )
+            if existing is not None:
+                if self._ignore_duplicates:
+                    continue
+                existing.update(values)
+                written.append(copy.deepcopy(existing))
+                continue
+            row = self._client._defaults(self._table, values)
+            rows.append(row)
+            written.append(copy.deepcopy(row))
+        return written
+
+
+class _SortKey:
+    """Orders mixed numbers / ISO timestamps / strings the way the column types would."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: _SortKey) -> bool:
+        return _compare(self.value, other.value) == -1
+
+
+class FakeBucket:
+    def __init__(self, storage: FakeStorage, name: str) -> None:
+        self._storage = storage
+        self.name = name
+
+    def upload(self, path: str, file: Any, file_options: dict[str, str] | None = None) -> dict[str, str]:
+        if hasattr(file, "read"):
+            data = file.read()
+        elif isinstance(file, (str, Path)):
+            data = Path(file).read_bytes()
+        else:
+            data = bytes(file)
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        self._storage._client.delay(f"storage:{self.name}", "upload")
+        with self._storage._lock:
+            objects = self._storage.objects.setdefault(self.name, {})
+            if path in objects and not upsert:
+                raise StorageException({"statusCode": 400, "error": "Duplicate", "message": "The resource already exists"})
+            objects[path] = {"data": data, "content_type": (file_options or {}).get("content-type")}
+        return {"Key": f"{self.name}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        with self._storage._lock:
+            entry = self._storage.objects.get(self.name, {}).get(path)
+        if entry is None:
+            raise StorageException({"statusCode": 404, "error": "not_found", "message": "Object not found"})
+        return entry["data"]
+
+    def remove(self, paths: list[str]) -> list[dict[str, str]]:
+        with self._storage._lock:
+            objects = self._storage.objects.get(self.name, {})
+            return [{"name": path} for path in paths if objects.pop(path, None) is not None]
+
+    def get_public_url(self, path: str) -> str:
+        return f"{self._storage._client.url}/storage/v1/object/public/{self.name}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, client: FakeSupabase) -> None:
+        self._client = client
+        self._lock = threading.Lock()
+        self.objects: dict[str, dict[str, dict[str, Any]]] = {}
+
+    def create_bucket(self, id: str, options: dict[str, Any] | None = None) -> dict[str, str]:
+        with self._lock:
+            if id in self.objects:
+                raise StorageException({"statusCode": 409, "error": "Duplicate", "message": "The resource already exists"})
+            self.objects[id] = {}
+        return {"name": id}
+
+    def get_bucket(self, id: str) -> dict[str, str]:
+        with self._lock:
+            if id not in self.objects:
+                raise StorageException({"statusCode": 404, "error": "Bucket not found", "message": "Bucket not found"})
+        return {"id": id, "name": id}
+
+    def from_(self, id: str) -> FakeBucket:
+        return FakeBucket(self, id)
+
+
+class FakeSupabase:
+    """Tables are plain lists of dict rows in ``self.tables``; tests may read or seed them directly."""
+
+    def __init__(
+        self,
+        tables: dict[str, Iterable[dict[str, Any]]] | None = None,
+        *,
+        latency: Latency = 0.0,
+        url: str = "http://fake-supabase.local",
+    ) -> None:
+        self.url = url
+        self.latency = latency
+        self.tables: dict[str, list[dict[str, Any]]] = {}
+        self.storage = FakeStorage(self)
+        self._lock = threading.RLock()
+        self._sequences: dict[str, int] = {}
+        for table, rows in (tables or {}).items():
+            self.seed(table, rows)
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs: Any) -> FakeSupabase:
+        """Seed from a JSON file shaped ``{"table": [row, ...], ...}``."""
+
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")), **kwargs)
+
+    def table(self, table_name: str) -> FakeQuery:
+        return FakeQuery(self, table_name)
+
+    from_ = table
+
+    def seed(self, table: str, rows: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        with self._lock:
+            target = self.tables.setdefault(table, [])
+            seeded = [self._defaults(table, copy.deepcopy(row)) for row in rows]
+            target.extend(seeded)
+        return seeded
+
+    def rows(self, table: str) -> list[dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.tables.get(table, []))
+
+    def delay(self, table: str, operation: str) -> None:
+        seconds = self.latency(table, operation) if callable(self.latency) else self.latency
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _defaults(self, table: str, row: dict[str, Any]) -> dict[str, Any]:
+        if row.get("id") is None:
+            if table in UUID_ID_TABLES:
+                row["id"] = str(uuid.uuid4())
+            else:
+                row["id"] = self._next_id(table)
+        elif isinstance(row["id"], int):
+            self._sequences[table] = max(self._sequences.get(table, 0), row["id"])
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        return row
+
+    def _next_id(self, table: str) -> int:
+        self._sequences[table] = self._sequences.get(table, 0) + 1
+        return self._sequences[table]
@@ -0,0 +1,119 @@
+"""Dependency probes behind /health/ready and /health/deep.
+
+Every probe runs under HEALTH_PROBE_TIMEOUT_SECONDS and reports ``{"ok", "latency_ms"}`` (plus
+``"error"`` when it failed). Blocking probes run on the small health thread pool, not the database
+one: the timeout stops waiting but cannot stop the thread, so a hung dependency ties up probe
+threads only. Results are cached for HEALTH_CACHE_SECONDS, and concurrent callers
+share one round of probes, so load balancers and monitors polling the endpoints cannot turn into
+load on Supabase or the outbound hosts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlparse
+
+import httpx
+
+from .clients import pg_hot_paths, supabase
+from .db import run_probe
+
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_PROBE_TIMEOUT_SECONDS", "2"))
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", "5"))
+# Hosts /health/deep?outbound=true sends a HEAD to; any HTTP answer (even 401/404) counts as reachable.
+HEALTH_OUTBOUND_URLS = [
+    url.strip()
+    for url in os.environ.get(
+        "HEALTH_OUTBOUND_URLS",
+        "https://api.openai.com/v1/models,https://api.resend.com/emails,https://www.amazon.co.jp/",
+    ).split(",")
+    if url.strip()
+]
+
+Probe = Callable[[], Awaitable[Any]]
+
+
+class HealthCache:
+    """Probe results per key for ``ttl_seconds``; a miss is computed once even when callers pile up."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _fresh(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        return None
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        cached = self._fresh(key)
+        if cached is not None:
+            return cached
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._fresh(key)
+            if cached is not None:
+                return cached
+            result = await compute()
+            self._entries[key] = (time.monotonic(), result)
+            return result
+
+
+async def timed_probe(probe: Probe) -> dict[str, Any]:
+    """Run one probe under the timeout; a dict it returns is merged into the result."""
+
+    started = time.perf_counter()
+    result: dict[str, Any] = {"ok": True}
+    try:
+        details = await asyncio.wait_for(probe(), timeout=HEALTH_PROBE_TIMEOUT_SECONDS)
+        if isinstance(details, dict):
+            result.update(details)
+    except asyncio.TimeoutError:
+        result = {"ok": False, "error": f"timed out after {HEALTH_PROBE_TIMEOUT_SECONDS:g}s"}
+    except Exception as exc:
+        result = {"ok": False, "error": str(exc)[:200] or exc.__class__.__name__}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def run_probes(probes: dict[str, Probe]) -> dict[str, Any]:
+    results = await asyncio.gather(*(timed_probe(probe) for probe in probes.values()))
+    return {
+        "checked_at": datetime.now(timezone.utc).isoformat(),
+        "checks": dict(zip(probes, results)),
+    }
+
+
+def ping_supabase() -> None:
+    supabase.table("users").select("id").limit(1).execute()
+
+
+def ping_storage(bucket: str) -> None:
+    supabase.storage.get_bucket(bucket)
+
+
+async def ping_url(url: str) -> dict[str, Any]:
+    async with httpx.AsyncClient(timeout=HEALTH_PROBE_TIMEOUT_SECONDS) as client:
+        response = await client.head(url)
+    return {"status_code": response.status_code}
+
+
+def dependency_probes(bucket: str, *, deep: bool, outbound: bool = False) -> dict[str, Probe]:
+    """Supabase (and Postgres when it serves the hot paths) always; storage and outbound hosts when ``deep``."""
+
+    probes: dict[str, Probe] = {"supabase": partial(run_probe, ping_supabase)}
+    if pg_hot_paths:
+        probes["postgres"] = partial(run_probe, pg_hot_paths.ping, HEALTH_PROBE_TIMEOUT_SECONDS)
+    if deep:
+        probes["storage"] = partial(run_probe, ping_storage, bucket)
+        if outbound:
+            for url in HEALTH_OUTBOUND_URLS:
+                probes[f"outbound:{urlparse(url).netloc}"] = partial(ping_url, url)
+    return probes
@@ -0,0 +1,185 @@
+"""Per-host adaptive rate limiting and circuit breaking for outbound scraping."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable
+
+
+class HostThrottled(Exception):
+    """Raised when a host is cooling down or its rate limit would require waiting too long."""
+
+    def __init__(self, host: str, retry_after: float, reason: str) -> None:
+        super().__init__(f"{host} {reason} (retry after {retry_after:.0f}s)")
+        self.host = host
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _HostState:
+    __slots__ = (
+        "rate",
+        "tokens",
+        "updated_at",
+        "state",
+        "consecutive_blocks",
+        "cooldown",
+        "open_until",
+        "probe_in_flight",
+        "total_requests",
+        "total_blocks",
+        "times_opened",
+    )
+
+    def __init__(self, rate: float, tokens: float, now: float, cooldown: float) -> None:
+        self.rate = rate
+        self.tokens = tokens
+        self.updated_at = now
+        self.state = "closed"
+        self.consecutive_blocks = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.total_requests = 0
+        self.total_blocks = 0
+        self.times_opened = 0
+
+
+class HostThrottle:
+    """Token bucket per host whose refill rate adapts AIMD-style, plus a circuit breaker.
+
+    Blocks (robot checks, 429/503) cut the rate multiplicatively and successes raise it additively.
+    After ``breaker_threshold`` consecutive blocks the host is opened for a cooldown that doubles on
+    every re-trip, then a single half-open probe decides whether to close it again.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_rate: float = 2.0,
+        min_rate: float = 0.05,
+        burst: float = 4.0,
+        increase_step: float = 0.1,
+        decrease_factor: float = 0.5,
+        max_wait_seconds: float = 5.0,
+        breaker_threshold: int = 3,
+        cooldown_seconds: float = 60.0,
+        max_cooldown_seconds: float = 900.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_wait_seconds = max_wait_seconds
+        self.breaker_threshold = breaker_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._clock = clock
+        self._hosts: dict[str, _HostState] = {}
+
+    def _get(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(self.max_rate, self.burst, self._clock(), self.cooldown_seconds)
+            self._hosts[host] = state
+        return state
+
+    def _refill(self, state: _HostState, now: float) -> None:
+        elapsed = max(now - state.updated_at, 0.0)
+        state.tokens = min(self.burst, state.tokens + elapsed * state.rate)
+        state.updated_at = now
+
+    def cooldown_remaining(self, host: str) -> float:
+        """Seconds until ``host`` accepts traffic again; 0 when it is closed or ready for a probe."""
+
+        state = self._hosts.get(host)
+        if state is None or state.state == "closed":
+            return 0.0
+        if state.state == "half_open":
+            return self.cooldown_seconds if state.probe_in_flight else 0.0
+        return max(state.open_until - self._clock(), 0.0)
+
+    async def acquire(self, host: str) -> None:
+        state = self._get(host)
+        now = self._clock()
+
+        if state.state == "open":
+            if now < state.open_until:
+                raise HostThrottled(host, state.open_until - now, "is cooling down")
+            state.state = "half_open"
+            state.probe_in_flight = False
+        if state.state == "half_open":
+            if state.probe_in_flight:
+                raise HostThrottled(host, state.cooldown, "is being probed")
+            state.probe_in_flight = True
+
+        self._refill(state, now)
+        wait = 0.0 if state.tokens >= 1 else (1 - state.tokens) / state.rate
+        if wait > self.max_wait_seconds:
+            if state.state == "half_open":
+                state.probe_in_flight = False
+            raise HostThrottled(host, wait, "is rate limited")
+        # Reserve the token now (possibly going negative) so concurrent callers queue behind us.
+        state.tokens -= 1
+        state.total_requests += 1
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while queued (e.g. a losing race variant): give the slot back, probe included.
+                state.tokens += 1
+                self.release(host)
+                raise
+
+    def record_success(self, host: str) -> None:
+        state = self._get(host)
+        state.consecutive_blocks = 0
+        state.rate = min(self.max_rate, state.rate + self.increase_step)
+        if state.state != "closed":
+            state.state = "closed"
+            state.probe_in_flight = False
+            state.cooldown = self.cooldown_seconds
+
+    def record_block(self, host: str) -> None:
+        state = self._get(host)
+        state.total_blocks += 1
+        state.consecutive_blocks += 1
+        state.rate = max(self.min_rate, state.rate * self.decrease_factor)
+        if state.state == "half_open":
+            state.cooldown = min(state.cooldown * 2, self.max_cooldown_seconds)
+            self._open(state)
+        elif state.state == "closed" and state.consecutive_blocks >= self.breaker_threshold:
+            self._open(state)
+
+    def release(self, host: str) -> None:
+        """Forget an in-flight half-open probe that ended without a verdict (network error, cancellation)."""
+
+        state = self._hosts.get(host)
+        if state is not None and state.state == "half_open":
+            state.probe_in_flight = False
+
+    def _open(self, state: _HostState) -> None:
+        state.state = "open"
+        state.open_until = self._clock() + state.cooldown
+        state.probe_in_flight = False
+        state.times_opened += 1
+
+    def snapshot(self) -> dict[str, dict[str, object]]:
+        now = self._clock()
+        hosts: dict[str, dict[str, object]] = {}
+        for host, state in self._hosts.items():
+            self._refill(state, now)
+            hosts[host] = {
+                "state": state.state,
+                "rate_per_second": round(state.rate, 4),
+                "tokens": round(state.tokens, 3),
+                "consecutive_blocks": state.consecutive_blocks,
+                "cooldown_remaining_seconds": round(self.cooldown_remaining(host), 1),
+                "total_requests": state.total_requests,
+                "total_blocks": state.total_blocks,
+                "times_opened": state.times_opened,
+            }
+        return hosts
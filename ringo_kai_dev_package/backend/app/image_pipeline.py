@@ -0,0 +1,222 @@
+"""Screenshot normalization (orientation, EXIF stripping, downscaling, re-encoding, thumbnails) and hashing."""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Phone screenshots of order pages stay legible at this long edge while typically shrinking 3-8MB PNGs
+# to a few hundred KB.
+MAX_DIMENSION = int(os.environ.get("SCREENSHOT_MAX_DIMENSION", "2048"))
+THUMBNAIL_DIMENSION = int(os.environ.get("SCREENSHOT_THUMBNAIL_DIMENSION", "320"))
+OUTPUT_FORMAT = os.environ.get("SCREENSHOT_OUTPUT_FORMAT", "webp").lower()
+OUTPUT_QUALITY = int(os.environ.get("SCREENSHOT_OUTPUT_QUALITY", "85"))
+THUMBNAIL_QUALITY = 70
+PROCESS_WORKERS = int(os.environ.get("IMAGE_PROCESS_WORKERS", "2"))
+# Refuse decompression bombs well before Pillow's own (much larger) default.
+MAX_SOURCE_PIXELS = 40_000_000
+# Difference-hash grid. Order screenshots share one layout, so a coarse hash (e.g. 8x8) puts different
+# receipts only a few bits apart; a tall 32x64 grid follows the individual text rows.
+PHASH_COLUMNS = 32
+PHASH_ROWS = 64
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+
+class ImageRejected(ValueError):
+    """The upload is not an image Pillow can safely decode."""
+
+
+def _encode(image: Image.Image, path: str, fmt: str, quality: int) -> None:
+    pil_format = FORMATS[fmt][0]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif pil_format == "WEBP" and image.mode not in {"RGB", "RGBA"}:
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    # No exif=/icc_profile= arguments, so the encoded file carries no metadata.
+    options = {"quality": quality}
+    if pil_format == "JPEG":
+        options.update({"optimize": True, "progressive": True})
+    else:
+        options["method"] = 4
+    image.save(path, pil_format, **options)
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """2048-bit difference hash as hex; compare with :func:`hamming_distance`."""
+
+    gray = image.convert("L").resize((PHASH_COLUMNS + 1, PHASH_ROWS), Image.Resampling.LANCZOS)
+    pixels = gray.tobytes()
+    bits = 0
+    for row in range(PHASH_ROWS):
+        offset = row * (PHASH_COLUMNS + 1)
+        for column in range(PHASH_COLUMNS):
+            bits = (bits << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return f"{bits:0{PHASH_COLUMNS * PHASH_ROWS // 4}x}"
+
+
+def hamming_distance(left: str, right: str) -> int:
+    return (int(left, 16) ^ int(right, 16)).bit_count()
+
+
+def hash_detail_bits(phash: str) -> int:
+    """How far a hash is from the all-0/all-1 hash of a flat or smoothly shaded image.
+
+    A blank screenshot hashes to (nearly) all zeros, so any two of them are "identical"; hashes with
+    few detail bits say nothing about which receipt is on screen.
+    """
+
+    ones = int(phash, 16).bit_count()
+    return min(ones, len(phash) * 4 - ones)
+
+
+def _open_image(source_path: str) -> Image.Image:
+    try:
+        with Image.open(source_path) as opened:
+            if opened.width * opened.height > MAX_SOURCE_PIXELS:
+                raise ImageRejected(f"image is too large ({opened.width}x{opened.height})")
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        raise ImageRejected(str(exc)) from exc
+    return image
+
+
+def fingerprint_image_file(source_path: str) -> str:
+    return perceptual_hash(_open_image(source_path))
+
+
+def normalize_image_file(source_path: str, fmt: str = OUTPUT_FORMAT) -> dict[str, object]:
+    """Write ``<source>.normalized<ext>`` and ``<source>.thumb<ext>`` next to ``source_path``.
+
+    Runs in a worker process, so it only takes and returns plain, picklable values.
+    """
+
+    if fmt not in FORMATS:
+        fmt = "webp"
+    _, content_type, ext = FORMATS[fmt]
+    original_bytes = os.path.getsize(source_path)
+    image = _open_image(source_path)
+    phash = perceptual_hash(image)
+
+    original_size = image.size
+    if max(image.size) > MAX_DIMENSION:
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
+    normalized_path = f"{source_path}.normalized{ext}"
+    _encode(image, normalized_path, fmt, OUTPUT_QUALITY)
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_DIMENSION, THUMBNAIL_DIMENSION), Image.Resampling.LANCZOS)
+    thumbnail_path = f"{source_path}.thumb{ext}"
+    _encode(thumbnail, thumbnail_path, fmt, THUMBNAIL_QUALITY)
+
+    return {
+        "path": normalized_path,
+        "thumbnail_path": thumbnail_path,
+        "content_type": content_type,
+        "extension": ext,
+        "original_bytes": original_bytes,
+        "stored_bytes": os.path.getsize(normalized_path),
+        "thumbnail_bytes": os.path.getsize(thumbnail_path),
+        "original_size": list(original_size),
+        "stored_size": list(image.size),
+        "phash": phash,
+    }
+
+
+class ImagePipeline:
+    """Runs :func:`normalize_image_file` in a lazily started process pool and tracks byte savings.
+
+    Workers are spawned rather than forked: the API process runs thread pools, and a forked child
+    can inherit a lock some other thread held. A pool broken by a dying worker (OOM kill, segfault
+    in a codec) is replaced, and the call retried once; an image that breaks the fresh pool too is
+    rejected.
+    """
+
+    def __init__(self, *, max_workers: int = PROCESS_WORKERS, fmt: str = OUTPUT_FORMAT) -> None:
+        self.max_workers = max(max_workers, 1)
+        self.fmt = fmt
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "processed": 0,
+            "rejected": 0,
+            "original_bytes": 0,
+            "stored_bytes": 0,
+            "thumbnail_bytes": 0,
+            "pool_restarts": 0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _discard_broken(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Concurrent callers see the same broken pool; only the first one replaces it.
+            if self._executor is executor:
+                self._executor = None
+                self._stats["pool_restarts"] += 1
+                print("[ImagePipeline] A worker process died; starting a new pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                self._discard_broken(executor)
+        raise ImageRejected("image processing crashed the worker process")
+
+    async def normalize(self, source_path: str) -> dict[str, object]:
+        try:
+            result = await self._run(normalize_image_file, source_path, self.fmt)
+        except ImageRejected:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        with self._lock:
+            self._stats["processed"] += 1
+            for key in ("original_bytes", "stored_bytes", "thumbnail_bytes"):
+                self._stats[key] += int(result[key])
+        saved = int(result["original_bytes"]) - int(result["stored_bytes"])
+        print(
+            f"[ImagePipeline] {result['original_size']} -> {result['stored_size']}, "
+            f"{result['original_bytes']} -> {result['stored_bytes']} bytes (saved {saved})"
+        )
+        return result
+
+    async def fingerprint(self, source_path: str) -> str:
+        """Perceptual hash only, for uploads stored without normalization."""
+
+        return await self._run(fingerprint_image_file, source_path)
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            stats: dict[str, object] = dict(self._stats)
+        original = int(stats["original_bytes"])
+        stats["bytes_saved"] = original - int(stats["stored_bytes"])
+        stats["savings_ratio"] = round(1 - int(stats["stored_bytes"]) / original, 3) if original else 0.0
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
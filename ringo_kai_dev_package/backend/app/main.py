@@ -2,37 +2,77 @@
 
 from __future__ import annotations
 
-import json
-import math
+import asyncio
+import hashlib
 import os
 import random
 import string
+import tempfile
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from html import escape
 from pathlib import Path
 import re
-from typing import Annotated, Any, Dict, Literal, Tuple
-from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from typing import Annotated, Any, Callable, Dict, Literal, Tuple
 
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, UploadFile, status
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Request, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 import httpx
-from openai import OpenAI
 from pydantic import BaseModel, ConfigDict, Field
-from supabase import Client, create_client
 
-load_dotenv()
+from . import db
+from .chatbot import generate_chatbot_reply
+from .clients import DATA_BACKEND, openai_client, pg_hot_paths, supabase, warm_up as warm_up_clients
+from .compression import CompressionMiddleware
+from .db import (
+    begin_request_scope,
+    current_request_scope,
+    end_request_scope,
+    execute,
+    run_blocking,
+    run_openai,
+    track_http,
+)
+from .health import HEALTH_CACHE_SECONDS, HealthCache, dependency_probes, run_probes
+from .image_pipeline import ImagePipeline, ImageRejected
+from .metrics import registry as request_metrics, server_timing
+from .query_trace import tracer as query_tracer
+from .rtp import (
+    APPLE_REWARDS,
+    MIN_DYNAMIC_USERS,
+    REFERRAL_THRESHOLDS,
+    adjust_probabilities_by_rtp,
+    apply_completion_adjustment,
+    apply_last_silver_gold_adjustment,
+    build_thresholds,
+    calculate_predictive_rtp,
+    get_bootstrap_probabilities,
+    get_next_referral_threshold,
+    get_referral_probabilities,
+    normalize_probabilities,
+    should_use_bootstrap_probabilities,
+)
+from .timeutil import parse_timestamp, utc_now
+from .verification import cached_screenshot_verdict, verify_purchase_screenshot
+from .verification_queue import QueueFull, VerificationQueue
+from .wishlist_fetch import (
+    WishlistNotFound,
+    amazon_throttle,
+    close_http_client,
+    evaluate_wishlist_summary,
+    fetch_wishlist_snapshot,
+    fetch_wishlist_summary,
+    normalize_wishlist_url,
+    open_http_client,
+    wishlist_cache,
+)
+from .wishlist_items import release_wishlist_assignment, upsert_wishlist_item, upsert_wishlist_items, wishlist_item_row
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY")
 RESEND_FROM_EMAIL = os.environ.get("RESEND_FROM_EMAIL", "Ringo Kai <no-reply@ringo-kai.local>")
-BOOTSTRAP_DAYS = int(os.environ.get("BOOTSTRAP_DAYS", "30"))
-MIN_DYNAMIC_USERS = int(os.environ.get("MIN_DYNAMIC_USERS", "100"))
-RTP_VARIANCE_THRESHOLD = float(os.environ.get("RTP_VARIANCE_THRESHOLD", "0.2"))
 
 
 def _parse_launch_date(value: str | None) -> datetime:
@@ -52,14 +92,15 @@ def _parse_launch_date(value: str | None) -> datetime:
 
 LAUNCH_DATE = _parse_launch_date(os.environ.get("LAUNCH_DATE"))
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    raise RuntimeError("Supabase credentials are not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY.")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 SCREENSHOT_BUCKET = os.environ.get("SCREENSHOT_BUCKET", "purchase-screenshots")
 MAX_SCREENSHOT_SIZE = 10 * 1024 * 1024  # 10MB
+SCREENSHOT_CHUNK_SIZE = 256 * 1024
+# Multipart boundaries, part headers and the purchase_id field sent alongside the file.
+SCREENSHOT_UPLOAD_OVERHEAD = 64 * 1024
 ALLOWED_MIMES = {"image/png", "image/jpeg"}
+# Re-encode screenshots (EXIF stripped, downscaled, WebP/JPEG) and store a thumbnail for admin views.
+SCREENSHOT_NORMALIZE = os.environ.get("SCREENSHOT_NORMALIZE", "true").lower() in {"1", "true", "yes"}
+IMAGE_SIGNATURES = {"image/png": b"\x89PNG\r\n\x1a\n", "image/jpeg": b"\xff\xd8\xff"}
 _bucket_ready = False
 ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
 
@@ -72,55 +113,101 @@ MOCK_WISHLIST_TITLE = os.environ.get("MOCK_WISHLIST_TITLE", "テスト用：欲
 MOCK_WISHLIST_PRICE = int(os.environ.get("MOCK_WISHLIST_PRICE", "3590"))
 MOCK_TARGET_USER_ID = os.environ.get("MOCK_TARGET_USER_ID", "00000000-0000-0000-0000-000000000001")
 
-WISHLIST_ALLOWED_HOSTS = {
-    "amazon.co.jp",
-    "www.amazon.co.jp",
-    "amazon.com",
-    "www.amazon.com",
-    "amazon.jp",
-    "www.amazon.jp",
-}
-WISHLIST_PATH_KEYWORDS = ("wishlist", "registry", "hz/wishlist", "gp/registry")
-TITLE_PATTERN = re.compile(r"<title>(.*?)</title>", re.IGNORECASE | re.DOTALL)
-PRICE_PATTERN = re.compile(r"[¥￥]\s?([0-9][0-9,]{2,})")
-WISHLIST_ASIN_PATTERN = re.compile(r"href=\"/dp/([A-Z0-9]{10})(?:/|\?)", re.IGNORECASE)
-WISHLIST_ASIN_TITLE_PATTERN = re.compile(
-    r"href=\"/dp/([A-Z0-9]{10})(?:/|\?)[^\"]*\"[^>]*title=\"([^\"]+)\"",
-    re.IGNORECASE,
-)
-WISHLIST_ITEM_PRICE_PATTERN = re.compile(
-    r"id=\"itemPrice_[^\"]+\"[\s\S]{0,1200}?<span class=\"a-offscreen\">[¥￥]\s*([0-9][0-9,]{2,})",
-    re.IGNORECASE,
-)
-WISHLIST_MOBILE_PRICE_PATTERN = re.compile(
-    r"data-cy=\"price-recipe\"[\s\S]{0,1200}?<span class=\"a-offscreen\">[¥￥]\s*([0-9][0-9,]{2,})",
-    re.IGNORECASE,
-)
-DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
-AMAZON_DESKTOP_HEADERS = {
-    "User-Agent": DEFAULT_USER_AGENT,
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
-    "Cache-Control": "no-cache",
-    "Pragma": "no-cache",
-    "Upgrade-Insecure-Requests": "1",
-}
-AMAZON_MOBILE_HEADERS = {
-    "User-Agent": MOBILE_USER_AGENT,
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
-    "Cache-Control": "no-cache",
-    "Pragma": "no-cache",
-}
-REFERRAL_THRESHOLDS = [3, 5, 10, 20, 30]
+WISHLIST_REVALIDATE_AFTER_SECONDS = float(os.environ.get("WISHLIST_REVALIDATE_AFTER_SECONDS", str(24 * 60 * 60)))
+WISHLIST_REVALIDATE_BATCH_SIZE = int(os.environ.get("WISHLIST_REVALIDATE_BATCH_SIZE", "100"))
+WISHLIST_REVALIDATE_CONCURRENCY = int(os.environ.get("WISHLIST_REVALIDATE_CONCURRENCY", "3"))
+# A list that cannot be fetched or read on this many runs in a row (private lists behind a sign-in page,
+# pages that never parse, hosts stuck on robot checks) is taken out of assignment as "fetch_failed".
+WISHLIST_REVALIDATE_MAX_FAILURES = int(os.environ.get("WISHLIST_REVALIDATE_MAX_FAILURES", "3"))
+# Screenshot verification runs in background workers; each one holds one OpenAI call at a time.
+VERIFICATION_WORKERS = int(os.environ.get("VERIFICATION_WORKERS", "2"))
+VERIFICATION_MAX_PENDING = int(os.environ.get("VERIFICATION_MAX_PENDING", "200"))
+# Jobs only live in memory, so submitted purchases still without a verdict are queued again at startup
+# and then every this many seconds.
+VERIFICATION_SWEEP_INTERVAL_SECONDS = float(os.environ.get("VERIFICATION_SWEEP_INTERVAL_SECONDS", "300"))
+# Younger submissions may still be queued in another process (e.g. during a deploy); the sweep leaves them.
+VERIFICATION_SWEEP_MIN_AGE_SECONDS = float(os.environ.get("VERIFICATION_SWEEP_MIN_AGE_SECONDS", "300"))
+# Optional shared secret for the scheduled /api/batch/* calls (sent as X-Cron-Token by the workflows).
+CRON_TOKEN = os.environ.get("CRON_TOKEN")
+# Optional bearer token for the Prometheus scrape of /metrics; open when unset, like the batch endpoints.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# Responses at least this large are compressed (brotli when installed and accepted, else gzip).
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
 REFERRAL_CODE_ALPHABET = "".join(ch for ch in string.ascii_uppercase if ch not in {"I", "O"}) + "23456789"
 REFERRAL_CODE_LENGTH = 8
 ACTIVE_STATUS_FOR_METRICS = ("ready_to_draw", "active")
 RTP_CACHE_TTL_SECONDS = 300
 _rtp_cache: dict[str, float | datetime] | None = None
+# Total / this month's new user counts behind every probability view; cached for RTP_CACHE_TTL_SECONDS.
+_global_context_cache: dict[str, int | datetime] | None = None
+# /health answers 503 until the startup warm-up (bucket, caches, pools) finishes or this many seconds pass.
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "20"))
+_warmed_up = False
+health_cache = HealthCache(HEALTH_CACHE_SECONDS)
+image_pipeline = ImagePipeline()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global _warmed_up
+    # Clients are built on first use; building them here keeps that cost off the first request.
+    await run_blocking(warm_up_clients)
+    if pg_hot_paths:
+        await run_blocking(pg_hot_paths.open)
+    open_http_client()
+    verification_queue.start()
+    _warmed_up = False
+    warm_up = asyncio.create_task(warm_up_caches())
+    sweep = asyncio.create_task(sweep_unverified_purchases())
+    yield
+    warm_up.cancel()
+    sweep.cancel()
+    await verification_queue.stop()
+    await close_http_client()
+    await run_blocking(wishlist_cache.flush)
+    image_pipeline.shutdown()
+    db.shutdown()
+    if pg_hot_paths:
+        pg_hot_paths.close()
+
+
+async def warm_up_caches() -> None:
+    """Do the work the first requests after a deploy would otherwise pay for, then report ready.
+
+    Each step is best effort: a failure is logged and the request that needs it simply does the
+    work itself. The whole phase is capped at WARMUP_TIMEOUT_SECONDS so a slow dependency cannot
+    keep the worker out of rotation.
+    """
 
-api = FastAPI(title="Ringo Kai API", version="0.2.0")
+    global _warmed_up
+    steps: list[tuple[str, Callable[[], object]]] = [
+        ("storage bucket", ensure_bucket),
+        ("rtp cache", get_cached_rtp),
+        ("global context cache", get_cached_global_context),
+    ]
+    if pg_hot_paths:
+        steps.insert(0, ("postgres pool", lambda: pg_hot_paths.wait(WARMUP_TIMEOUT_SECONDS)))
+
+    async def run_steps() -> None:
+        for label, step in steps:
+            step_started = time.perf_counter()
+            try:
+                await run_blocking(step)
+            except Exception as exc:  # pragma: no cover - logged and retried by the first request
+                print(f"[Warmup] {label} failed: {exc}")
+                continue
+            print(f"[Warmup] {label} ready in {(time.perf_counter() - step_started) * 1000:.0f}ms")
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(run_steps(), timeout=WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"[Warmup] Timed out after {WARMUP_TIMEOUT_SECONDS:g}s; marking ready with cold caches")
+    _warmed_up = True
+    print(f"[Warmup] Ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+api = FastAPI(title="Ringo Kai API", version="0.2.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 app = api
 
 _frontend_origins_raw = os.environ.get("FRONTEND_ORIGINS")
@@ -131,6 +218,42 @@ for origin in ("http://localhost:3000", "https://ringokai.app", "https://www.rin
     if origin not in frontend_origins:
         frontend_origins.append(origin)
 
+@api.middleware("http")
+async def request_scope(request: Request, call_next):
+    """Per-request user row cache and call counters, reported as X-DB-Calls / Server-Timing and to /metrics."""
+
+    scope, token = begin_request_scope()
+    request.state.scope = scope
+    started = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        end_request_scope(token)
+        elapsed = time.perf_counter() - started
+        # The route template, filled in by the router; unmatched paths share one label.
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_metrics.observe_request(request.method, route, status_code, elapsed, scope.db_calls)
+    response.headers["X-DB-Calls"] = str(scope.db_calls)
+    response.headers["Server-Timing"] = server_timing(elapsed, scope.db_ops, scope.http_calls)
+    return response
+
+
+@api.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse screenshot uploads by Content-Length before the multipart body is read at all."""
+
+    if request.url.path == "/api/purchase/upload":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_SCREENSHOT_SIZE + SCREENSHOT_UPLOAD_OVERHEAD:
+            return JSONResponse(
+                {"detail": "ファイルサイズは10MB以下にしてください。"},
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+    return await call_next(request)
+
+
 api.add_middleware(
     CORSMiddleware,
     allow_origins=frontend_origins,
@@ -138,35 +261,105 @@ api.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+api.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES)
 
 
 @api.get("/health", tags=["system"])
-async def health_check() -> dict[str, str]:
-    """Simple readiness probe so we can wire FastAPI quickly."""
+async def health_check() -> JSONResponse:
+    """Readiness probe: 503 until the startup warm-up has finished, so only warm workers get traffic."""
 
-    return {"status": "ok"}
+    if not _warmed_up:
+        return JSONResponse({"status": "starting"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return JSONResponse({"status": "ok"})
+
+
+def _cache_age_seconds(entry: dict[str, Any] | None, now: datetime) -> float | None:
+    cached_at = entry.get("timestamp") if entry else None
+    return round((now - cached_at).total_seconds(), 1) if isinstance(cached_at, datetime) else None
+
+
+def cache_warm_state() -> dict[str, object]:
+    now = utc_now()
+    return {
+        "warmed_up": _warmed_up,
+        "storage_bucket_checked": _bucket_ready,
+        "rtp_cache_age_seconds": _cache_age_seconds(_rtp_cache, now),
+        "global_context_cache_age_seconds": _cache_age_seconds(_global_context_cache, now),
+        "cache_ttl_seconds": RTP_CACHE_TTL_SECONDS,
+        "wishlist_cache": wishlist_cache.stats(),
+    }
+
+
+@api.get("/health/ready", tags=["system"])
+async def health_ready() -> JSONResponse:
+    """Readiness with a live database round trip: 503 while warming up or when Supabase (or Postgres) does not answer."""
+
+    report = await health_cache.get("ready", lambda: run_probes(dependency_probes(SCREENSHOT_BUCKET, deep=False)))
+    ready = _warmed_up and all(check["ok"] for check in report["checks"].values())
+    body = {"status": "ok" if ready else "unavailable", "warmed_up": _warmed_up, **report}
+    return JSONResponse(body, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api.get("/health/deep", tags=["system"])
+async def health_deep(outbound: bool = False, authorization: Annotated[str | None, Header()] = None) -> JSONResponse:
+    """Per-dependency latency, configuration and cache warm state (guarded by METRICS_TOKEN like /metrics).
+
+    503 when Supabase, storage or Postgres fails. Missing OpenAI/Resend keys or unreachable outbound
+    hosts (probed only with ``?outbound=true``) mark the report "degraded" instead.
+    """
+
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid metrics token")
+    report = await health_cache.get(
+        f"deep:{outbound}",
+        lambda: run_probes(dependency_probes(SCREENSHOT_BUCKET, deep=True, outbound=outbound)),
+    )
+    checks = report["checks"]
+    configured = {"openai": openai_client is not None, "resend": bool(RESEND_API_KEY)}
+    required_ok = all(check["ok"] for name, check in checks.items() if not name.startswith("outbound:"))
+    if not required_ok:
+        overall = "down"
+    elif all(check["ok"] for check in checks.values()) and all(configured.values()):
+        overall = "ok"
+    else:
+        overall = "degraded"
+    body = {"status": overall, **report, "configured": configured, "caches": cache_warm_state()}
+    return JSONResponse(body, status_code=status.HTTP_200_OK if required_ok else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api.get("/metrics", response_class=PlainTextResponse, tags=["system"])
+async def prometheus_metrics(authorization: Annotated[str | None, Header()] = None) -> PlainTextResponse:
+    """Request latency, database calls by table/operation and outbound HTTP calls, in Prometheus text format."""
+
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid metrics token")
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @api.post("/api/batch/update-rtp", tags=["system"])
 async def batch_update_rtp() -> dict[str, object]:
     invalidate_rtp_cache()
-    total_obligation, total_available = fetch_purchase_balances()
+    total_obligation, total_available = await run_blocking(fetch_purchase_balances)
     rtp = total_available / total_obligation if total_obligation else 1.0
-    global _rtp_cache
+    global _rtp_cache, _global_context_cache
     _rtp_cache = {"rtp": rtp, "timestamp": utc_now()}
 
-    total_users = get_total_user_count()
-    new_users = get_monthly_new_user_count()
+    total_users = await run_blocking(get_total_user_count)
+    new_users = await run_blocking(get_monthly_new_user_count)
+    _global_context_cache = {"total_users": total_users, "new_users": new_users, "timestamp": utc_now()}
     growth_rate = (new_users / total_users) if total_users else 0.0
     predicted_rtp = calculate_predictive_rtp(rtp, new_users, total_users)
 
     base = get_referral_probabilities(0)
     probabilities = adjust_probabilities_by_rtp(base, predicted_rtp)
+    await run_blocking(persist_rtp_snapshot, predicted_rtp, probabilities)
 
-    record_system_metrics(
+    active_users = await run_blocking(get_active_user_count)
+    await run_blocking(
+        record_system_metrics,
         total_users=total_users,
         new_users=new_users,
-        active_users=get_active_user_count(),
+        active_users=active_users,
         total_obligation=total_obligation,
         total_available=total_available,
         current_rtp=rtp,
@@ -206,6 +399,32 @@ async def get_optional_user_id(x_user_id: Annotated[str | None, Header(alias="X-
     return x_user_id
 
 
+async def get_current_user_row(request: Request, user_id: str = Depends(get_user_id)) -> dict[str, Any]:
+    """The caller's users row, loaded once per request and kept in ``request.state.user_row``."""
+
+    row = await run_blocking(fetch_user_row, user_id)
+    if not row:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    request.state.user_row = row
+    return row
+
+
+async def require_cron_token(x_cron_token: Annotated[str | None, Header(alias="X-Cron-Token")] = None) -> None:
+    """Batch endpoints stay open when CRON_TOKEN is unset, mirroring the optional header in the workflows."""
+
+    if CRON_TOKEN and x_cron_token != CRON_TOKEN:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid cron token")
+
+
+async def require_configured_cron_token(x_cron_token: Annotated[str | None, Header(alias="X-Cron-Token")] = None) -> None:
+    """For batch endpoints that scrape Amazon: never open, so an unset CRON_TOKEN refuses every call."""
+
+    if not CRON_TOKEN:
+        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "CRON_TOKEN is not configured")
+    if x_cron_token != CRON_TOKEN:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid cron token")
+
+
 async def require_admin(x_admin_token: Annotated[str | None, Header(alias="X-Admin-Token")] = None) -> None:
     if not ADMIN_API_KEY:
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "ADMIN_API_KEY is not configured")
@@ -290,126 +509,6 @@ class AdminUserUpdate(BaseModel):
 # ---------- Helpers ----------
 
 
-BOOTSTRAP_PROBABILITY_TABLE = [
-    {
-        "max": 0,
-        "values": {"bronze": 0.55, "silver": 0.20, "gold": 0.12, "red": 0.03, "poison": 0.10},
-    },
-    {
-        "max": 1,
-        "values": {"bronze": 0.52, "silver": 0.22, "gold": 0.14, "red": 0.04, "poison": 0.08},
-    },
-    {
-        "max": 2,
-        "values": {"bronze": 0.49, "silver": 0.24, "gold": 0.16, "red": 0.05, "poison": 0.06},
-    },
-    {
-        "max": math.inf,
-        "values": {"bronze": 0.46, "silver": 0.26, "gold": 0.18, "red": 0.06, "poison": 0.04},
-    },
-]
-
-
-STRICT_REFERRAL_PROBABILITY_TABLE = [
-    {
-        "max": 0,
-        "values": {"bronze": 0.60, "silver": 0.18, "gold": 0.10, "red": 0.02, "poison": 0.10},
-    },
-    {
-        "max": 3,
-        "values": {"bronze": 0.58, "silver": 0.18, "gold": 0.10, "red": 0.02, "poison": 0.12},
-    },
-    {
-        "max": 5,
-        "values": {"bronze": 0.56, "silver": 0.19, "gold": 0.11, "red": 0.03, "poison": 0.11},
-    },
-    {
-        "max": 10,
-        "values": {"bronze": 0.50, "silver": 0.22, "gold": 0.14, "red": 0.04, "poison": 0.10},
-    },
-    {
-        "max": 20,
-        "values": {"bronze": 0.45, "silver": 0.25, "gold": 0.17, "red": 0.05, "poison": 0.08},
-    },
-    {
-        "max": math.inf,
-        "values": {"bronze": 0.40, "silver": 0.28, "gold": 0.20, "red": 0.07, "poison": 0.05},
-    },
-]
-
-
-def select_probability_row(referral_count: int, table: list[dict[str, object]]) -> Dict[str, float]:
-    rc = max(referral_count, 0)
-    for row in table:
-        if rc <= row["max"]:
-            return {**row["values"]}
-    return {**table[-1]["values"]}
-
-
-def get_bootstrap_probabilities(referral_count: int) -> Dict[str, float]:
-    return select_probability_row(referral_count, BOOTSTRAP_PROBABILITY_TABLE)
-
-
-def get_referral_probabilities(referral_count: int) -> Dict[str, float]:
-    return select_probability_row(referral_count, STRICT_REFERRAL_PROBABILITY_TABLE)
-
-
-def get_next_referral_threshold(referral_count: int) -> int | None:
-    for threshold in (3, 5, 10, 20):
-        if referral_count < threshold:
-            return threshold
-    return None
-
-
-APPLE_REWARDS = {
-    "bronze": {"purchase_obligation": 0, "purchase_available": 1},
-    "silver": {"purchase_obligation": 0, "purchase_available": 2},
-    "gold": {"purchase_obligation": 0, "purchase_available": 3},
-    "red": {"purchase_obligation": 0, "purchase_available": 10},
-    "poison": {"purchase_obligation": 0, "purchase_available": 0},
-}
-
-
-
-def utc_now() -> datetime:
-    return datetime.now(timezone.utc)
-
-
-STATUS_HINTS = {
-    "guest": "ユーザーは未ログインです。まずは新規登録や利用規約案内をしてください。",
-    "registered": "利用規約への同意を促し、terms ページへ進んでもらいます。",
-    "terms_agreed": "チュートリアル完了とチェックリストの確認方法を案内してください。",
-    "tutorial_completed": "購入対象の割り当てを待っている状態。Amazon購入とスクショ提出の手順を丁寧に説明。",
-    "ready_to_purchase": "割り当てられたリストの商品購入とスクショ撮影の注意点を説明。",
-    "verifying": "AI+管理者がスクショ確認中であること、待ち時間中にできることをガイド。",
-    "first_purchase_completed": "自分の欲しいものリストを登録し、ready_to_draw までの残り作業を伝える。",
-    "ready_to_draw": "24時間かけて開くりんごカードや友達紹介による確率アップを案内。",
-    "active": "ダッシュボードや紹介機能、チケット消化のベストプラクティスを共有。",
-}
-
-
-CHATBOT_SYSTEM_PROMPT = """
-あなたは「りんご会♪」の公式キャラクター「りんごちゃん」です。口調は柔らかく丁寧、語尾は優しく、絵文字を多用せずに 2〜4 文で端的に回答してください。
-- ユーザーの現在ステータスに応じて、次のアクションや注意点を優先的に案内する
-- スクリーンショットや購入内容などの個人情報を直接尋ねない
-- 不明点が多い場合は、@support に連絡するよう案内する
-- 動的RTPやりんご抽選のルールは仕様書通りに説明する
-"""
-
-
-STATUS_FALLBACK_RESPONSES = {
-    "guest": "こんにちは♪ まずは新規登録して、利用規約へ進んでくださいね。",
-    "registered": "利用規約ページで同意ボタンを押すと次に進めます。わからない所はなんでも聞いてください。",
-    "terms_agreed": "使い方ページでチェックリストを終えたら、購入ステップへ進みましょう。",
-    "tutorial_completed": "誰かの欲しいものリストが割り当たると通知されます。Amazonで購入したらスクショも忘れずに。",
-    "ready_to_purchase": "割り当てられた商品を購入して、注文番号が写ったスクショを提出してください。",
-    "verifying": "現在スクショを確認中です。通常は数時間で完了するので、少しだけ待っていてくださいね。",
-    "first_purchase_completed": "おめでとう！ 次は自分の欲しいものリストURLを登録して、抽選の準備を整えましょう。",
-    "ready_to_draw": "りんごを引いて24時間のワクワクを楽しんでください。友達紹介で確率もアップします。",
-    "active": "ステータスはアクティブです。ダッシュボードからチケット状況や紹介実績をチェックしてみてください。",
-}
-
-
 def ensure_bucket() -> None:
     global _bucket_ready
     if _bucket_ready:
@@ -422,39 +521,116 @@ def ensure_bucket() -> None:
     _bucket_ready = True
 
 
-async def save_screenshot(file: UploadFile, user_id: str, purchase_id: int) -> str:
-    contents = await file.read()
-    if len(contents) > MAX_SCREENSHOT_SIZE:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ファイルサイズは10MB以下にしてください。")
+def sniff_image_type(head: bytes) -> str | None:
+    for mime, signature in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return mime
+    return None
 
-    content_type = file.content_type or "application/octet-stream"
-    if content_type not in ALLOWED_MIMES:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "PNG または JPG 形式の画像をアップロードしてください。")
 
-    ext = Path(file.filename or "screenshot.png").suffix.lower()
-    if ext not in {".png", ".jpg", ".jpeg"}:
-        ext = ".png" if content_type == "image/png" else ".jpg"
-
-    ensure_bucket()
-    object_path = f"{user_id}/{purchase_id}-{int(time.time())}{ext}"
-    supabase.storage.from_(SCREENSHOT_BUCKET).upload(
-        object_path,
-        contents,
-        {
-            "content-type": content_type,
-            "upsert": "true",
-        },
-    )
+def _upload_screenshot_file(object_path: str, local_path: str, content_type: str) -> str:
+    # Handing over a file object lets the storage client stream it from disk instead of loading it.
+    with open(local_path, "rb") as upload_file:
+        supabase.storage.from_(SCREENSHOT_BUCKET).upload(
+            object_path,
+            upload_file,
+            {
+                "content-type": content_type,
+                "upsert": "true",
+            },
+        )
     public_url = supabase.storage.from_(SCREENSHOT_BUCKET).get_public_url(object_path)
     url = public_url.get("publicUrl") if isinstance(public_url, dict) else public_url
-    
+
     # Clean up URL - remove trailing query parameters that may cause issues
     if isinstance(url, str):
         url = url.rstrip("?.")
-    
+
     return url
 
 
+async def save_screenshot(file: UploadFile, user_id: str, purchase_id: int) -> dict[str, str | None]:
+    """Validate and store an uploaded screenshot without holding more than one chunk in memory.
+
+    The declared type and the file's magic bytes are checked before the rest is read; the body is
+    then copied chunk by chunk into a temp file under a running size cap, hashing it on the way.
+    With SCREENSHOT_NORMALIZE the file goes through ``image_pipeline`` and a thumbnail is stored
+    next to it. Returns the purchase columns to update.
+    """
+
+    content_type = file.content_type or "application/octet-stream"
+    if content_type not in ALLOWED_MIMES:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "PNG または JPG 形式の画像をアップロードしてください。")
+    if file.size is not None and file.size > MAX_SCREENSHOT_SIZE:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ファイルサイズは10MB以下にしてください。")
+
+    chunk = await file.read(SCREENSHOT_CHUNK_SIZE)
+    detected_type = sniff_image_type(chunk)
+    if detected_type is None:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "PNG または JPG 形式の画像をアップロードしてください。")
+
+    ext = Path(file.filename or "screenshot.png").suffix.lower()
+    if ext not in {".png", ".jpg", ".jpeg"} or (ext == ".png") != (detected_type == "image/png"):
+        ext = ".png" if detected_type == "image/png" else ".jpg"
+
+    spool = tempfile.NamedTemporaryFile(prefix="screenshot-", suffix=ext, delete=False)
+    local_paths = [spool.name]
+    try:
+        digest = hashlib.sha256()
+        with spool:
+            size = 0
+            while chunk:
+                size += len(chunk)
+                if size > MAX_SCREENSHOT_SIZE:
+                    raise HTTPException(status.HTTP_400_BAD_REQUEST, "ファイルサイズは10MB以下にしてください。")
+                digest.update(chunk)
+                spool.write(chunk)
+                chunk = await file.read(SCREENSHOT_CHUNK_SIZE)
+
+        await run_blocking(ensure_bucket)
+        object_base = f"{user_id}/{purchase_id}-{int(time.time())}"
+        if not SCREENSHOT_NORMALIZE:
+            try:
+                phash = await image_pipeline.fingerprint(spool.name)
+            except ImageRejected as exc:
+                print(f"[ImagePipeline] Could not hash upload for purchase {purchase_id}: {exc}")
+                phash = None
+            url = await run_blocking(_upload_screenshot_file, f"{object_base}{ext}", spool.name, detected_type)
+            return {
+                "screenshot_url": url,
+                "screenshot_thumbnail_url": None,
+                "screenshot_sha256": digest.hexdigest(),
+                "screenshot_phash": phash,
+            }
+
+        try:
+            processed = await image_pipeline.normalize(spool.name)
+        except ImageRejected as exc:
+            print(f"[ImagePipeline] Rejected upload for purchase {purchase_id}: {exc}")
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "画像を読み込めませんでした。別のスクリーンショットをお試しください。")
+        local_paths += [str(processed["path"]), str(processed["thumbnail_path"])]
+        output_ext = str(processed["extension"])
+        output_type = str(processed["content_type"])
+        url = await run_blocking(
+            _upload_screenshot_file, f"{object_base}{output_ext}", str(processed["path"]), output_type
+        )
+        thumbnail_url = await run_blocking(
+            _upload_screenshot_file, f"{object_base}-thumb{output_ext}", str(processed["thumbnail_path"]), output_type
+        )
+        return {
+            "screenshot_url": url,
+            "screenshot_thumbnail_url": thumbnail_url,
+            "screenshot_sha256": digest.hexdigest(),
+            "screenshot_phash": str(processed["phash"]),
+        }
+    finally:
+        for path in local_paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
 def generate_referral_code() -> str:
     return "".join(random.choices(REFERRAL_CODE_ALPHABET, k=REFERRAL_CODE_LENGTH))
 
@@ -468,7 +644,7 @@ def ensure_referral_code(user_id: str, existing_code: str | None) -> str:
         existing = supabase.table("users").select("id").eq("referral_code", candidate).limit(1).execute()
         if existing.data:
             continue
-        supabase.table("users").update({"referral_code": candidate, "updated_at": utc_now().isoformat()}).eq("id", user_id).execute()
+        update_user_row(user_id, {"referral_code": candidate, "updated_at": utc_now().isoformat()})
         return candidate
 
     raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "紹介コードの生成に失敗しました")
@@ -481,30 +657,6 @@ def build_anonymous_alias(user_id: str | None) -> str:
     return f"りんごネーム #{suffix[-4:]}"
 
 
-def upsert_wishlist_item(user_id: str, title: str | None, price: int, url: str) -> None:
-    payload = {
-        "title": title or "Amazon欲しいもの",
-        "price": price,
-        "url": url,
-        "updated_at": utc_now().isoformat(),
-    }
-    existing = (
-        supabase.table("wishlist_items")
-        .select("id")
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-    )
-    if existing.data:
-        supabase.table("wishlist_items").update(payload).eq("id", existing.data[0]["id"]).execute()
-    else:
-        supabase.table("wishlist_items").insert({**payload, "user_id": user_id, "created_at": utc_now().isoformat()}).execute()
-
-
-def release_wishlist_assignment(purchase_id: int) -> None:
-    supabase.table("wishlist_items").update({"assigned_purchase_id": None}).eq("assigned_purchase_id", purchase_id).execute()
-
-
 def ensure_mock_target_user(exclude_user_id: str | None = None) -> None:
     if not ENABLE_MOCK_WISHLIST_SEED:
         return
@@ -591,12 +743,114 @@ def create_mock_purchase(user_id: str) -> dict[str, object]:
     return purchase_insert.data[0]
 
 
+def fetch_user_row(user_id: str) -> dict[str, Any] | None:
+    """The full users row, loaded at most once per request (see ``update_user_row`` for writes)."""
+
+    scope = current_request_scope()
+    if scope is not None and user_id in scope.user_rows:
+        row = scope.user_rows[user_id]
+        return dict(row) if row else None
+    if pg_hot_paths:
+        row = pg_hot_paths.fetch_user(user_id)
+    else:
+        response = supabase.table("users").select("*").eq("id", user_id).limit(1).execute()
+        row = response.data[0] if response.data else None
+    if scope is not None:
+        scope.user_rows[user_id] = row
+    return dict(row) if row else None
+
+
+def update_user_row(user_id: str, updates: dict[str, Any]) -> list[dict[str, Any]]:
+    """Update a user by id and write the new values through to the request's cached row."""
+
+    response = supabase.table("users").update(updates).eq("id", user_id).execute()
+    _write_through_user_row(user_id, response.data, updates)
+    return response.data or []
+
+
+def _write_through_user_row(user_id: str, rows: list[dict[str, Any]] | None, updates: dict[str, Any]) -> None:
+    scope = current_request_scope()
+    if scope is not None and user_id in scope.user_rows:
+        if rows:
+            scope.user_rows[user_id] = dict(rows[0])
+        elif scope.user_rows[user_id] is not None:
+            scope.user_rows[user_id] = {**scope.user_rows[user_id], **updates}
+
+
+USER_COUNTER_ATTEMPTS = 5
+
+
+def update_user_counters(
+    user_id: str,
+    columns: tuple[str, ...],
+    build: Callable[[dict[str, Any]], dict[str, Any] | None],
+) -> list[dict[str, Any]] | None:
+    """Read-modify-write of counter columns (draw rights, ticket balances) that cannot lose an update.
+
+    ``build`` gets the user's current values of ``columns`` and returns the update, or None to refuse
+    it (e.g. no draw right left). The write only lands while those columns still hold the values read;
+    when a concurrent request changed one in between, the update is rebuilt from a fresh read.
+    PostgREST has no ``col = col - 1`` update, so this compare-and-set stands in for it.
+
+    Returns the updated rows ([] when the user does not exist) or None when ``build`` refused.
+    """
+
+    for _ in range(USER_COUNTER_ATTEMPTS):
+        response = supabase.table("users").select(", ".join(columns)).eq("id", user_id).limit(1).execute()
+        if not response.data:
+            return []
+        current = response.data[0]
+        updates = build(current)
+        if updates is None:
+            return None
+        query = supabase.table("users").update(updates).eq("id", user_id)
+        for column in columns:
+            query = query.is_(column, "null") if current.get(column) is None else query.eq(column, current[column])
+        written = query.execute()
+        if written.data:
+            _write_through_user_row(user_id, written.data, updates)
+            return written.data
+    raise HTTPException(status.HTTP_409_CONFLICT, "他の操作と重なりました。もう一度お試しください")
+
+
+def fetch_current_apple_rows(user_id: str) -> list[dict[str, Any]]:
+    if pg_hot_paths:
+        return pg_hot_paths.current_apple(user_id)
+    response = (
+        supabase.table("apples")
+        .select("id, apple_type, draw_time, reveal_time, status")
+        .eq("user_id", user_id)
+        .order("draw_time", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data or []
+
+
+def fetch_current_purchase_rows(user_id: str) -> list[dict[str, Any]]:
+    if pg_hot_paths:
+        return pg_hot_paths.current_purchase(user_id)
+    response = (
+        supabase.table("purchases")
+        .select("id, target_user_id, target_item_name, target_item_price, target_wishlist_url, status, screenshot_url")
+        .eq("purchaser_id", user_id)
+        .in_("status", ["pending", "submitted"])
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data or []
+
+
 def fetch_available_wishlist_items(user_id: str, limit: int = 20) -> list[dict[str, object]]:
+    if pg_hot_paths:
+        return pg_hot_paths.available_wishlist_items(user_id, limit)
     response = (
         supabase.table("wishlist_items")
         .select("id, user_id, title, price, url, assigned_purchase_id")
         .neq("user_id", user_id)
         .is_("assigned_purchase_id", None)
+        .eq("is_eligible", True)
         .order("created_at")
         .limit(limit)
         .execute()
@@ -605,20 +859,10 @@ def fetch_available_wishlist_items(user_id: str, limit: int = 20) -> list[dict[s
 
 
 def fetch_dashboard_snapshot(user_id: str) -> tuple[dict[str, object], dict[str, int]]:
-    user_resp = (
-        supabase.table("users")
-        .select(
-            "email,status,wishlist_url,wishlist_registered_at,purchase_obligation,purchase_available,"
-            "referral_code,referral_count,silver_gold_completed_count"
-        )
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    if not user_resp.data:
+    profile = fetch_user_row(user_id)
+    if not profile:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
 
-    profile = user_resp.data
     referral_code = ensure_referral_code(user_id, profile.get("referral_code"))
     profile["referral_code"] = referral_code
 
@@ -678,33 +922,33 @@ async def seed_wishlist_items_from_users(limit: int = 50, exclude_user_id: str |
     if exclude_user_id:
         query = query.neq("id", exclude_user_id)
 
-    response = query.execute()
-    seeded = 0
-    for row in response.data or []:
-        user_id = row.get("id")
-        wishlist_url = row.get("wishlist_url")
-        if not user_id or not wishlist_url:
-            continue
-        existing = (
-            supabase.table("wishlist_items")
-            .select("id")
-            .eq("user_id", user_id)
-            .limit(1)
-            .execute()
-        )
-        if existing.data:
+    response = await execute(query)
+    candidates = [row for row in response.data or [] if row.get("id") and row.get("wishlist_url")]
+    if not candidates:
+        return 0
+    existing = await execute(
+        supabase.table("wishlist_items")
+        .select("user_id")
+        .in_("user_id", [row["id"] for row in candidates])
+    )
+    existing_ids = {row["user_id"] for row in existing.data or []}
+
+    rows: list[dict[str, object]] = []
+    for row in candidates:
+        user_id = row["id"]
+        if user_id in existing_ids:
             continue
         try:
-            normalized = normalize_wishlist_url(wishlist_url)
+            normalized = normalize_wishlist_url(row["wishlist_url"])
             metadata = await fetch_wishlist_snapshot(normalized)
         except HTTPException:
             continue
         price = metadata.get("price")
         if not isinstance(price, int):
             continue
-        upsert_wishlist_item(user_id, metadata.get("title"), price, normalized)
-        seeded += 1
-    return seeded
+        rows.append(wishlist_item_row(user_id, metadata.get("title"), price, normalized))
+    await run_blocking(upsert_wishlist_items, rows)
+    return len(rows)
 
 
 async def send_resend_email(to_email: str, subject: str, html_body: str, text_body: str | None = None) -> None:
@@ -724,9 +968,10 @@ async def send_resend_email(to_email: str, subject: str, html_body: str, text_bo
         "Content-Type": "application/json",
     }
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.post("https://api.resend.com/emails", headers=headers, json=payload)
-            response.raise_for_status()
+        with track_http("resend"):
+            async with httpx.AsyncClient(timeout=15.0) as client:
+                response = await client.post("https://api.resend.com/emails", headers=headers, json=payload)
+                response.raise_for_status()
     except httpx.HTTPError as exc:  # pragma: no cover - best effort
         print(f"[Resend] Failed to send email: {exc}")
 
@@ -781,24 +1026,6 @@ async def notify_purchase_status_email(
     await send_resend_email(to_email, subject, html_body, text_body or None)
 
 
-def build_thresholds(referral_count: int) -> list[dict[str, str | int]]:
-    stages: list[dict[str, str | int]] = []
-    first_pending_set = False
-    for amount in REFERRAL_THRESHOLDS:
-        if referral_count >= amount:
-            status = "completed"
-        elif not first_pending_set:
-            status = "active"
-            first_pending_set = True
-        else:
-            status = "locked"
-        stages.append({"count": amount, "status": status})
-    if not first_pending_set:
-        # all completed
-        stages = [{**stage, "status": "completed"} for stage in stages]
-    return stages
-
-
 def get_total_user_count() -> int:
     try:
         response = supabase.table("users").select("id", count="exact").limit(1).execute()
@@ -847,28 +1074,6 @@ def get_days_since_launch() -> int:
     return max((utc_now() - LAUNCH_DATE).days, 0)
 
 
-def should_use_bootstrap_probabilities(days_since_launch: int, total_users: int, rtp: float) -> tuple[bool, list[str]]:
-    reasons: list[str] = []
-    if days_since_launch < BOOTSTRAP_DAYS:
-        reasons.append(
-            f"リリースから {days_since_launch} 日のため、安定期間({BOOTSTRAP_DAYS}日)を優先して固定確率を使用しています。"
-        )
-        return True, reasons
-    if total_users < MIN_DYNAMIC_USERS:
-        reasons.append(
-            f"登録ユーザーが {total_users} 人のため、{MIN_DYNAMIC_USERS} 人に達するまでは固定確率で運用します。"
-        )
-        return True, reasons
-    if rtp <= 0:
-        return True, ["RTP が計算できなかったため暫定の固定確率を使用します。"]
-    if abs(1 - rtp) > RTP_VARIANCE_THRESHOLD:
-        reasons.append(
-            f"RTP の変動幅が {abs(1 - rtp):.2f} と大きいため、一時的に固定確率へフォールバックしています。"
-        )
-        return True, reasons
-    return False, reasons
-
-
 def calculate_days_since_last_silver_gold(last_completed_at: str | datetime | None) -> int | None:
     if not last_completed_at:
         return None
@@ -880,72 +1085,13 @@ def calculate_days_since_last_silver_gold(last_completed_at: str | datetime | No
     return max(delta.days, 0)
 
 
-def apply_last_silver_gold_adjustment(probabilities: Dict[str, float], days_since: int | None) -> tuple[Dict[str, float], str | None]:
-    if days_since is None:
-        return probabilities, None
-
-    adjustment: tuple[float, float, str] | None = None
-    if days_since < 7:
-        adjustment = (0.3, 0.3, "直近7日以内にシルバー/ゴールドを完了しているため、確率を大幅に抑制しています。")
-    elif days_since < 14:
-        adjustment = (0.5, 0.2, "直近14日以内にシルバー/ゴールドを完了しているため、確率を抑制しています。")
-    elif days_since < 30:
-        adjustment = (0.8, 0.1, "直近30日以内にシルバー/ゴールドを完了しているため、わずかに確率を調整しています。")
-
-    if not adjustment:
-        return probabilities, None
-
-    factor, poison_delta, message = adjustment
-    probabilities = probabilities.copy()
-    probabilities["silver"] *= factor
-    probabilities["gold"] *= factor
-    probabilities["red"] *= factor
-    probabilities["poison"] = max(probabilities.get("poison", 0) + poison_delta, 0.01)
-    probabilities = normalize_probabilities(probabilities)
-
-    return probabilities, message
-
-
-def apply_completion_adjustment(probabilities: Dict[str, float], completion_count: int) -> tuple[Dict[str, float], str | None]:
-    if completion_count <= 0:
-        return probabilities, None
-
-    adjustments = {
-        1: (0.7, 0.15, "シルバー/ゴールドを1回完了しているため、次回の上位りんご確率を少し抑えています。"),
-        2: (0.5, 0.25, "シルバー/ゴールドを2回完了しているため、確率を大きく抑えています。"),
-    }
-    factor, poison_delta, message = adjustments.get(
-        completion_count,
-        (0.3, 0.35, "シルバー/ゴールドを複数回完了しているため、しばらく確率を厳しくしています。"),
-    )
-
-    probabilities = probabilities.copy()
-    probabilities["silver"] *= factor
-    probabilities["gold"] *= factor
-    probabilities["red"] *= factor
-    probabilities["poison"] = max(probabilities.get("poison", 0) + poison_delta, 0.01)
-    probabilities = normalize_probabilities(probabilities)
-
-    return probabilities, message
-
-
-def calculate_predictive_rtp(current_rtp: float, new_users: int, total_users: int) -> float:
-    if total_users <= 0 or new_users <= 0:
-        return current_rtp
-    growth_rate = new_users / total_users
-    if growth_rate <= 0:
-        return current_rtp
-    return current_rtp / (1.0 + growth_rate)
-
-
-def calculate_probability_profile(user_row: dict, persist_rtp_snapshot: bool = False) -> tuple[Dict[str, float], list[str], dict[str, object]]:
+def calculate_probability_profile(user_row: dict, persist_snapshot: bool = False) -> tuple[Dict[str, float], list[str], dict[str, object]]:
     referral_count = user_row.get("referral_count") or 0
     completion_count = user_row.get("silver_gold_completed_count") or 0
     days_since_last = calculate_days_since_last_silver_gold(user_row.get("last_silver_gold_completed_at"))
-    total_users = get_total_user_count()
+    total_users, new_users = get_cached_global_context()
     days_since_launch = get_days_since_launch()
     rtp = get_cached_rtp()
-    new_users = get_monthly_new_user_count()
     growth_rate = new_users / total_users if total_users else 0.0
     predicted_rtp = calculate_predictive_rtp(rtp, new_users, total_users)
 
@@ -960,10 +1106,12 @@ def calculate_probability_profile(user_row: dict, persist_rtp_snapshot: bool = F
         reasons.append(f"紹介人数 {referral_count} 人で、最高ランクの確率テーブルを利用中です。")
 
     if not use_bootstrap:
-        probabilities = adjust_probabilities_by_rtp(probabilities, rtp, persist=persist_rtp_snapshot)
+        probabilities = adjust_probabilities_by_rtp(probabilities, rtp)
+        if persist_snapshot:
+            persist_rtp_snapshot(rtp, probabilities)
         reasons.append(f"現在のRTP {rtp:.2f} に応じて確率を微調整しています。")
         if abs(predicted_rtp - rtp) > 0.02:
-            probabilities = adjust_probabilities_by_rtp(probabilities, predicted_rtp, persist=False)
+            probabilities = adjust_probabilities_by_rtp(probabilities, predicted_rtp)
             reasons.append(
                 f"今月の新規登録 {new_users} 人 (総数 {total_users} 人) を考慮し、予測RTP {predicted_rtp:.2f} に合わせて追加調整しています。"
             )
@@ -1082,6 +1230,8 @@ def count_field_values(table: str, field: str, order_field: str = "id", page_siz
 
 
 def fetch_purchase_balances(page_size: int = 1000) -> Tuple[int, int]:
+    if pg_hot_paths:
+        return pg_hot_paths.purchase_balances()
     total_obligation = 0
     total_available = 0
     start = 0
@@ -1219,11 +1369,20 @@ def get_cached_rtp() -> float:
     return rtp
 
 
-def normalize_probabilities(probabilities: Dict[str, float]) -> Dict[str, float]:
-    total = sum(probabilities.values())
-    if total <= 0:
-        return {key: 1.0 / len(probabilities) for key in probabilities}
-    return {key: max(value / total, 0.0) for key, value in probabilities.items()}
+def get_cached_global_context() -> tuple[int, int]:
+    """Total and this month's new user counts, cached like the RTP; they only move the bootstrap switch and predicted RTP."""
+
+    global _global_context_cache
+    now = utc_now()
+    if _global_context_cache:
+        cached_at = _global_context_cache.get("timestamp")
+        if isinstance(cached_at, datetime) and (now - cached_at).total_seconds() < RTP_CACHE_TTL_SECONDS:
+            return int(_global_context_cache["total_users"]), int(_global_context_cache["new_users"])
+
+    total_users = get_total_user_count()
+    new_users = get_monthly_new_user_count(now)
+    _global_context_cache = {"total_users": total_users, "new_users": new_users, "timestamp": now}
+    return total_users, new_users
 
 
 def persist_rtp_snapshot(rtp: float, probabilities: Dict[str, float], snapshot_time: datetime | None = None) -> None:
@@ -1240,437 +1399,315 @@ def persist_rtp_snapshot(rtp: float, probabilities: Dict[str, float], snapshot_t
         print(f"[RTP] Failed to persist snapshot: {exc}")
 
 
-def adjust_probabilities_by_rtp(base: Dict[str, float], rtp: float, *, persist: bool = True) -> Dict[str, float]:
-    probabilities = base.copy()
-    deviation = rtp - 1.0
-
-    if deviation > 0.05:
-        poison_delta = min(deviation * 0.5, 0.1)
-        probabilities["poison"] = min(probabilities.get("poison", 0) + poison_delta, 0.5)
-        probabilities["silver"] = max(probabilities.get("silver", 0) - poison_delta * 0.3, 0.01)
-        probabilities["gold"] = max(probabilities.get("gold", 0) - poison_delta * 0.2, 0.01)
-        probabilities["red"] = max(probabilities.get("red", 0) - poison_delta * 0.1, 0.005)
-    elif deviation < -0.05:
-        poison_delta = min(abs(deviation) * 0.5, 0.1)
-        probabilities["poison"] = max(probabilities.get("poison", 0) - poison_delta, 0.01)
-        probabilities["silver"] = min(probabilities.get("silver", 0) + poison_delta * 0.3, 0.4)
-        probabilities["gold"] = min(probabilities.get("gold", 0) + poison_delta * 0.2, 0.3)
-        probabilities["red"] = min(probabilities.get("red", 0) + poison_delta * 0.1, 0.15)
+def fetch_stale_wishlist_items(max_age_seconds: float, limit: int) -> list[dict[str, object]]:
+    """Unassigned items never checked or last attempted before the cutoff, least recently attempted first.
 
-    normalized = normalize_probabilities(probabilities)
-    if persist:
-        persist_rtp_snapshot(rtp, normalized)
-    return normalized
+    Ordering on the attempt rather than the last successful validation keeps lists that fail every
+    time from sorting first forever and filling each batch.
+    """
 
+    cutoff = (utc_now() - timedelta(seconds=max_age_seconds)).isoformat()
+    response = (
+        supabase.table("wishlist_items")
+        .select("id,user_id,title,price,url,is_eligible,last_validated_at,validation_failures")
+        .is_("assigned_purchase_id", None)
+        .or_(f'last_attempted_at.is.null,last_attempted_at.lt."{cutoff}"')
+        .order("last_attempted_at", nullsfirst=True)
+        .order("created_at")
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
 
-def parse_timestamp(value: str | datetime | None) -> datetime:
-    if isinstance(value, datetime):
-        return value
-    if isinstance(value, str):
-        if value.endswith("Z"):
-            value = value.replace("Z", "+00:00")
-        return datetime.fromisoformat(value)
-    return utc_now()
 
+async def revalidate_wishlist_item(item: dict[str, object]) -> str:
+    """Re-check one wishlist_items row and record the verdict; returns the outcome category."""
 
-def normalize_wishlist_url(raw_url: str) -> str:
-    if not raw_url:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "URLを入力してください。")
+    try:
+        summary = await fetch_wishlist_summary(str(item["url"]))
+    except WishlistNotFound:
+        # Every variant answered 404/410: the list was deleted or made private.
+        reason: str | None = "not_found"
+        summary = {}
+    except HTTPException as exc:
+        if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            # Our own throttle is saturated: nothing was learned about the list, retry on the next run.
+            return "throttled"
+        return await record_wishlist_fetch_failure(item)
+    else:
+        reason = evaluate_wishlist_summary(summary)
 
-    candidate = raw_url.strip()
-    if not candidate.startswith(("http://", "https://")):
-        candidate = f"https://{candidate}"
+    now = utc_now().isoformat()
+    payload: dict[str, object] = {
+        "last_validated_at": now,
+        "last_attempted_at": now,
+        "validation_failures": 0,
+        "is_eligible": reason is None,
+        "ineligible_reason": reason,
+    }
+    if reason is None:
+        price = summary.get("price")
+        title = summary.get("title")
+        if price != item.get("price") or (title and title != item.get("title")):
+            payload.update({"price": price, "title": title or item.get("title"), "updated_at": now})
+    await execute(supabase.table("wishlist_items").update(payload).eq("id", item["id"]))
+    if reason is None:
+        return "eligible" if item.get("is_eligible", True) else "restored"
+    return reason
+
+
+async def record_wishlist_fetch_failure(item: dict[str, object]) -> str:
+    """Count a failed fetch (robot check, sign-in page, network error) and retire the list once it keeps failing.
+
+    One failure says nothing about the list, so the previous verdict stands until
+    WISHLIST_REVALIDATE_MAX_FAILURES runs in a row failed; each failure still moves the item to the
+    back of the queue until the next run after WISHLIST_REVALIDATE_AFTER_SECONDS.
+    """
 
-    parsed = urlparse(candidate)
-    if not parsed.netloc:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "有効なURL形式ではありません。")
+    failures = int(item.get("validation_failures") or 0) + 1
+    payload: dict[str, object] = {"last_attempted_at": utc_now().isoformat(), "validation_failures": failures}
+    if failures >= WISHLIST_REVALIDATE_MAX_FAILURES:
+        payload.update({"is_eligible": False, "ineligible_reason": "fetch_failed"})
+    await execute(supabase.table("wishlist_items").update(payload).eq("id", item["id"]))
+    # Retired lists keep being re-checked (and come back once they load); count only the transition.
+    if failures >= WISHLIST_REVALIDATE_MAX_FAILURES and item.get("is_eligible", True):
+        return "retired_fetch_failed"
+    return "fetch_failed"
 
-    scheme = parsed.scheme.lower()
-    if scheme not in {"http", "https"}:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "http または https のURLを使用してください。")
 
-    host = parsed.netloc.lower()
-    if host not in WISHLIST_ALLOWED_HOSTS:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Amazonの欲しいものリストURLのみ登録できます。")
+async def run_wishlist_revalidation(
+    *,
+    max_age_seconds: float = WISHLIST_REVALIDATE_AFTER_SECONDS,
+    limit: int = WISHLIST_REVALIDATE_BATCH_SIZE,
+    concurrency: int = WISHLIST_REVALIDATE_CONCURRENCY,
+) -> dict[str, object]:
+    items = await run_blocking(fetch_stale_wishlist_items, max_age_seconds, limit)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(item: dict[str, object]) -> str:
+        async with semaphore:
+            try:
+                return await revalidate_wishlist_item(item)
+            except Exception as exc:  # pragma: no cover - network/database errors
+                print(f"[WishlistRevalidation] Failed for item {item.get('id')}: {exc}")
+                return "error"
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(run(item) for item in items))
+    counts: dict[str, int] = {}
+    for outcome in outcomes:
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return {"checked": len(items), "outcomes": counts, "elapsed_seconds": round(time.perf_counter() - started, 2)}
 
-    path = parsed.path.lower()
-    if not any(keyword in path for keyword in WISHLIST_PATH_KEYWORDS):
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "欲しいものリストのURLを入力してください（wishlist/registry パスが必要です）。")
 
-    normalized = parsed._replace(scheme="https")
-    return normalized.geturl()
+async def apply_verification_result(
+    purchase: dict[str, Any],
+    user_id: str,
+    verdict: tuple[str, str, dict[str, Any] | None, dict[str, Any] | None],
+    screenshot_url: str,
+    note: str | None,
+) -> dict[str, str]:
+    """Move the purchase and its purchaser to the states that follow a verification verdict."""
 
+    verification_status, verification_reason, ocr_snapshot, verification_metadata = verdict
+    purchase_id = purchase["id"]
+    if (verification_metadata or {}).get("cached") and purchase.get("status") in {"approved", "rejected"}:
+        # A retry of a finished submission: the rights and emails were already handled the first time.
+        return {"status": verification_status, "message": verification_reason}
 
-def extract_price_snapshot(html: str) -> int | None:
-    candidates: list[int] = []
-    for match in PRICE_PATTERN.finditer(html):
-        digits = match.group(1).replace(",", "")
-        try:
-            candidates.append(int(digits))
-        except ValueError:
-            continue
+    if verification_status == "approved":
+        purchase_status = "approved"
+    elif verification_status == "rejected":
+        purchase_status = "rejected"
+    else:
+        purchase_status = "review_required"
 
-    if not candidates:
-        return None
+    purchase_update = {
+        "status": purchase_status,
+        "screenshot_url": screenshot_url,
+        "admin_notes": note,
+        "verification_status": verification_status,
+        "verification_result": verification_reason,
+        "verified_at": utc_now().isoformat() if verification_status == "approved" else None,
+    }
+    if ocr_snapshot:
+        purchase_update["ocr_snapshot"] = ocr_snapshot
+    if verification_metadata:
+        purchase_update["verification_metadata"] = verification_metadata
+    # Only a purchase still waiting for its verdict moves on, so a job that ran twice (a sweep in a
+    # second process) cannot grant the draw right twice.
+    claimed = await execute(
+        supabase.table("purchases").update(purchase_update).eq("id", purchase_id).eq("status", "submitted")
+    )
+    if not claimed.data:
+        print(f"[PurchaseVerify] Purchase {purchase_id} already has a verdict; skipping")
+        return {"status": verification_status, "message": verification_reason}
 
-    # Prefer values in the expected range so we don't accidentally pick shipping/other UI values.
-    in_range = [value for value in candidates if 3000 <= value <= 4000]
-    if in_range:
-        return in_range[0]
+    user_snapshot = await run_blocking(fetch_user_row, user_id) or {}
+    user_email = user_snapshot.get("email")
 
-    return candidates[0]
+    next_status = "first_purchase_completed" if verification_status == "approved" else "verifying"
+    user_update: dict[str, str | int] = {"status": next_status, "updated_at": utc_now().isoformat()}
+    if verification_status == "approved":
+        await run_blocking(
+            update_user_counters, user_id, ("apple_draw_rights", "purchase_obligation"), partial(grant_draw_right, user_update)
+        )
+    else:
+        await run_blocking(update_user_row, user_id, user_update)
+    invalidate_rtp_cache()
 
+    if verification_status == "rejected":
+        await run_blocking(release_wishlist_assignment, purchase_id)
 
-def extract_title(html: str) -> str | None:
-    match = TITLE_PATTERN.search(html)
-    if not match:
-        return None
-    title = match.group(1).strip()
-    return re.sub(r"\s+", " ", title)
-
-
-def _replace_host(url: str, new_host: str) -> str:
-    parsed = urlparse(url)
-    if not new_host or parsed.netloc == new_host:
-        return url
-    return urlunparse(parsed._replace(netloc=new_host))
-
-
-def _ensure_query_params(url: str, updates: dict[str, str]) -> str:
-    parsed = urlparse(url)
-    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
-    changed = False
-    for key, value in updates.items():
-        if query.get(key) != value:
-            query[key] = value
-            changed = True
-    if not changed:
-        return url
-    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
-
-
-def _ensure_mobile_view(url: str) -> str:
-    return _ensure_query_params(
-        url,
-        {
-            "viewType": "mobile",
-            "sort": "default",
-            "language": "ja_JP",
-        },
-    )
-
-
-def _looks_like_wishlist_html(html: str) -> bool:
-    if not html:
-        return False
-    if WISHLIST_ASIN_PATTERN.search(html):
-        return True
-    if "itemPrice_" in html or "wl-list-item" in html or "g-items" in html:
-        return True
-    return False
-
-
-def _is_robot_block(html: str) -> bool:
-    if not html:
-        return True
-    lowered = html.lower()
-    if "robot check" in lowered or "enter the characters you see below" in lowered:
-        return True
-    if "api-services-support@amazon.com" in lowered:
-        return True
-    return False
-
-
-async def fetch_wishlist_html(url: str) -> str:
-    parsed = urlparse(url)
-    host_variants = [parsed.netloc]
-    if parsed.netloc.endswith(".amazon.jp") and parsed.netloc != "www.amazon.co.jp":
-        host_variants.append("www.amazon.co.jp")
-    if parsed.netloc.endswith(".amazon.com") and parsed.netloc != "www.amazon.com":
-        host_variants.append("www.amazon.com")
-
-    variants: list[tuple[str, dict[str, str], str]] = []
-    seen: set[str] = set()
-    for host in host_variants:
-        base = _replace_host(url, host)
-        for label, transformer, headers in (
-            ("desktop", lambda value: value, AMAZON_DESKTOP_HEADERS),
-            ("mobile", _ensure_mobile_view, AMAZON_MOBILE_HEADERS),
-        ):
-            candidate = transformer(base)
-            if candidate in seen:
-                continue
-            seen.add(candidate)
-            variants.append((candidate, headers, f"{host or parsed.netloc}:{label}"))
-
-    last_error = ""
-    for candidate, headers, label in variants:
-        try:
-            async with httpx.AsyncClient(timeout=10.0, headers=headers, follow_redirects=True) as client:
-                response = await client.get(candidate)
-        except httpx.HTTPError as exc:
-            last_error = f"{label} fetch error: {exc}"
-            continue
-
-        if response.status_code >= 400:
-            last_error = f"{label} HTTP {response.status_code}"
-            continue
-
-        html = response.text
-        if _is_robot_block(html):
-            last_error = f"{label} blocked by Amazon"
-            continue
+    if verification_status in {"approved", "rejected"}:
+        await notify_purchase_status_email(
+            user_email,
+            verification_status,
+            purchase.get("target_item_name"),
+            purchase.get("target_item_price"),
+            verification_reason,
+        )
 
-        if _looks_like_wishlist_html(html):
-            return html
-        last_error = f"{label} unexpected HTML structure"
+    return {"status": verification_status, "message": verification_reason}
 
-    raise HTTPException(
-        status.HTTP_400_BAD_REQUEST,
-        f"欲しいものリストを取得できませんでした。公開設定やURLをご確認ください。({last_error or 'unknown error'})",
-    )
 
+def grant_draw_right(user_update: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+    """An approved purchase: one more draw right and one purchase obligation settled."""
 
-async def fetch_wishlist_snapshot(url: str) -> dict[str, str | int | None]:
-    html = await fetch_wishlist_html(url)
     return {
-        "title": extract_title(html),
-        "price": extract_price_snapshot(html),
+        **user_update,
+        "apple_draw_rights": (current.get("apple_draw_rights") or 0) + 1,
+        "purchase_obligation": max((current.get("purchase_obligation") or 0) - 1, 0),
     }
 
 
-def extract_wishlist_items_summary(html: str) -> dict[str, object]:
-    """Extract wishlist item count and (when possible) a single target item's title/price.
-
-    This is intentionally regex-based to avoid brittle DOM parsing and to work in server environments.
-    """
-
-    asins = list(dict.fromkeys(WISHLIST_ASIN_PATTERN.findall(html)))
-    prices_raw: list[str] = []
-    for pattern in (WISHLIST_ITEM_PRICE_PATTERN, WISHLIST_MOBILE_PRICE_PATTERN):
-        prices_raw.extend(pattern.findall(html))
-    prices = []
-    for raw in prices_raw:
-        try:
-            prices.append(int(raw.replace(",", "")))
-        except ValueError:
-            continue
-
-    item_count = max(len(asins), len(prices))
+PURCHASE_VERIFICATION_COLUMNS = (
+    "id, purchaser_id, status, target_item_name, target_item_price, screenshot_url, "
+    "screenshot_sha256, screenshot_phash, verification_status, verification_result, "
+    "ocr_snapshot, verification_metadata"
+)
 
-    title: str | None = None
-    if len(asins) == 1:
-        target_asin = asins[0]
-        for asin, raw_title in WISHLIST_ASIN_TITLE_PATTERN.findall(html):
-            if asin.upper() == target_asin.upper():
-                title = re.sub(r"\s+", " ", raw_title).strip()
-                break
-    if not title:
-        title = extract_title(html)
-
-    price: int | None = None
-    unique_prices = list(dict.fromkeys(prices))
-    if not unique_prices:
-        fallback_price = extract_price_snapshot(html)
-        if isinstance(fallback_price, int):
-            unique_prices = [fallback_price]
-    unique_in_range = [p for p in unique_prices if 3000 <= p <= 4000]
-    if item_count == 1:
-        if len(unique_in_range) == 1:
-            price = unique_in_range[0]
-        elif len(unique_prices) == 1:
-            # Still return the price so we can show an out-of-range error.
-            price = unique_prices[0]
-        else:
-            price = None
-    else:
-        # For multi-item lists we only care about count; returning a price would be misleading.
-        price = None
-
-    return {
-        "item_count": item_count,
-        "title": title,
-        "price": price,
-        "asins": asins,
-        "prices": unique_prices,
-    }
 
+def fetch_purchase_for_verification(purchase_id: int) -> dict[str, Any] | None:
+    response = (
+        supabase.table("purchases")
+        .select(PURCHASE_VERIFICATION_COLUMNS)
+        .eq("id", purchase_id)
+        .single()
+        .execute()
+    )
+    return response.data
 
-def normalize_ocr_snapshot(snapshot: dict[str, Any]) -> dict[str, Any]:
-    def coerce_price(value: Any) -> int | None:
-        if value is None:
-            return None
-        if isinstance(value, (int, float)):
-            return int(value)
-        if isinstance(value, str):
-            digits = re.sub(r"[^0-9]", "", value)
-            if digits:
-                try:
-                    return int(digits)
-                except ValueError:
-                    return None
-        return None
 
-    def parse_bool_flag(value: Any) -> bool | None:
-        if value is None:
-            return None
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, (int, float)):
-            return bool(int(value))
-        if isinstance(value, str):
-            lowered = value.strip().lower()
-            if lowered in {"true", "1", "yes", "y"}:
-                return True
-            if lowered in {"false", "0", "no", "n"}:
-                return False
-        return None
+async def process_verification_job(job: dict[str, Any]) -> dict[str, str]:
+    """Queue handler: re-read the purchase, run the verification on the OpenAI pool, apply it."""
 
-    item_name = snapshot.get("item_name") or snapshot.get("product") or snapshot.get("detected_item")
-    order_id = snapshot.get("order_id") or snapshot.get("orderNumber") or snapshot.get("order")
-    price = coerce_price(snapshot.get("price") or snapshot.get("detected_price"))
-    confidence_raw = snapshot.get("confidence") or snapshot.get("score")
+    purchase = await run_blocking(fetch_purchase_for_verification, job["purchase_id"])
+    if not purchase:
+        raise RuntimeError(f"purchase {job['purchase_id']} no longer exists")
+    if purchase.get("status") != "submitted":
+        # Decided since the job was queued (by another process's sweep, or an admin).
+        return {"status": purchase.get("status"), "message": purchase.get("verification_result")}
+    screenshot_url = job.get("screenshot_url") or purchase.get("screenshot_url")
     try:
-        confidence = float(confidence_raw)
-    except (TypeError, ValueError):
-        confidence = None
+        verdict = await run_openai(verify_purchase_screenshot, purchase, screenshot_url)
+        result = await apply_verification_result(purchase, job["user_id"], verdict, screenshot_url, job.get("note"))
+    except Exception as exc:
+        await mark_verification_failed(purchase["id"], exc)
+        raise
+    print(f"[PurchaseVerify] Purchase {purchase['id']} -> {result['status']}")
+    return result
 
-    matched_name = parse_bool_flag(snapshot.get("matched_name"))
-    matched_price = parse_bool_flag(snapshot.get("matched_price"))
 
-    return {
-        "item_name": item_name,
-        "order_id": order_id,
-        "price": price,
-        "confidence": confidence,
-        "matched_name": matched_name,
-        "matched_price": matched_price,
-    }
+async def mark_verification_failed(purchase_id: int, error: Exception) -> None:
+    """Hand a purchase whose job crashed to the admins rather than leaving it submitted forever.
 
+    When even this write fails the purchase stays submitted and the next sweep queues it again.
+    """
 
-def interpret_verification_response(raw: str) -> tuple[str, str, dict[str, Any] | None, dict[str, Any] | None]:
     try:
-        payload = json.loads(raw)
-    except json.JSONDecodeError:
-        payload = {}
-
-    decision = str(payload.get("decision", "review")).lower()
-    reason = payload.get("reason") or payload.get("message") or raw
-
-    ocr_snapshot = None
-    raw_ocr = payload.get("ocr") if isinstance(payload, dict) else None
-    if isinstance(raw_ocr, dict):
-        ocr_snapshot = normalize_ocr_snapshot(raw_ocr)
-
-    metadata: dict[str, Any] | None = None
-    if isinstance(payload, dict):
-        filtered = {key: value for key, value in payload.items() if key not in {"ocr", "reason", "message"}}
-        metadata = filtered or None
+        await execute(
+            supabase.table("purchases")
+            .update(
+                {
+                    "status": "review_required",
+                    "verification_status": "review_required",
+                    "verification_result": "自動審査中にエラーが発生したため手動で確認します",
+                    "verification_metadata": {
+                        "evaluated_at": utc_now().isoformat(),
+                        "error": str(error)[:200] or error.__class__.__name__,
+                    },
+                }
+            )
+            .eq("id", purchase_id)
+            .eq("status", "submitted")
+        )
+    except Exception as exc:
+        print(f"[PurchaseVerify] Could not move purchase {purchase_id} to review: {exc}")
 
-    if "approve" in decision:
-        return "approved", reason, ocr_snapshot, metadata
-    if "reject" in decision:
-        return "rejected", reason, ocr_snapshot, metadata
-    return "review_required", reason, ocr_snapshot, metadata
 
+def fetch_unverified_purchases(limit: int) -> list[dict[str, Any]]:
+    response = (
+        supabase.table("purchases")
+        .select("id, purchaser_id, screenshot_url, admin_notes, submitted_at")
+        .eq("status", "submitted")
+        .order("submitted_at", nullsfirst=True)
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
 
-def run_screenshot_verification(
-    screenshot_url: str,
-    item_name: str,
-    price: int,
-) -> tuple[str, str, dict[str, Any] | None, dict[str, Any] | None]:
-    # Clean up URL - remove trailing query parameters that may cause issues with OpenAI
-    screenshot_url = screenshot_url.rstrip("?.")
-    
-    metadata: dict[str, Any] = {
-        "model": "gpt-4o-mini",
-        "evaluated_at": utc_now().isoformat(),
-        "target_item": item_name,
-        "target_price": price,
-    }
 
-    if not openai_client:
-        metadata["skipped"] = True
-        return "review_required", "OpenAI未設定のため自動審査をスキップしました", None, metadata
-
-    prompt = (
-        "以下のスクリーンショットがAmazon購入完了画面で、対象商品が"
-        f"{item_name} であり、価格が概ね ¥{price} であるかを判定してください。\n\n"
-        "必ず JSON 形式で日本語で回答してください。形式: "
-        "{\"decision\": \"APPROVED|REVIEW|REJECT\", \"reason\": \"日本語の理由\", \"ocr\": {\"item_name\": string, \"price\": number, \"order_id\": string, \"confidence\": number, \"matched_name\": boolean, \"matched_price\": boolean}}\n\n"
-        "- decision: APPROVED（承認）、REVIEW（要確認）、REJECT（却下）のいずれか\n"
-        "- reason: 判定理由を日本語で簡潔に記載\n"
-        "- ocr: スクリーンショットから読み取った情報\n\n"
-        "余計な文章や説明は含めず、JSON のみを返してください。"
-    )
+async def requeue_unverified_purchases() -> int:
+    """Queue submitted purchases older than VERIFICATION_SWEEP_MIN_AGE_SECONDS that have no job here."""
 
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたはAmazon購入レシートの厳格な検証者です。指定されたJSON形式でのみ、日本語で応答してください。",
-                },
+    cutoff = utc_now() - timedelta(seconds=VERIFICATION_SWEEP_MIN_AGE_SECONDS)
+    requeued = 0
+    for row in await run_blocking(fetch_unverified_purchases, VERIFICATION_MAX_PENDING):
+        # Rows submitted before submitted_at existed count as stale.
+        if row.get("submitted_at") and parse_timestamp(row["submitted_at"]) > cutoff:
+            continue
+        latest = verification_queue.latest_for_purchase(row["id"])
+        if not row.get("screenshot_url") or (latest and latest["state"] in {"queued", "running"}):
+            continue
+        try:
+            verification_queue.enqueue(
+                row["id"],
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": screenshot_url}},
-                    ],
+                    "purchase_id": row["id"],
+                    "user_id": row["purchaser_id"],
+                    "screenshot_url": row["screenshot_url"],
+                    "note": row.get("admin_notes"),
                 },
-            ],
-        )
-        content = response.choices[0].message.content or ""
-    except Exception as exc:  # pragma: no cover - network failure
-        print(f"[PurchaseVerify] OpenAI error: {exc}")
-        metadata["error"] = str(exc)
-        return "review_required", "OpenAI API エラーのため手動確認が必要です", None, metadata
-
-    decision, reason, ocr_snapshot, raw_metadata = interpret_verification_response(content)
-    if raw_metadata:
-        metadata["llm"] = raw_metadata
-
-    return decision, reason, ocr_snapshot, metadata
-
-
-def build_chatbot_messages(payload: ChatbotRequest, user_id: str | None) -> list[dict[str, str]]:
-    status = payload.status or "guest"
-    status_hint = STATUS_HINTS.get(status, STATUS_HINTS["guest"])
-    context_lines = [
-        f"User ID: {user_id or 'guest'}",
-        f"Status: {status}",
-        f"Status Hint: {status_hint}",
-        f"Email: {payload.user_email or '不明'}",
-    ]
-    user_message = "\n".join(context_lines + ["---", payload.message.strip()])
-    return [
-        {"role": "system", "content": CHATBOT_SYSTEM_PROMPT},
-        {"role": "user", "content": user_message},
-    ]
+            )
+        except QueueFull:
+            break
+        requeued += 1
+    return requeued
 
 
-def extract_chatbot_reply(choice) -> str:
-    message = getattr(choice, "message", None)
-    if message is None:
-        return ""
-    content = getattr(message, "content", "")
-    if isinstance(content, str):
-        return content.strip()
-    if isinstance(content, list):
-        text_parts: list[str] = []
-        for block in content:
-            if isinstance(block, dict):
-                text_parts.append(str(block.get("text", "")))
-            else:
-                text_parts.append(str(block))
-        return "".join(text_parts).strip()
-    return str(content).strip()
+async def sweep_unverified_purchases() -> None:
+    while True:
+        try:
+            requeued = await requeue_unverified_purchases()
+            if requeued:
+                print(f"[PurchaseVerify] Sweep re-queued {requeued} submitted purchase(s)")
+        except Exception as exc:
+            print(f"[PurchaseVerify] Sweep failed: {exc}")
+        await asyncio.sleep(VERIFICATION_SWEEP_INTERVAL_SECONDS)
+
+
+verification_queue = VerificationQueue(
+    process_verification_job,
+    workers=VERIFICATION_WORKERS,
+    max_pending=VERIFICATION_MAX_PENDING,
+)
 
 
-def fallback_chatbot_reply(status: str | None) -> str:
-    return STATUS_FALLBACK_RESPONSES.get(status or "guest", STATUS_FALLBACK_RESPONSES["guest"])
+def public_verification_job(job: dict[str, Any] | None) -> dict[str, Any] | None:
+    if not job:
+        return None
+    return {key: job[key] for key in ("job_id", "state", "created_at", "started_at", "finished_at", "result", "error")}
 
 
 # ---------- Endpoints ----------
@@ -1678,14 +1715,11 @@ def fallback_chatbot_reply(status: str | None) -> str:
 
 @api.post("/api/user/status", tags=["user"])
 async def update_status(payload: StatusUpdateRequest, user_id: str = Depends(get_user_id)) -> dict[str, str]:
-    response = (
-        supabase.table("users")
-        .update({"status": payload.status, **(payload.metadata or {}), "updated_at": utc_now().isoformat()})
-        .eq("id", user_id)
-        .execute()
+    updated = await run_blocking(
+        update_user_row, user_id, {"status": payload.status, **(payload.metadata or {}), "updated_at": utc_now().isoformat()}
     )
 
-    if not response.data:
+    if not updated:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
 
     return {"status": payload.status}
@@ -1693,19 +1727,11 @@ async def update_status(payload: StatusUpdateRequest, user_id: str = Depends(get
 
 @api.get("/api/apple/current", response_model=AppleResponse | None, tags=["apple"])
 async def get_current_apple(user_id: str = Depends(get_user_id)):
-    response = (
-        supabase.table("apples")
-        .select("id, apple_type, draw_time, reveal_time, status")
-        .eq("user_id", user_id)
-        .order("draw_time", desc=True)
-        .limit(1)
-        .execute()
-    )
-
-    if not response.data:
+    rows = await run_blocking(fetch_current_apple_rows, user_id)
+    if not rows:
         return None
 
-    row = response.data[0]
+    row = rows[0]
     return {
         "id": row["id"],
         "apple_type": row["apple_type"],
@@ -1716,21 +1742,10 @@ async def get_current_apple(user_id: str = Depends(get_user_id)):
 
 
 @api.get("/api/apple/probabilities", tags=["apple"])
-async def get_personalized_probabilities(user_id: str = Depends(get_user_id)):
-    user_resp = (
-        supabase.table("users")
-        .select(
-            "referral_count, silver_gold_completed_count, last_silver_gold_completed_at,"
-            "apple_draw_rights, purchase_obligation, purchase_available"
-        )
-        .eq("id", user_id)
-        .single()
-        .execute()
+async def get_personalized_probabilities(user_row: dict[str, Any] = Depends(get_current_user_row)):
+    probabilities, reasons, meta = await run_blocking(
+        calculate_probability_profile, user_row, persist_snapshot=False
     )
-    if not user_resp.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-
-    probabilities, reasons, meta = calculate_probability_profile(user_resp.data, persist_rtp_snapshot=False)
     return {
         "probabilities": probabilities,
         "reasons": reasons,
@@ -1739,22 +1754,11 @@ async def get_personalized_probabilities(user_id: str = Depends(get_user_id)):
 
 
 @api.post("/api/apple/draw", response_model=AppleResponse, tags=["apple"])
-async def draw_apple(payload: DrawRequest, user_id: str = Depends(get_user_id)):
-    user_resp = (
-        supabase.table("users")
-        .select(
-            "apple_draw_rights, referral_count, purchase_obligation, purchase_available,"
-            "silver_gold_completed_count, last_silver_gold_completed_at"
-        )
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-
-    if not user_resp.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-
-    data = user_resp.data
+async def draw_apple(
+    payload: DrawRequest,
+    user_id: str = Depends(get_user_id),
+    data: dict[str, Any] = Depends(get_current_user_row),
+):
     draw_rights = data.get("apple_draw_rights") or 0
     referral_count = data.get("referral_count") or payload.referral_count
 
@@ -1762,7 +1766,7 @@ async def draw_apple(payload: DrawRequest, user_id: str = Depends(get_user_id)):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "りんご抽選権がありません")
 
     data["referral_count"] = referral_count
-    probabilities, _, _ = calculate_probability_profile(data, persist_rtp_snapshot=True)
+    probabilities, _, _ = await run_blocking(calculate_probability_profile, data, persist_snapshot=True)
     items = list(probabilities.items())
     apples, weights = zip(*items)
     apple_type = random.choices(apples, weights=weights, k=1)[0]
@@ -1770,45 +1774,63 @@ async def draw_apple(payload: DrawRequest, user_id: str = Depends(get_user_id)):
     draw_time = utc_now()
     reveal_time = draw_time + timedelta(minutes=10)
 
-    purchase_query = (
+    purchase_query = await execute(
         supabase.table("purchases")
         .select("id, status")
         .eq("purchaser_id", user_id)
         .in_("status", ["submitted", "approved"])
         .order("created_at", desc=True)
         .limit(1)
-        .execute()
     )
     if not purchase_query.data:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "承認済みの購入が必要です")
     purchase_id = purchase_query.data[0]["id"]
 
-    insert_resp = (
-        supabase.table("apples")
-        .insert(
-            {
-                "user_id": user_id,
-                "apple_type": apple_type,
-                "purchase_id": purchase_id,
-                "purchase_obligation": reward["purchase_obligation"],
-                "purchase_available": reward["purchase_available"],
-                "draw_time": draw_time.isoformat(),
-                "reveal_time": reveal_time.isoformat(),
-                "status": "pending",
-            }
-        )
-        .execute()
-    )
+    def take_draw_right(current: dict[str, Any]) -> dict[str, Any] | None:
+        rights = current.get("apple_draw_rights") or 0
+        if rights <= 0:
+            return None
+        return {
+            "apple_draw_rights": rights - 1,
+            "purchase_available": (current.get("purchase_available") or 0) + reward["purchase_available"],
+            "updated_at": draw_time.isoformat(),
+        }
 
+    def return_draw_right(current: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "apple_draw_rights": (current.get("apple_draw_rights") or 0) + 1,
+            "purchase_available": max((current.get("purchase_available") or 0) - reward["purchase_available"], 0),
+            "updated_at": utc_now().isoformat(),
+        }
+
+    # Spend the right before creating the apple, so concurrent draws cannot both use the last one.
+    counters = ("apple_draw_rights", "purchase_available")
+    if not await run_blocking(update_user_counters, user_id, counters, take_draw_right):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "りんご抽選権がありません")
+
+    try:
+        insert_resp = await execute(
+            supabase.table("apples")
+            .insert(
+                {
+                    "user_id": user_id,
+                    "apple_type": apple_type,
+                    "purchase_id": purchase_id,
+                    "purchase_obligation": reward["purchase_obligation"],
+                    "purchase_available": reward["purchase_available"],
+                    "draw_time": draw_time.isoformat(),
+                    "reveal_time": reveal_time.isoformat(),
+                    "status": "pending",
+                }
+            )
+        )
+    except Exception:
+        await run_blocking(update_user_counters, user_id, counters, return_draw_right)
+        raise
     if not insert_resp.data:
+        await run_blocking(update_user_counters, user_id, counters, return_draw_right)
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "りんご生成に失敗しました")
 
-    updated_user = {
-        "apple_draw_rights": draw_rights - 1,
-        "purchase_available": (data.get("purchase_available") or 0) + reward["purchase_available"],
-        "updated_at": draw_time.isoformat(),
-    }
-    supabase.table("users").update(updated_user).eq("id", user_id).execute()
     invalidate_rtp_cache()
 
     apple_row = insert_resp.data[0]
@@ -1823,12 +1845,11 @@ async def draw_apple(payload: DrawRequest, user_id: str = Depends(get_user_id)):
 
 @api.get("/api/apple/result/{apple_id}", tags=["apple"])
 async def get_apple_result(apple_id: int, user_id: str = Depends(get_user_id)):
-    apple_resp = (
+    apple_resp = await execute(
         supabase.table("apples")
         .select("id, user_id, apple_type, draw_time, reveal_time, status, is_revealed, purchase_available, purchase_obligation")
         .eq("id", apple_id)
         .single()
-        .execute()
     )
     if not apple_resp.data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "りんごが見つかりません")
@@ -1839,11 +1860,10 @@ async def get_apple_result(apple_id: int, user_id: str = Depends(get_user_id)):
     now = utc_now()
     reveal_time = parse_timestamp(row.get("reveal_time"))
     if reveal_time and now >= reveal_time and row.get("status") == "pending":
-        update_resp = (
+        update_resp = await execute(
             supabase.table("apples")
             .update({"status": "revealed", "is_revealed": True, "updated_at": now.isoformat()})
             .eq("id", apple_id)
-            .execute()
         )
         if update_resp.data:
             row = update_resp.data[0]
@@ -1862,12 +1882,11 @@ async def get_apple_result(apple_id: int, user_id: str = Depends(get_user_id)):
 
 @api.post("/api/apple/consume/{apple_id}", tags=["apple"])
 async def consume_ticket(apple_id: int, user_id: str = Depends(get_user_id)):
-    apple_resp = (
+    apple_resp = await execute(
         supabase.table("apples")
         .select("id, user_id, apple_type, purchase_available, reveal_time, status")
         .eq("id", apple_id)
         .single()
-        .execute()
     )
     if not apple_resp.data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "りんごが見つかりません")
@@ -1892,59 +1911,51 @@ async def consume_ticket(apple_id: int, user_id: str = Depends(get_user_id)):
         if apple_row.get("status") in {"pending", "revealed"}:
             apple_updates["status"] = "consumed"
 
-    supabase.table("apples").update(apple_updates).eq("id", apple_id).execute()
-
-    user_resp = (
-        supabase.table("users")
-        .select("purchase_available, purchase_obligation, referral_count, silver_gold_completed_count")
-        .eq("id", user_id)
-        .single()
-        .execute()
+    # Only one of two concurrent requests for the same ticket finds the balance it read.
+    claimed = await execute(
+        supabase.table("apples")
+        .update(apple_updates)
+        .eq("id", apple_id)
+        .eq("purchase_available", apple_row["purchase_available"])
     )
-    if not user_resp.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-
-    current_user_available = user_resp.data.get("purchase_available") or 0
-    user_updates: dict[str, object] = {
-        "purchase_available": max(current_user_available - 1, 0),
-        "updated_at": now.isoformat(),
-    }
+    if not claimed.data:
+        raise HTTPException(status.HTTP_409_CONFLICT, "チケットは既に使用されました。画面を更新してください")
 
-    if apple_row["apple_type"] in {"silver", "gold"} and new_available == 0:
-        user_updates["referral_count"] = 0
-        user_updates["silver_gold_completed_count"] = (user_resp.data.get("silver_gold_completed_count") or 0) + 1
-        user_updates["last_silver_gold_completed_at"] = now.isoformat()
+    completes_silver_gold = apple_row["apple_type"] in {"silver", "gold"} and new_available == 0
 
-    supabase.table("users").update(user_updates).eq("id", user_id).execute()
+    def use_ticket(current: dict[str, Any]) -> dict[str, Any]:
+        user_updates: dict[str, Any] = {
+            "purchase_available": max((current.get("purchase_available") or 0) - 1, 0),
+            "updated_at": now.isoformat(),
+        }
+        if completes_silver_gold:
+            user_updates["referral_count"] = 0
+            user_updates["silver_gold_completed_count"] = (current.get("silver_gold_completed_count") or 0) + 1
+            user_updates["last_silver_gold_completed_at"] = now.isoformat()
+        return user_updates
+
+    counters = ("purchase_available", "silver_gold_completed_count")
+    if not await run_blocking(update_user_counters, user_id, counters, use_ticket):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
     invalidate_rtp_cache()
 
     return {"purchase_available": new_available}
 
 
 @api.post("/api/purchase/start", response_model=PurchaseStartResponse, tags=["purchase"])
-async def start_purchase(user_id: str = Depends(get_user_id)):
-    profile = (
-        supabase.table("users")
-        .select("status, email, purchase_obligation")
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    if not profile.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-    if profile.data.get("status") not in {"tutorial_completed", "ready_to_purchase"}:
+async def start_purchase(user_id: str = Depends(get_user_id), profile: dict[str, Any] = Depends(get_current_user_row)):
+    if profile.get("status") not in {"tutorial_completed", "ready_to_purchase"}:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "このステップにはまだ進めません")
 
-    current_obligation = int(profile.data.get("purchase_obligation") or 0)
+    current_obligation = int(profile.get("purchase_obligation") or 0)
 
-    existing_purchase = (
+    existing_purchase = await execute(
         supabase.table("purchases")
         .select("id, target_user_id, target_item_name, target_item_price, target_wishlist_url, status")
         .eq("purchaser_id", user_id)
         .in_("status", ["pending", "submitted"])
         .order("created_at", desc=True)
         .limit(1)
-        .execute()
     )
     if existing_purchase.data:
         purchase = existing_purchase.data[0]
@@ -1956,24 +1967,24 @@ async def start_purchase(user_id: str = Depends(get_user_id)):
             "wishlist_url": purchase.get("target_wishlist_url") or "",
         }
 
-    items = fetch_available_wishlist_items(user_id, limit=20)
+    items = await run_blocking(fetch_available_wishlist_items, user_id, limit=20)
     if not items:
         await seed_wishlist_items_from_users(limit=50, exclude_user_id=user_id)
-        items = fetch_available_wishlist_items(user_id, limit=20)
+        items = await run_blocking(fetch_available_wishlist_items, user_id, limit=20)
     if not items:
-        ensure_mock_wishlist_item(exclude_user_id=user_id)
-        items = fetch_available_wishlist_items(user_id, limit=20)
+        await run_blocking(ensure_mock_wishlist_item, exclude_user_id=user_id)
+        items = await run_blocking(fetch_available_wishlist_items, user_id, limit=20)
     if not items:
         if not ENABLE_MOCK_WISHLIST_SEED:
             raise HTTPException(status.HTTP_400_BAD_REQUEST, "現在割り当て可能な欲しいものリストがありません。少し待ってから再試行してください。")
 
-        purchase = create_mock_purchase(user_id)
+        purchase = await run_blocking(create_mock_purchase, user_id)
         new_obligation = current_obligation + 1
-        supabase.table("users").update({
+        await run_blocking(update_user_row, user_id, {
             "status": "ready_to_purchase",
             "purchase_obligation": new_obligation,
             "updated_at": utc_now().isoformat(),
-        }).eq("id", user_id).execute()
+        })
         return {
             "purchase_id": purchase["id"],
             "alias": build_anonymous_alias(purchase.get("target_user_id")),
@@ -1987,7 +1998,7 @@ async def start_purchase(user_id: str = Depends(get_user_id)):
 
     for item in items:
         item_price = int(item.get("price") or 0)
-        purchase_insert = (
+        purchase_insert = await execute(
             supabase.table("purchases")
             .insert(
                 {
@@ -1999,19 +2010,17 @@ async def start_purchase(user_id: str = Depends(get_user_id)):
                     "status": "pending",
                 }
             )
-            .execute()
         )
 
         if not purchase_insert.data:
             continue
 
         purchase_candidate = purchase_insert.data[0]
-        claim = (
+        claim = await execute(
             supabase.table("wishlist_items")
             .update({"assigned_purchase_id": purchase_candidate["id"]})
             .eq("id", item["id"])
             .is_("assigned_purchase_id", None)
-            .execute()
         )
 
         if claim.data:
@@ -2019,17 +2028,17 @@ async def start_purchase(user_id: str = Depends(get_user_id)):
             purchase = purchase_candidate
             break
 
-        supabase.table("purchases").delete().eq("id", purchase_candidate["id"]).execute()
+        await execute(supabase.table("purchases").delete().eq("id", purchase_candidate["id"]))
 
     if not selected_item or not purchase:
         raise HTTPException(status.HTTP_409_CONFLICT, "他のユーザーが同じリストを取得したため、再試行してください。")
 
     new_obligation = current_obligation + 1
-    supabase.table("users").update({
+    await run_blocking(update_user_row, user_id, {
         "status": "ready_to_purchase",
         "purchase_obligation": new_obligation,
         "updated_at": utc_now().isoformat(),
-    }).eq("id", user_id).execute()
+    })
 
     return {
         "purchase_id": purchase["id"],
@@ -2042,20 +2051,11 @@ async def start_purchase(user_id: str = Depends(get_user_id)):
 
 @api.get("/api/purchase/current", tags=["purchase"])
 async def get_current_purchase(user_id: str = Depends(get_user_id)):
-    response = (
-        supabase.table("purchases")
-        .select("id, target_user_id, target_item_name, target_item_price, target_wishlist_url, status, screenshot_url")
-        .eq("purchaser_id", user_id)
-        .in_("status", ["pending", "submitted"])
-        .order("created_at", desc=True)
-        .limit(1)
-        .execute()
-    )
-
-    if not response.data:
+    rows = await run_blocking(fetch_current_purchase_rows, user_id)
+    if not rows:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "提出待ちの購入が見つかりません")
 
-    purchase = response.data[0]
+    purchase = rows[0]
 
     return {
         "purchase_id": purchase["id"],
@@ -2074,12 +2074,11 @@ async def upload_purchase_screenshot(
     file: UploadFile = File(...),
     user_id: str = Depends(get_user_id),
 ):
-    purchase = (
+    purchase = await execute(
         supabase.table("purchases")
         .select("id, purchaser_id, status")
         .eq("id", purchase_id)
         .single()
-        .execute()
     )
     if not purchase.data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Purchase not found")
@@ -2088,114 +2087,85 @@ async def upload_purchase_screenshot(
     if purchase.data["status"] not in {"pending", "submitted", "review_required"}:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "この購入は提出済みです")
 
-    screenshot_url = await save_screenshot(file, user_id, purchase_id)
+    stored = await save_screenshot(file, user_id, purchase_id)
 
-    supabase.table("purchases").update({"screenshot_url": screenshot_url}).eq("id", purchase_id).execute()
+    await execute(supabase.table("purchases").update(stored).eq("id", purchase_id))
 
-    return {"screenshot_url": screenshot_url}
+    return {"screenshot_url": stored["screenshot_url"], "screenshot_thumbnail_url": stored["screenshot_thumbnail_url"]}
 
 
 @api.post("/api/purchase/verify", tags=["purchase"])
 async def submit_purchase(payload: PurchaseVerifyRequest, user_id: str = Depends(get_user_id)):
-    purchase_resp = (
-        supabase.table("purchases")
-        .select("id, purchaser_id, status, target_item_name, target_item_price, screenshot_url")
-        .eq("id", payload.purchase_id)
-        .single()
-        .execute()
-    )
-    if not purchase_resp.data:
+    purchase = await run_blocking(fetch_purchase_for_verification, payload.purchase_id)
+    if not purchase:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Purchase not found")
-    if purchase_resp.data.get("purchaser_id") != user_id:
+    if purchase.get("purchaser_id") != user_id:
         raise HTTPException(status.HTTP_403_FORBIDDEN, "別のユーザーの購入です")
 
-    screenshot_url = payload.screenshot_url or purchase_resp.data.get("screenshot_url")
+    screenshot_url = payload.screenshot_url or purchase.get("screenshot_url")
     if not screenshot_url:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "スクリーンショットのアップロードが必要です")
 
-    (
-        verification_status,
-        verification_reason,
-        ocr_snapshot,
-        verification_metadata,
-    ) = run_screenshot_verification(
-        screenshot_url,
-        purchase_resp.data.get("target_item_name", ""),
-        purchase_resp.data.get("target_item_price", 0) or 0,
-    )
-
-    if verification_status == "approved":
-        purchase_status = "approved"
-    elif verification_status == "rejected":
-        purchase_status = "rejected"
-    else:
-        purchase_status = "review_required"
-
-    purchase_update = {
-        "status": purchase_status,
-        "screenshot_url": screenshot_url,
-        "admin_notes": payload.note,
-        "verification_status": verification_status,
-        "verification_result": verification_reason,
-        "verified_at": utc_now().isoformat() if verification_status == "approved" else None,
-    }
-    if ocr_snapshot:
-        purchase_update["ocr_snapshot"] = ocr_snapshot
-    if verification_metadata:
-        purchase_update["verification_metadata"] = verification_metadata
-    supabase.table("purchases").update(purchase_update).eq("id", payload.purchase_id).execute()
+    if purchase.get("status") in {"approved", "rejected"} and screenshot_url == purchase.get("screenshot_url"):
+        cached = cached_screenshot_verdict(purchase)
+        if cached:
+            return {"status": cached[0], "message": cached[1]}
 
-    user_snapshot = (
-        supabase.table("users")
-        .select("email, apple_draw_rights, purchase_obligation")
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    current_rights = 0
-    user_email = None
-    if user_snapshot.data:
-        current_rights = user_snapshot.data.get("apple_draw_rights") or 0
-        user_email = user_snapshot.data.get("email")
+    # Persist the submission before queueing it: the job only trusts purchases marked submitted, and a
+    # submission whose job is lost (restart, full queue) is picked up again by the sweep.
+    submitted_at = utc_now().isoformat()
+    await execute(supabase.table("purchases").update(
+        {"status": "submitted", "screenshot_url": screenshot_url, "admin_notes": payload.note, "submitted_at": submitted_at}
+    ).eq("id", payload.purchase_id))
+    await run_blocking(update_user_row, user_id, {"status": "verifying", "updated_at": submitted_at})
 
-    next_status = "first_purchase_completed" if verification_status == "approved" else "verifying"
-    user_update: dict[str, str | int] = {"status": next_status, "updated_at": utc_now().isoformat()}
-    if verification_status == "approved":
-        user_update["apple_draw_rights"] = current_rights + 1
-        current_obligation = (user_snapshot.data or {}).get("purchase_obligation") or 0
-        user_update["purchase_obligation"] = max(current_obligation - 1, 0)
-
-    supabase.table("users").update(user_update).eq("id", user_id).execute()
-    invalidate_rtp_cache()
-
-    if verification_status == "rejected":
-        release_wishlist_assignment(payload.purchase_id)
-
-    if verification_status in {"approved", "rejected"}:
-        await notify_purchase_status_email(
-            user_email,
-            verification_status,
-            purchase_resp.data.get("target_item_name"),
-            purchase_resp.data.get("target_item_price"),
-            verification_reason,
+    try:
+        job = verification_queue.enqueue(
+            payload.purchase_id,
+            {"purchase_id": payload.purchase_id, "user_id": user_id, "screenshot_url": screenshot_url, "note": payload.note},
         )
+    except QueueFull as exc:
+        print(f"[PurchaseVerify] Queue full, leaving purchase {payload.purchase_id} for the sweep: {exc}")
+        return {"status": "verifying", "message": "現在審査が混み合っています。順番に確認しますのでお待ちください。", "job_id": None}
 
-    return {"status": verification_status, "message": verification_reason}
+    return {"status": "verifying", "message": "スクリーンショットを確認しています。", "job_id": job["job_id"]}
 
 
-@api.post("/api/wishlist/register", tags=["wishlist"])
-async def register_wishlist(payload: WishlistRegisterRequest, user_id: str = Depends(get_user_id)):
-    profile = (
-        supabase.table("users")
-        .select("status, wishlist_url, apple_draw_rights")
-        .eq("id", user_id)
+@api.get("/api/purchase/verify/{purchase_id}", tags=["purchase"])
+async def get_purchase_verification(purchase_id: int, user_id: str = Depends(get_user_id)):
+    purchase = await execute(
+        supabase.table("purchases")
+        .select("id, purchaser_id, status, verification_status, verification_result")
+        .eq("id", purchase_id)
         .single()
-        .execute()
     )
-    if not profile.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    if not purchase.data:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Purchase not found")
+    if purchase.data.get("purchaser_id") != user_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "別のユーザーの購入です")
+
+    job = verification_queue.latest_for_purchase(purchase_id)
+    if job:
+        state = job["state"]
+    else:
+        # The job ran in another worker process (or before a restart); the purchase row has the outcome.
+        state = "queued" if purchase.data.get("status") == "submitted" else "completed"
+    return {
+        "purchase_id": purchase_id,
+        "state": state,
+        "status": purchase.data.get("status"),
+        "verification_status": purchase.data.get("verification_status"),
+        "message": purchase.data.get("verification_result"),
+        "job": public_verification_job(job),
+    }
 
-    user_data = profile.data
+
+@api.post("/api/wishlist/register", tags=["wishlist"])
+async def register_wishlist(
+    payload: WishlistRegisterRequest,
+    user_id: str = Depends(get_user_id),
+    user_data: dict[str, Any] = Depends(get_current_user_row),
+):
     if user_data.get("status") != "first_purchase_completed":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "購入承認が完了した後にリストを登録できます。")
     if user_data.get("wishlist_url"):
@@ -2203,8 +2173,7 @@ async def register_wishlist(payload: WishlistRegisterRequest, user_id: str = Dep
 
     normalized_url = normalize_wishlist_url(payload.url)
 
-    html = await fetch_wishlist_html(normalized_url)
-    summary = extract_wishlist_items_summary(html)
+    summary = await fetch_wishlist_summary(normalized_url, refresh=True)
     item_count = int(summary.get("item_count") or 0)
     title = summary.get("title") if isinstance(summary.get("title"), str) else None
     price = summary.get("price") if isinstance(summary.get("price"), int) else None
@@ -2230,24 +2199,21 @@ async def register_wishlist(payload: WishlistRegisterRequest, user_id: str = Dep
     if not title:
         title = "Amazon 欲しいものリスト"
 
-    apple_rights = user_data.get("apple_draw_rights") or 0
-    upsert_wishlist_item(user_id, title, price, normalized_url)
-    update_resp = (
-        supabase.table("users")
-        .update(
-            {
-                "wishlist_url": normalized_url,
-                "wishlist_registered_at": utc_now().isoformat(),
-                "status": "ready_to_draw",
-                "apple_draw_rights": max(apple_rights, 1),
-                "updated_at": utc_now().isoformat(),
-            }
-        )
-        .eq("id", user_id)
-        .execute()
+    await run_blocking(upsert_wishlist_item, user_id, title, price, normalized_url)
+    updated = await run_blocking(
+        update_user_counters,
+        user_id,
+        ("apple_draw_rights",),
+        lambda current: {
+            "wishlist_url": normalized_url,
+            "wishlist_registered_at": utc_now().isoformat(),
+            "status": "ready_to_draw",
+            "apple_draw_rights": max(current.get("apple_draw_rights") or 0, 1),
+            "updated_at": utc_now().isoformat(),
+        },
     )
 
-    if not update_resp.data:
+    if not updated:
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "欲しいものリストの登録に失敗しました")
 
     return {
@@ -2258,21 +2224,17 @@ async def register_wishlist(payload: WishlistRegisterRequest, user_id: str = Dep
     }
 
 
-@api.get("/api/referral/summary", tags=["referral"])
-async def referral_summary(user_id: str = Depends(get_user_id)):
-    user_resp = (
-        supabase.table("users")
-        .select("referral_code, referral_count, referred_by")
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    if not user_resp.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+@api.post("/api/batch/revalidate-wishlists", tags=["system"])
+async def batch_revalidate_wishlists(_: None = Depends(require_configured_cron_token)) -> dict[str, object]:
+    """Re-check the stalest unassigned wishlist items and mark those that no longer qualify."""
 
-    user_data = user_resp.data
+    return await run_wishlist_revalidation()
+
+
+@api.get("/api/referral/summary", tags=["referral"])
+async def referral_summary(user_id: str = Depends(get_user_id), user_data: dict[str, Any] = Depends(get_current_user_row)):
     referral_count = user_data.get("referral_count") or 0
-    code = ensure_referral_code(user_id, user_data.get("referral_code"))
+    code = await run_blocking(ensure_referral_code, user_id, user_data.get("referral_code"))
     thresholds = build_thresholds(referral_count)
     next_threshold = next((value for value in REFERRAL_THRESHOLDS if referral_count < value), None)
     progress_percent = 100.0 if not next_threshold else round(min(referral_count / next_threshold, 1.0) * 100, 2)
@@ -2289,29 +2251,23 @@ async def referral_summary(user_id: str = Depends(get_user_id)):
 
 
 @api.post("/api/referral/claim", tags=["referral"])
-async def claim_referral(payload: ReferralClaimRequest, user_id: str = Depends(get_user_id)):
+async def claim_referral(
+    payload: ReferralClaimRequest,
+    user_id: str = Depends(get_user_id),
+    user_data: dict[str, Any] = Depends(get_current_user_row),
+):
     code = payload.code.strip().upper()
     if not code:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "紹介コードを入力してください")
 
-    user_resp = (
-        supabase.table("users")
-        .select("referred_by")
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    if not user_resp.data:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-    if user_resp.data.get("referred_by"):
+    if user_data.get("referred_by"):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "紹介コードは1回のみ利用できます")
 
-    referrer_resp = (
+    referrer_resp = await execute(
         supabase.table("users")
         .select("id, referral_count")
         .eq("referral_code", code)
         .single()
-        .execute()
     )
     if not referrer_resp.data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "紹介コードが見つかりません")
@@ -2321,11 +2277,13 @@ async def claim_referral(payload: ReferralClaimRequest, user_id: str = Depends(g
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "自分のコードは使用できません")
 
     current_referral_count = referrer_resp.data.get("referral_count") or 0
-    supabase.table("users").update({"referred_by": referrer_id, "updated_at": utc_now().isoformat()}).eq("id", user_id).execute()
-    supabase.table("users").update({"referral_count": current_referral_count + 1, "updated_at": utc_now().isoformat()}).eq("id", referrer_id).execute()
+    await run_blocking(update_user_row, user_id, {"referred_by": referrer_id, "updated_at": utc_now().isoformat()})
+    await run_blocking(
+        update_user_row, referrer_id, {"referral_count": current_referral_count + 1, "updated_at": utc_now().isoformat()}
+    )
 
     try:
-        supabase.table("referrals").insert({"referrer_id": referrer_id, "referred_id": user_id}).execute()
+        await execute(supabase.table("referrals").insert({"referrer_id": referrer_id, "referred_id": user_id}))
     except Exception:
         # best effort logging
         pass
@@ -2335,20 +2293,19 @@ async def claim_referral(payload: ReferralClaimRequest, user_id: str = Depends(g
 
 @api.get("/api/admin/verifications", tags=["admin"])
 async def admin_list_verifications(_: None = Depends(require_admin)):
-    response = (
+    response = await execute(
         supabase.table("purchases")
         .select(
-            "id, purchaser_id, target_user_id, status, verification_status, verification_result, screenshot_url, admin_notes, created_at,"
+            "id, purchaser_id, target_user_id, status, verification_status, verification_result, screenshot_url, screenshot_thumbnail_url, admin_notes, created_at,"
             " verified_at, target_item_name, target_item_price, target_wishlist_url, ocr_snapshot, verification_metadata"
         )
         .in_("status", ["submitted", "review_required"])
         .order("created_at", desc=True)
         .limit(200)
-        .execute()
     )
     rows = response.data or []
     purchase_ids = [row["id"] for row in rows if isinstance(row.get("id"), int)]
-    wishlist_map = fetch_wishlist_assignments(purchase_ids)
+    wishlist_map = await run_blocking(fetch_wishlist_assignments, purchase_ids)
 
     user_ids: set[str] = set()
     for row in rows:
@@ -2363,7 +2320,7 @@ async def admin_list_verifications(_: None = Depends(require_admin)):
         if isinstance(owner_id, str):
             user_ids.add(owner_id)
 
-    emails = fetch_user_emails(user_ids)
+    emails = await run_blocking(fetch_user_emails, user_ids)
 
     for row in rows:
         purchaser_id = row.get("purchaser_id")
@@ -2388,7 +2345,8 @@ async def admin_list_verifications(_: None = Depends(require_admin)):
             }
         else:
             row["wishlist_assignment"] = None
-    return rows
+    # Plain PostgREST JSON, so it is serialized as is instead of being walked by jsonable_encoder first.
+    return ORJSONResponse(rows)
 
 
 @api.post("/api/admin/verifications/{purchase_id}", tags=["admin"])
@@ -2397,12 +2355,11 @@ async def admin_update_verification(
     payload: AdminVerificationUpdate,
     _: None = Depends(require_admin),
 ):
-    purchase_resp = (
+    purchase_resp = await execute(
         supabase.table("purchases")
         .select("id, purchaser_id, status, verification_status, screenshot_url, target_item_name, target_item_price")
         .eq("id", purchase_id)
         .single()
-        .execute()
     )
     if not purchase_resp.data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Purchase not found")
@@ -2412,14 +2369,8 @@ async def admin_update_verification(
     if not purchaser_id:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "purchaser_id is missing")
 
-    user_resp = (
-        supabase.table("users")
-        .select("email, apple_draw_rights, purchase_obligation")
-        .eq("id", purchaser_id)
-        .single()
-        .execute()
-    )
-    if not user_resp.data:
+    purchaser = await run_blocking(fetch_user_row, purchaser_id)
+    if not purchaser:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User profile not found")
 
     now = utc_now()
@@ -2437,8 +2388,6 @@ async def admin_update_verification(
         purchase_update["status"] = "approved"
         purchase_update["verified_at"] = now.isoformat()
         user_update["status"] = "first_purchase_completed"
-        user_update["apple_draw_rights"] = (user_resp.data.get("apple_draw_rights") or 0) + 1
-        user_update["purchase_obligation"] = max((user_resp.data.get("purchase_obligation") or 0) - 1, 0)
         invalidate_cache = True
     elif decision == "rejected":
         purchase_update["status"] = "rejected"
@@ -2447,17 +2396,25 @@ async def admin_update_verification(
         purchase_update["status"] = "review_required"
         user_update["status"] = "verifying"
 
-    supabase.table("purchases").update(purchase_update).eq("id", purchase_id).execute()
-    supabase.table("users").update(user_update).eq("id", purchaser_id).execute()
+    await execute(supabase.table("purchases").update(purchase_update).eq("id", purchase_id))
+    if decision == "approved":
+        await run_blocking(
+            update_user_counters,
+            purchaser_id,
+            ("apple_draw_rights", "purchase_obligation"),
+            partial(grant_draw_right, user_update),
+        )
+    else:
+        await run_blocking(update_user_row, purchaser_id, user_update)
     if invalidate_cache:
         invalidate_rtp_cache()
 
     if decision == "rejected":
-        release_wishlist_assignment(purchase_id)
+        await run_blocking(release_wishlist_assignment, purchase_id)
 
     if decision in {"approved", "rejected"}:
         await notify_purchase_status_email(
-            user_resp.data.get("email") if user_resp.data else None,
+            purchaser.get("email"),
             decision,
             purchase_data.get("target_item_name"),
             purchase_data.get("target_item_price"),
@@ -2469,19 +2426,18 @@ async def admin_update_verification(
 
 @api.get("/api/admin/dashboard", tags=["admin"])
 async def admin_dashboard(_: None = Depends(require_admin)):
-    return get_dashboard_metrics()
+    return ORJSONResponse(await run_blocking(get_dashboard_metrics))
 
 
 @api.get("/api/dashboard", response_model=DashboardResponse, tags=["user"])
 async def dashboard_snapshot(user_id: str = Depends(get_user_id)):
-    profile, apples = fetch_dashboard_snapshot(user_id)
-    pending_resp = (
+    profile, apples = await run_blocking(fetch_dashboard_snapshot, user_id)
+    pending_resp = await execute(
         supabase.table("purchases")
         .select("status, verification_status")
         .eq("purchaser_id", user_id)
         .in_("status", ["pending", "submitted", "review_required"])
         .limit(25)
-        .execute()
     )
     pending_rows = pending_resp.data or []
     purchase_pending = any(
@@ -2516,8 +2472,30 @@ async def dashboard_snapshot(user_id: str = Depends(get_user_id)):
 @api.get("/api/admin/system-metrics", tags=["admin"])
 async def admin_system_metrics(limit: int = 30, _: None = Depends(require_admin)):
     limit = max(1, min(limit, 365))
-    metrics = fetch_recent_system_metrics(limit)
-    return {"metrics": metrics}
+    metrics = await run_blocking(fetch_recent_system_metrics, limit)
+    return {
+        "metrics": metrics,
+        "scraping": {
+            "hosts": amazon_throttle.snapshot(),
+            "wishlist_cache": wishlist_cache.stats(),
+        },
+        "images": image_pipeline.stats(),
+        "verification_queue": verification_queue.stats(),
+        "thread_pools": db.stats(),
+        "data_backend": {"name": DATA_BACKEND, "pool": pg_hot_paths.stats() if pg_hot_paths else None},
+    }
+
+
+@api.get("/api/admin/slow-queries", tags=["admin"])
+async def admin_slow_queries(limit: int = 20, _: None = Depends(require_admin)):
+    """Query shapes by total time spent, plus the slowest recent individual queries."""
+
+    limit = max(1, min(limit, 100))
+    return {
+        "slow_query_ms": query_tracer.slow_ms,
+        "top_offenders": query_tracer.top_offenders(limit),
+        "slowest_recent": query_tracer.slowest(limit),
+    }
 
 
 @api.get("/api/admin/users", tags=["admin"])
@@ -2542,7 +2520,7 @@ async def admin_list_users(
         pattern = f"%{safe}%"
         query = query.or_(f"email.ilike.{pattern},referral_code.ilike.{pattern}")
 
-    response = query.execute()
+    response = await execute(query)
     rows = response.data or []
 
     return {
@@ -2558,42 +2536,29 @@ async def admin_update_user(user_id: str, payload: AdminUserUpdate, _: None = De
     if not updates:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "更新するフィールドが指定されていません")
 
-    user_exists = supabase.table("users").select("id").eq("id", user_id).single().execute()
-    if not user_exists.data:
+    if not await run_blocking(fetch_user_row, user_id):
         raise HTTPException(status.HTTP_404_NOT_FOUND, "ユーザーが見つかりません")
 
     updates["updated_at"] = utc_now().isoformat()
-    supabase.table("users").update(updates).eq("id", user_id).execute()
+    await run_blocking(update_user_row, user_id, updates)
 
-    updated = (
-        supabase.table("users")
-        .select(
-            "id,email,status,referral_code,referral_count,silver_gold_completed_count,apple_draw_rights,purchase_obligation,purchase_available,wishlist_url,created_at,updated_at"
-        )
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-
-    return updated.data
+    # Served from the written-through row, no second select.
+    updated = await run_blocking(fetch_user_row, user_id) or {}
+    fields = (
+        "id,email,status,referral_code,referral_count,silver_gold_completed_count,apple_draw_rights,purchase_obligation,purchase_available,wishlist_url,created_at,updated_at"
+    ).split(",")
+    return {field: updated.get(field) for field in fields}
 
 
 @api.post("/api/admin/users/{user_id}/grant-red-apple", tags=["admin"])
 async def admin_grant_red_apple(user_id: str, _: None = Depends(require_admin)):
-    user_resp = (
-        supabase.table("users")
-        .select("id, email, status, wishlist_url, purchase_obligation, purchase_available")
-        .eq("id", user_id)
-        .single()
-        .execute()
-    )
-    if not user_resp.data:
+    user_data = await run_blocking(fetch_user_row, user_id)
+    if not user_data:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "ユーザーが見つかりません")
 
-    user_data = user_resp.data
     now = utc_now()
 
-    purchase_resp = (
+    purchase_resp = await execute(
         supabase.table("purchases")
         .insert(
             {
@@ -2610,7 +2575,6 @@ async def admin_grant_red_apple(user_id: str, _: None = Depends(require_admin)):
                 "verified_at": now.isoformat(),
             }
         )
-        .execute()
     )
 
     if not purchase_resp.data:
@@ -2619,7 +2583,7 @@ async def admin_grant_red_apple(user_id: str, _: None = Depends(require_admin)):
     purchase_id = purchase_resp.data[0]["id"]
     reward = APPLE_REWARDS["red"]
 
-    apple_resp = (
+    apple_resp = await execute(
         supabase.table("apples")
         .insert(
             {
@@ -2635,20 +2599,24 @@ async def admin_grant_red_apple(user_id: str, _: None = Depends(require_admin)):
                 "is_consumed": False,
             }
         )
-        .execute()
     )
 
     if not apple_resp.data:
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "りんごレコードの作成に失敗しました")
 
-    user_update: dict[str, object] = {
-        "purchase_available": (user_data.get("purchase_available") or 0) + reward["purchase_available"],
-        "updated_at": now.isoformat(),
-    }
+    user_update: dict[str, object] = {"updated_at": now.isoformat()}
     if user_data.get("status") not in {"ready_to_draw", "active"}:
         user_update["status"] = "ready_to_draw"
 
-    supabase.table("users").update(user_update).eq("id", user_id).execute()
+    await run_blocking(
+        update_user_counters,
+        user_id,
+        ("purchase_available",),
+        lambda current: {
+            **user_update,
+            "purchase_available": (current.get("purchase_available") or 0) + reward["purchase_available"],
+        },
+    )
     invalidate_rtp_cache()
 
     return {"apple": apple_resp.data[0]}
@@ -2656,19 +2624,5 @@ async def admin_grant_red_apple(user_id: str, _: None = Depends(require_admin)):
 
 @api.post("/api/chatbot", response_model=ChatbotResponse, tags=["chatbot"])
 async def chatbot_reply(payload: ChatbotRequest, user_id: str | None = Depends(get_optional_user_id)):
-    if openai_client is None:
-        return {"reply": fallback_chatbot_reply(payload.status)}
-
-    try:
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=build_chatbot_messages(payload, user_id),
-            temperature=0.4,
-            max_tokens=400,
-        )
-        reply_text = extract_chatbot_reply(completion.choices[0]) or fallback_chatbot_reply(payload.status)
-    except Exception as exc:  # pragma: no cover - network failure path
-        print(f"[Chatbot] OpenAI error: {exc}")
-        reply_text = fallback_chatbot_reply(payload.status)
-
+    reply_text = await generate_chatbot_reply(payload.message, payload.status, payload.user_email, user_id)
     return {"reply": reply_text}
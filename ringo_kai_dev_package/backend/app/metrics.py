@@ -0,0 +1,158 @@
+"""In-process request, database and outbound HTTP metrics in Prometheus text format.
+
+Counters live in this process only (one registry per worker); scrape every worker or run a single
+one behind the scraper. Request latency is keyed by the route template (``/api/purchase/verify/{purchase_id}``),
+never the raw path, so label cardinality stays bounded.
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Any, Iterable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Database calls per request; the tail shows the N+1 patterns.
+CALL_COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{_format_number(bound)}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {_format_number(self.sum)}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._request_seconds: dict[tuple[str, str], Histogram] = {}
+            self._request_db_calls: dict[tuple[str, str], Histogram] = {}
+            self._responses: dict[tuple[str, str, str], int] = {}
+            self._db: dict[tuple[str, str], list[float]] = {}
+            self._http: dict[tuple[str, str], list[float]] = {}
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, db_calls: int) -> None:
+        key = (method, route)
+        with self._lock:
+            histogram = self._request_seconds.get(key)
+            if histogram is None:
+                histogram = self._request_seconds[key] = Histogram(LATENCY_BUCKETS)
+                self._request_db_calls[key] = Histogram(CALL_COUNT_BUCKETS)
+            histogram.observe(seconds)
+            self._request_db_calls[key].observe(db_calls)
+            status_key = (method, route, str(status_code))
+            self._responses[status_key] = self._responses.get(status_key, 0) + 1
+
+    def observe_db(self, table: str, operation: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._db.setdefault((table, operation), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def observe_http(self, service: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            entry = self._http.setdefault((service, "error" if error else "ok"), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            lines += [
+                "# HELP ringo_http_request_duration_seconds Request latency by route template.",
+                "# TYPE ringo_http_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self._request_seconds.items()):
+                lines += histogram.samples("ringo_http_request_duration_seconds", _labels(method=method, route=route))
+            lines += [
+                "# HELP ringo_http_request_db_calls Database calls made while serving one request.",
+                "# TYPE ringo_http_request_db_calls histogram",
+            ]
+            for (method, route), histogram in sorted(self._request_db_calls.items()):
+                lines += histogram.samples("ringo_http_request_db_calls", _labels(method=method, route=route))
+            lines += [
+                "# HELP ringo_http_responses_total Responses by route template and status code.",
+                "# TYPE ringo_http_responses_total counter",
+            ]
+            for (method, route, code), count in sorted(self._responses.items()):
+                lines.append(f"ringo_http_responses_total{{{_labels(method=method, route=route, status=code)}}} {count}")
+            lines += [
+                "# HELP ringo_db_calls_total Database calls by table and operation.",
+                "# TYPE ringo_db_calls_total counter",
+                "# HELP ringo_db_call_seconds_total Time spent in database calls by table and operation.",
+                "# TYPE ringo_db_call_seconds_total counter",
+            ]
+            for (table, operation), (count, seconds) in sorted(self._db.items()):
+                labels = _labels(table=table, operation=operation)
+                lines.append(f"ringo_db_calls_total{{{labels}}} {int(count)}")
+                lines.append(f"ringo_db_call_seconds_total{{{labels}}} {_format_number(seconds)}")
+            lines += [
+                "# HELP ringo_outbound_http_calls_total Outbound HTTP calls by service and outcome.",
+                "# TYPE ringo_outbound_http_calls_total counter",
+                "# HELP ringo_outbound_http_seconds_total Time spent in outbound HTTP calls by service and outcome.",
+                "# TYPE ringo_outbound_http_seconds_total counter",
+            ]
+            for (service, outcome), (count, seconds) in sorted(self._http.items()):
+                labels = _labels(service=service, outcome=outcome)
+                lines.append(f"ringo_outbound_http_calls_total{{{labels}}} {int(count)}")
+                lines.append(f"ringo_outbound_http_seconds_total{{{labels}}} {_format_number(seconds)}")
+        return "\n".join(lines) + "\n"
+
+
+def server_timing(total_seconds: float, db_ops: dict[tuple[str, str], list[float]], http_calls: dict[str, list[float]]) -> str:
+    """``Server-Timing`` value: the whole request, all database calls, then one entry per table/operation and service."""
+
+    db_count = sum(int(count) for count, _ in db_ops.values())
+    db_seconds = sum(seconds for _, seconds in db_ops.values())
+    entries = [
+        f"app;dur={total_seconds * 1000:.1f}",
+        f'db;dur={db_seconds * 1000:.1f};desc="{db_count} calls"',
+    ]
+    for (table, operation), (count, seconds) in sorted(db_ops.items()):
+        entries.append(f'db.{_token(table)}.{operation};dur={seconds * 1000:.1f};desc="{int(count)}"')
+    for service, (count, seconds) in sorted(http_calls.items()):
+        entries.append(f'http.{_token(service)};dur={seconds * 1000:.1f};desc="{int(count)}"')
+    return ", ".join(entries)
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _token(value: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in value)
+
+
+def _format_number(value: Any) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,163 @@
+"""Direct Postgres access (psycopg connection pool, prepared statements) for the hottest read paths.
+
+Enabled with DATA_BACKEND=postgres; everything else keeps going through PostgREST. Rows are
+returned in the shape PostgREST would produce (ISO timestamps, string UUIDs), so callers do not
+care which backend answered.
+
+Prepared statements need a session-level connection: point SUPABASE_DB_URL at the direct database
+port (5432) or the session pooler, or set PG_PREPARED_STATEMENTS=false behind the transaction
+pooler (6543).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Iterable
+
+try:
+    from psycopg import sql
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # pragma: no cover - optional dependency
+    ConnectionPool = None  # type: ignore[assignment]
+
+from .db import record_db_call
+
+PG_POOL_MIN_SIZE = int(os.environ.get("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.environ.get("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT_SECONDS = float(os.environ.get("PG_POOL_TIMEOUT_SECONDS", "5"))
+PG_PREPARED_STATEMENTS = os.environ.get("PG_PREPARED_STATEMENTS", "true").lower() in {"1", "true", "yes"}
+
+CURRENT_APPLE_SQL = """
+    SELECT id, apple_type, draw_time, reveal_time, status
+    FROM apples
+    WHERE user_id = %s
+    ORDER BY draw_time DESC
+    LIMIT 1
+"""
+CURRENT_PURCHASE_SQL = """
+    SELECT id, target_user_id, target_item_name, target_item_price, target_wishlist_url, status, screenshot_url
+    FROM purchases
+    WHERE purchaser_id = %s AND status IN ('pending', 'submitted')
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+AVAILABLE_WISHLIST_ITEMS_SQL = """
+    SELECT id, user_id, title, price, url, assigned_purchase_id
+    FROM wishlist_items
+    WHERE user_id <> %s AND assigned_purchase_id IS NULL AND is_eligible
+    ORDER BY created_at
+    LIMIT %s
+"""
+PURCHASE_BALANCES_SQL = """
+    SELECT COALESCE(SUM(purchase_obligation), 0)::bigint AS total_obligation,
+           COALESCE(SUM(purchase_available), 0)::bigint AS total_available
+    FROM users
+"""
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        text = value.isoformat()
+        if value.microsecond:
+            # Postgres JSON (and so PostgREST) drops trailing zeros from the fractional seconds.
+            text = text[:26].rstrip("0") + text[26:]
+        return text
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _row(row: dict[str, Any] | None) -> dict[str, Any] | None:
+    return {key: _jsonable(value) for key, value in row.items()} if row else None
+
+
+class PostgresHotPaths:
+    """The handful of per-request queries that dominate traffic, served from a psycopg pool."""
+
+    def __init__(
+        self,
+        conninfo: str,
+        *,
+        min_size: int = PG_POOL_MIN_SIZE,
+        max_size: int = PG_POOL_MAX_SIZE,
+        timeout: float = PG_POOL_TIMEOUT_SECONDS,
+        prepare: bool = PG_PREPARED_STATEMENTS,
+    ) -> None:
+        if ConnectionPool is None:
+            raise RuntimeError("DATA_BACKEND=postgres requires psycopg-pool (pip install psycopg-pool).")
+        self.prepare = prepare
+        self._user_queries: dict[tuple[str, ...], Any] = {}
+        self._pool = ConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max(max_size, min_size),
+            timeout=timeout,
+            kwargs={"autocommit": True, "row_factory": dict_row},
+            open=False,
+            name="hot-paths",
+        )
+
+    def open(self) -> None:
+        self._pool.open()
+
+    def wait(self, timeout: float) -> None:
+        """Block until the pool holds its minimum connections (raises psycopg_pool.PoolTimeout)."""
+
+        self._pool.wait(timeout=timeout)
+
+    def ping(self, timeout: float) -> None:
+        with self._pool.connection(timeout=timeout) as conn:
+            conn.execute("SELECT 1")
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def _fetch(self, table: str, query: Any, params: Iterable[Any]) -> list[dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            with self._pool.connection() as conn:
+                rows = conn.execute(query, tuple(params), prepare=self.prepare).fetchall()
+        finally:
+            record_db_call(table, "select", time.perf_counter() - started)
+        return [_row(row) for row in rows]
+
+    def _user_query(self, columns: tuple[str, ...]) -> Any:
+        query = self._user_queries.get(columns)
+        if query is None:
+            selected = sql.SQL(", ").join(sql.Identifier(column) for column in columns) if columns else sql.SQL("*")
+            query = sql.SQL("SELECT {} FROM users WHERE id = %s").format(selected)
+            self._user_queries[columns] = query
+        return query
+
+    def fetch_user(self, user_id: str, columns: tuple[str, ...] = ()) -> dict[str, Any] | None:
+        """The user row, or only ``columns`` of it."""
+
+        rows = self._fetch("users", self._user_query(columns), (user_id,))
+        return rows[0] if rows else None
+
+    def current_apple(self, user_id: str) -> list[dict[str, Any]]:
+        return self._fetch("apples", CURRENT_APPLE_SQL, (user_id,))
+
+    def current_purchase(self, user_id: str) -> list[dict[str, Any]]:
+        return self._fetch("purchases", CURRENT_PURCHASE_SQL, (user_id,))
+
+    def available_wishlist_items(self, user_id: str, limit: int) -> list[dict[str, Any]]:
+        return self._fetch("wishlist_items", AVAILABLE_WISHLIST_ITEMS_SQL, (user_id, limit))
+
+    def purchase_balances(self) -> tuple[int, int]:
+        row = self._fetch("users", PURCHASE_BALANCES_SQL, ())[0]
+        return int(row["total_obligation"]), int(row["total_available"])
+
+    def stats(self) -> dict[str, int]:
+        return {key: int(value) for key, value in self._pool.get_stats().items()}
@@ -0,0 +1,201 @@
+"""Per-query tracing for the Supabase client: optional query log, slow-query log and top offenders.
+
+:class:`~.db.CountingClient` hands every ``execute()`` to :data:`tracer` with the builder calls that
+produced it. Queries are grouped by *shape* (table, operation, filter columns, order, paging; no
+values), so ``in_("id", [...])`` lookups with different ids aggregate into one offender.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Iterable
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "250"))
+# Log every query, not only slow ones. Noisy; meant for local debugging.
+QUERY_LOG = os.environ.get("QUERY_LOG", "false").lower() in {"1", "true", "yes"}
+# How many slow queries are kept for /api/admin/slow-queries.
+QUERY_TRACE_BUFFER = int(os.environ.get("QUERY_TRACE_BUFFER", "200"))
+
+Step = tuple[str, tuple[Any, ...], dict[str, Any]]
+
+_FILTER_OPERATORS = {
+    "eq": "=",
+    "neq": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "like": "like",
+    "ilike": "ilike",
+    "is_": "is",
+    "in_": "in",
+    "contains": "contains",
+    "contained_by": "contained by",
+    "match": "match",
+}
+_WRITE_OPERATIONS = {"insert", "update", "upsert"}
+
+
+def _value(value: Any) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"({len(value)} values)"
+    text = str(value)
+    return text if len(text) <= 40 else text[:37] + "..."
+
+
+def describe(steps: Iterable[Step]) -> dict[str, Any]:
+    """Filters, ordering and paging of a builder chain, with and without values."""
+
+    filters: list[str] = []
+    shape: list[str] = []
+    columns = None
+    paging: dict[str, Any] = {}
+    negate = False
+    for name, args, kwargs in steps:
+        prefix = "not " if negate else ""
+        if name == "not_":
+            negate = True
+            continue
+        negate = False
+        if name == "select":
+            columns = ",".join(str(arg) for arg in args) or "*"
+        elif name in _FILTER_OPERATORS and args:
+            operator = _FILTER_OPERATORS[name]
+            value = f" {_value(args[1])}" if len(args) > 1 else ""
+            filters.append(f"{prefix}{args[0]} {operator}{value}")
+            shape.append(f"{prefix}{args[0]} {operator}")
+        elif name == "filter" and len(args) >= 2:
+            filters.append(f"{prefix}{args[0]} {args[1]} {_value(args[2]) if len(args) > 2 else ''}".rstrip())
+            shape.append(f"{prefix}{args[0]} {args[1]}")
+        elif name == "or_":
+            filters.append(f"{prefix}or({_value(args[0]) if args else ''})")
+            shape.append(f"{prefix}or(...)")
+        elif name == "order" and args:
+            paging["order"] = f"{args[0]} desc" if kwargs.get("desc") else str(args[0])
+            shape.append(f"order {paging['order']}")
+        elif name == "range" and len(args) >= 2:
+            paging["range"] = [args[0], args[1]]
+            shape.append("range")
+        elif name == "limit" and args:
+            paging["limit"] = args[0]
+            shape.append("limit")
+        elif name in {"single", "maybe_single"}:
+            shape.append(name)
+    return {"columns": columns, "filters": filters, "paging": paging, "shape": ", ".join(shape)}
+
+
+def _payload_bytes(data: Any) -> int:
+    if data is None:
+        return 0
+    return len(json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode())
+
+
+def _row_count(data: Any) -> int:
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+
+class QueryTracer:
+    def __init__(self, *, slow_ms: float = SLOW_QUERY_MS, buffer_size: int = QUERY_TRACE_BUFFER, log_all: bool = QUERY_LOG) -> None:
+        self.slow_ms = slow_ms
+        self.log_all = log_all
+        self._lock = threading.Lock()
+        self._slow: deque[dict[str, Any]] = deque(maxlen=max(buffer_size, 1))
+        self._shapes: dict[tuple[str, str, str], dict[str, Any]] = {}
+
+    def record(
+        self,
+        table: str,
+        operation: str,
+        steps: Iterable[Step],
+        seconds: float,
+        response: Any = None,
+        error: BaseException | None = None,
+    ) -> dict[str, Any]:
+        steps = list(steps)
+        description = describe(steps)
+        data = getattr(response, "data", None)
+        request_body = next((args[0] for name, args, _ in steps if name in _WRITE_OPERATIONS and args), None)
+        duration_ms = seconds * 1000
+        trace = {
+            "table": table,
+            "operation": operation,
+            **description,
+            "rows": _row_count(data),
+            "count": getattr(response, "count", None),
+            "request_bytes": _payload_bytes(request_body),
+            "response_bytes": _payload_bytes(data),
+            "duration_ms": round(duration_ms, 2),
+            "error": str(error) if error else None,
+            "at": time.time(),
+        }
+        slow = duration_ms >= self.slow_ms
+        with self._lock:
+            key = (table, operation, description["shape"])
+            entry = self._shapes.get(key)
+            if entry is None:
+                entry = self._shapes[key] = {
+                    "table": table,
+                    "operation": operation,
+                    "shape": description["shape"],
+                    "calls": 0,
+                    "slow_calls": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "response_bytes": 0,
+                }
+            entry["calls"] += 1
+            entry["slow_calls"] += int(slow)
+            entry["errors"] += int(error is not None)
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["rows"] += trace["rows"]
+            entry["response_bytes"] += trace["response_bytes"]
+            if slow:
+                self._slow.append(trace)
+        if slow:
+            print(f"[SlowQuery] {self.format(trace)}")
+        elif self.log_all:
+            print(f"[Query] {self.format(trace)}")
+        return trace
+
+    @staticmethod
+    def format(trace: dict[str, Any]) -> str:
+        parts = [trace["table"], trace["operation"]]
+        if trace["filters"]:
+            parts.append("where " + " and ".join(trace["filters"]))
+        parts += [f"{key}={value}" for key, value in trace["paging"].items()]
+        parts.append(f"rows={trace['rows']} bytes={trace['response_bytes']} {trace['duration_ms']:.1f}ms")
+        if trace["error"]:
+            parts.append(f"error={trace['error']}")
+        return " ".join(parts)
+
+    def slowest(self, limit: int = 20) -> list[dict[str, Any]]:
+        with self._lock:
+            traces = list(self._slow)
+        return sorted(traces, key=lambda trace: trace["duration_ms"], reverse=True)[:limit]
+
+    def top_offenders(self, limit: int = 20) -> list[dict[str, Any]]:
+        with self._lock:
+            entries = [dict(entry) for entry in self._shapes.values()]
+        entries.sort(key=lambda entry: entry["total_ms"], reverse=True)
+        for entry in entries:
+            entry["mean_ms"] = round(entry["total_ms"] / entry["calls"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        return entries[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._slow.clear()
+            self._shapes.clear()
+
+
+tracer = QueryTracer()
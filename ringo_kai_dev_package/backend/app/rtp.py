@@ -0,0 +1,223 @@
+"""Probability tables and RTP rules for the apple draw.
+
+Everything here is a pure function of its arguments: the inputs that come from the database
+(referral and completion counts, user totals, the cached RTP) are looked up by app.main, which
+also persists the RTP snapshots. Scripts and benchmarks can import this module without building
+the API or any client.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import Dict
+
+BOOTSTRAP_DAYS = int(os.environ.get("BOOTSTRAP_DAYS", "30"))
+MIN_DYNAMIC_USERS = int(os.environ.get("MIN_DYNAMIC_USERS", "100"))
+RTP_VARIANCE_THRESHOLD = float(os.environ.get("RTP_VARIANCE_THRESHOLD", "0.2"))
+REFERRAL_THRESHOLDS = [3, 5, 10, 20, 30]
+
+
+BOOTSTRAP_PROBABILITY_TABLE = [
+    {
+        "max": 0,
+        "values": {"bronze": 0.55, "silver": 0.20, "gold": 0.12, "red": 0.03, "poison": 0.10},
+    },
+    {
+        "max": 1,
+        "values": {"bronze": 0.52, "silver": 0.22, "gold": 0.14, "red": 0.04, "poison": 0.08},
+    },
+    {
+        "max": 2,
+        "values": {"bronze": 0.49, "silver": 0.24, "gold": 0.16, "red": 0.05, "poison": 0.06},
+    },
+    {
+        "max": math.inf,
+        "values": {"bronze": 0.46, "silver": 0.26, "gold": 0.18, "red": 0.06, "poison": 0.04},
+    },
+]
+
+
+STRICT_REFERRAL_PROBABILITY_TABLE = [
+    {
+        "max": 0,
+        "values": {"bronze": 0.60, "silver": 0.18, "gold": 0.10, "red": 0.02, "poison": 0.10},
+    },
+    {
+        "max": 3,
+        "values": {"bronze": 0.58, "silver": 0.18, "gold": 0.10, "red": 0.02, "poison": 0.12},
+    },
+    {
+        "max": 5,
+        "values": {"bronze": 0.56, "silver": 0.19, "gold": 0.11, "red": 0.03, "poison": 0.11},
+    },
+    {
+        "max": 10,
+        "values": {"bronze": 0.50, "silver": 0.22, "gold": 0.14, "red": 0.04, "poison": 0.10},
+    },
+    {
+        "max": 20,
+        "values": {"bronze": 0.45, "silver": 0.25, "gold": 0.17, "red": 0.05, "poison": 0.08},
+    },
+    {
+        "max": math.inf,
+        "values": {"bronze": 0.40, "silver": 0.28, "gold": 0.20, "red": 0.07, "poison": 0.05},
+    },
+]
+
+
+def select_probability_row(referral_count: int, table: list[dict[str, object]]) -> Dict[str, float]:
+    rc = max(referral_count, 0)
+    for row in table:
+        if rc <= row["max"]:
+            return {**row["values"]}
+    return {**table[-1]["values"]}
+
+
+def get_bootstrap_probabilities(referral_count: int) -> Dict[str, float]:
+    return select_probability_row(referral_count, BOOTSTRAP_PROBABILITY_TABLE)
+
+
+def get_referral_probabilities(referral_count: int) -> Dict[str, float]:
+    return select_probability_row(referral_count, STRICT_REFERRAL_PROBABILITY_TABLE)
+
+
+def get_next_referral_threshold(referral_count: int) -> int | None:
+    for threshold in (3, 5, 10, 20):
+        if referral_count < threshold:
+            return threshold
+    return None
+
+
+APPLE_REWARDS = {
+    "bronze": {"purchase_obligation": 0, "purchase_available": 1},
+    "silver": {"purchase_obligation": 0, "purchase_available": 2},
+    "gold": {"purchase_obligation": 0, "purchase_available": 3},
+    "red": {"purchase_obligation": 0, "purchase_available": 10},
+    "poison": {"purchase_obligation": 0, "purchase_available": 0},
+}
+
+
+def build_thresholds(referral_count: int) -> list[dict[str, str | int]]:
+    stages: list[dict[str, str | int]] = []
+    first_pending_set = False
+    for amount in REFERRAL_THRESHOLDS:
+        if referral_count >= amount:
+            status = "completed"
+        elif not first_pending_set:
+            status = "active"
+            first_pending_set = True
+        else:
+            status = "locked"
+        stages.append({"count": amount, "status": status})
+    if not first_pending_set:
+        # all completed
+        stages = [{**stage, "status": "completed"} for stage in stages]
+    return stages
+
+
+def should_use_bootstrap_probabilities(days_since_launch: int, total_users: int, rtp: float) -> tuple[bool, list[str]]:
+    reasons: list[str] = []
+    if days_since_launch < BOOTSTRAP_DAYS:
+        reasons.append(
+            f"リリースから {days_since_launch} 日のため、安定期間({BOOTSTRAP_DAYS}日)を優先して固定確率を使用しています。"
+        )
+        return True, reasons
+    if total_users < MIN_DYNAMIC_USERS:
+        reasons.append(
+            f"登録ユーザーが {total_users} 人のため、{MIN_DYNAMIC_USERS} 人に達するまでは固定確率で運用します。"
+        )
+        return True, reasons
+    if rtp <= 0:
+        return True, ["RTP が計算できなかったため暫定の固定確率を使用します。"]
+    if abs(1 - rtp) > RTP_VARIANCE_THRESHOLD:
+        reasons.append(
+            f"RTP の変動幅が {abs(1 - rtp):.2f} と大きいため、一時的に固定確率へフォールバックしています。"
+        )
+        return True, reasons
+    return False, reasons
+
+
+def apply_last_silver_gold_adjustment(probabilities: Dict[str, float], days_since: int | None) -> tuple[Dict[str, float], str | None]:
+    if days_since is None:
+        return probabilities, None
+
+    adjustment: tuple[float, float, str] | None = None
+    if days_since < 7:
+        adjustment = (0.3, 0.3, "直近7日以内にシルバー/ゴールドを完了しているため、確率を大幅に抑制しています。")
+    elif days_since < 14:
+        adjustment = (0.5, 0.2, "直近14日以内にシルバー/ゴールドを完了しているため、確率を抑制しています。")
+    elif days_since < 30:
+        adjustment = (0.8, 0.1, "直近30日以内にシルバー/ゴールドを完了しているため、わずかに確率を調整しています。")
+
+    if not adjustment:
+        return probabilities, None
+
+    factor, poison_delta, message = adjustment
+    probabilities = probabilities.copy()
+    probabilities["silver"] *= factor
+    probabilities["gold"] *= factor
+    probabilities["red"] *= factor
+    probabilities["poison"] = max(probabilities.get("poison", 0) + poison_delta, 0.01)
+    probabilities = normalize_probabilities(probabilities)
+
+    return probabilities, message
+
+
+def apply_completion_adjustment(probabilities: Dict[str, float], completion_count: int) -> tuple[Dict[str, float], str | None]:
+    if completion_count <= 0:
+        return probabilities, None
+
+    adjustments = {
+        1: (0.7, 0.15, "シルバー/ゴールドを1回完了しているため、次回の上位りんご確率を少し抑えています。"),
+        2: (0.5, 0.25, "シルバー/ゴールドを2回完了しているため、確率を大きく抑えています。"),
+    }
+    factor, poison_delta, message = adjustments.get(
+        completion_count,
+        (0.3, 0.35, "シルバー/ゴールドを複数回完了しているため、しばらく確率を厳しくしています。"),
+    )
+
+    probabilities = probabilities.copy()
+    probabilities["silver"] *= factor
+    probabilities["gold"] *= factor
+    probabilities["red"] *= factor
+    probabilities["poison"] = max(probabilities.get("poison", 0) + poison_delta, 0.01)
+    probabilities = normalize_probabilities(probabilities)
+
+    return probabilities, message
+
+
+def calculate_predictive_rtp(current_rtp: float, new_users: int, total_users: int) -> float:
+    if total_users <= 0 or new_users <= 0:
+        return current_rtp
+    growth_rate = new_users / total_users
+    if growth_rate <= 0:
+        return current_rtp
+    return current_rtp / (1.0 + growth_rate)
+
+
+def normalize_probabilities(probabilities: Dict[str, float]) -> Dict[str, float]:
+    total = sum(probabilities.values())
+    if total <= 0:
+        return {key: 1.0 / len(probabilities) for key in probabilities}
+    return {key: max(value / total, 0.0) for key, value in probabilities.items()}
+
+
+def adjust_probabilities_by_rtp(base: Dict[str, float], rtp: float) -> Dict[str, float]:
+    probabilities = base.copy()
+    deviation = rtp - 1.0
+
+    if deviation > 0.05:
+        poison_delta = min(deviation * 0.5, 0.1)
+        probabilities["poison"] = min(probabilities.get("poison", 0) + poison_delta, 0.5)
+        probabilities["silver"] = max(probabilities.get("silver", 0) - poison_delta * 0.3, 0.01)
+        probabilities["gold"] = max(probabilities.get("gold", 0) - poison_delta * 0.2, 0.01)
+        probabilities["red"] = max(probabilities.get("red", 0) - poison_delta * 0.1, 0.005)
+    elif deviation < -0.05:
+        poison_delta = min(abs(deviation) * 0.5, 0.1)
+        probabilities["poison"] = max(probabilities.get("poison", 0) - poison_delta, 0.01)
+        probabilities["silver"] = min(probabilities.get("silver", 0) + poison_delta * 0.3, 0.4)
+        probabilities["gold"] = min(probabilities.get("gold", 0) + poison_delta * 0.2, 0.3)
+        probabilities["red"] = min(probabilities.get("red", 0) + poison_delta * 0.1, 0.15)
+
+    return normalize_probabilities(probabilities)
@@ -0,0 +1,270 @@
+"""Screenshot verification: the OpenAI receipt check, verdict parsing and duplicate detection.
+
+:func:`verify_purchase_screenshot` is what the verification queue runs (on the OpenAI pool). It
+reuses a stored verdict when the same bytes were already judged, sends reused or near-identical
+receipts to manual review, and only then asks the model. Applying the verdict to the purchase and
+the purchaser stays in app.main.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any
+
+from .clients import openai_client, supabase
+from .db import track_http
+from .image_pipeline import hamming_distance, hash_detail_bits
+from .timeutil import utc_now
+
+# Perceptual-hash distance (out of 2048 bits) at or below which two screenshots count as the same
+# receipt. Light re-encodes and plain resizes of an order page land within ~16 bits, but different
+# orders for the same item can come as close as ~18, so the threshold stays tight and a match only
+# sends the purchase to manual review (scripts/check_phash_threshold.py).
+SCREENSHOT_DUPLICATE_MAX_DISTANCE = int(os.environ.get("SCREENSHOT_DUPLICATE_MAX_DISTANCE", "16"))
+# How many recent purchases a new screenshot is compared against for near-duplicates.
+SCREENSHOT_DUPLICATE_WINDOW = int(os.environ.get("SCREENSHOT_DUPLICATE_WINDOW", "500"))
+# Hashes with fewer detail bits than this (blank, flat-colour or loading screens) are never matched as
+# near-duplicates: two of them sit within the distance threshold whatever they show. Checked together
+# with the threshold by scripts/check_phash_threshold.py.
+SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS = int(os.environ.get("SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS", "64"))
+
+
+def normalize_ocr_snapshot(snapshot: dict[str, Any]) -> dict[str, Any]:
+    def coerce_price(value: Any) -> int | None:
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return int(value)
+        if isinstance(value, str):
+            digits = re.sub(r"[^0-9]", "", value)
+            if digits:
+                try:
+                    return int(digits)
+                except ValueError:
+                    return None
+        return None
+
+    def parse_bool_flag(value: Any) -> bool | None:
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            return bool(int(value))
+        if isinstance(value, str):
+            lowered = value.strip().lower()
+            if lowered in {"true", "1", "yes", "y"}:
+                return True
+            if lowered in {"false", "0", "no", "n"}:
+                return False
+        return None
+
+    item_name = snapshot.get("item_name") or snapshot.get("product") or snapshot.get("detected_item")
+    order_id = snapshot.get("order_id") or snapshot.get("orderNumber") or snapshot.get("order")
+    price = coerce_price(snapshot.get("price") or snapshot.get("detected_price"))
+    confidence_raw = snapshot.get("confidence") or snapshot.get("score")
+    try:
+        confidence = float(confidence_raw)
+    except (TypeError, ValueError):
+        confidence = None
+
+    matched_name = parse_bool_flag(snapshot.get("matched_name"))
+    matched_price = parse_bool_flag(snapshot.get("matched_price"))
+
+    return {
+        "item_name": item_name,
+        "order_id": order_id,
+        "price": price,
+        "confidence": confidence,
+        "matched_name": matched_name,
+        "matched_price": matched_price,
+    }
+
+
+def interpret_verification_response(raw: str) -> tuple[str, str, dict[str, Any] | None, dict[str, Any] | None]:
+    try:
+        payload = json.loads(raw)
+    except json.JSONDecodeError:
+        payload = {}
+
+    decision = str(payload.get("decision", "review")).lower()
+    reason = payload.get("reason") or payload.get("message") or raw
+
+    ocr_snapshot = None
+    raw_ocr = payload.get("ocr") if isinstance(payload, dict) else None
+    if isinstance(raw_ocr, dict):
+        ocr_snapshot = normalize_ocr_snapshot(raw_ocr)
+
+    metadata: dict[str, Any] | None = None
+    if isinstance(payload, dict):
+        filtered = {key: value for key, value in payload.items() if key not in {"ocr", "reason", "message"}}
+        metadata = filtered or None
+
+    if "approve" in decision:
+        return "approved", reason, ocr_snapshot, metadata
+    if "reject" in decision:
+        return "rejected", reason, ocr_snapshot, metadata
+    return "review_required", reason, ocr_snapshot, metadata
+
+
+def run_screenshot_verification(
+    screenshot_url: str,
+    item_name: str,
+    price: int,
+) -> tuple[str, str, dict[str, Any] | None, dict[str, Any] | None]:
+    # Clean up URL - remove trailing query parameters that may cause issues with OpenAI
+    screenshot_url = screenshot_url.rstrip("?.")
+    
+    metadata: dict[str, Any] = {
+        "model": "gpt-4o-mini",
+        "evaluated_at": utc_now().isoformat(),
+        "target_item": item_name,
+        "target_price": price,
+    }
+
+    if not openai_client:
+        metadata["skipped"] = True
+        return "review_required", "OpenAI未設定のため自動審査をスキップしました", None, metadata
+
+    prompt = (
+        "以下のスクリーンショットがAmazon購入完了画面で、対象商品が"
+        f"{item_name} であり、価格が概ね ¥{price} であるかを判定してください。\n\n"
+        "必ず JSON 形式で日本語で回答してください。形式: "
+        "{\"decision\": \"APPROVED|REVIEW|REJECT\", \"reason\": \"日本語の理由\", \"ocr\": {\"item_name\": string, \"price\": number, \"order_id\": string, \"confidence\": number, \"matched_name\": boolean, \"matched_price\": boolean}}\n\n"
+        "- decision: APPROVED（承認）、REVIEW（要確認）、REJECT（却下）のいずれか\n"
+        "- reason: 判定理由を日本語で簡潔に記載\n"
+        "- ocr: スクリーンショットから読み取った情報\n\n"
+        "余計な文章や説明は含めず、JSON のみを返してください。"
+    )
+
+    try:
+        with track_http("openai"):
+            response = openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                temperature=0,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "あなたはAmazon購入レシートの厳格な検証者です。指定されたJSON形式でのみ、日本語で応答してください。",
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {"type": "image_url", "image_url": {"url": screenshot_url}},
+                        ],
+                    },
+                ],
+            )
+        content = response.choices[0].message.content or ""
+    except Exception as exc:  # pragma: no cover - network failure
+        print(f"[PurchaseVerify] OpenAI error: {exc}")
+        metadata["error"] = str(exc)
+        return "review_required", "OpenAI API エラーのため手動確認が必要です", None, metadata
+
+    decision, reason, ocr_snapshot, raw_metadata = interpret_verification_response(content)
+    if raw_metadata:
+        metadata["llm"] = raw_metadata
+
+    return decision, reason, ocr_snapshot, metadata
+
+
+def find_duplicate_screenshot(purchase_id: int, sha256: str, phash: str | None) -> dict[str, Any] | None:
+    """Another purchase whose screenshot has the same bytes, or a near-identical image among recent ones."""
+
+    exact = (
+        supabase.table("purchases")
+        .select("id, purchaser_id")
+        .eq("screenshot_sha256", sha256)
+        .neq("id", purchase_id)
+        .limit(1)
+        .execute()
+    )
+    if exact.data:
+        row = exact.data[0]
+        return {"purchase_id": row["id"], "purchaser_id": row.get("purchaser_id"), "match": "exact", "distance": 0}
+    if not phash or hash_detail_bits(phash) < SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS:
+        return None
+
+    recent = (
+        supabase.table("purchases")
+        .select("id, purchaser_id, screenshot_phash")
+        .filter("screenshot_phash", "not.is", "null")
+        .neq("id", purchase_id)
+        .order("created_at", desc=True)
+        .limit(SCREENSHOT_DUPLICATE_WINDOW)
+        .execute()
+    )
+    best: dict[str, Any] | None = None
+    for row in recent.data or []:
+        try:
+            distance = hamming_distance(phash, row["screenshot_phash"])
+            if hash_detail_bits(row["screenshot_phash"]) < SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS:
+                continue
+        except (TypeError, ValueError):
+            continue
+        if distance <= SCREENSHOT_DUPLICATE_MAX_DISTANCE and (best is None or distance < best["distance"]):
+            best = {"purchase_id": row["id"], "purchaser_id": row.get("purchaser_id"), "match": "similar", "distance": distance}
+    return best
+
+
+def cached_screenshot_verdict(
+    purchase: dict[str, Any],
+) -> tuple[str, str, dict[str, Any] | None, dict[str, Any]] | None:
+    """The stored verdict when it was reached for exactly the screenshot bytes now on the purchase."""
+
+    sha256 = purchase.get("screenshot_sha256")
+    previous = purchase.get("verification_metadata")
+    if not sha256 or not isinstance(previous, dict) or previous.get("screenshot_sha256") != sha256:
+        return None
+    # Errors and skipped checks are not verdicts; run them again.
+    if previous.get("error") or previous.get("skipped") or not purchase.get("verification_status"):
+        return None
+    metadata = {**previous, "cached": True, "reused_at": utc_now().isoformat()}
+    return (
+        purchase["verification_status"],
+        purchase.get("verification_result") or "",
+        purchase.get("ocr_snapshot"),
+        metadata,
+    )
+
+
+def verify_purchase_screenshot(
+    purchase: dict[str, Any],
+    screenshot_url: str,
+) -> tuple[str, str, dict[str, Any] | None, dict[str, Any] | None]:
+    """Verdict for a purchase screenshot, skipping the model for repeats and reused receipts."""
+
+    item_name = purchase.get("target_item_name", "")
+    price = purchase.get("target_item_price", 0) or 0
+    # Fingerprints describe the uploaded file; a screenshot_url passed in by the client is unknown bytes.
+    sha256 = purchase.get("screenshot_sha256") if screenshot_url == purchase.get("screenshot_url") else None
+    if not sha256:
+        return run_screenshot_verification(screenshot_url, item_name, price)
+
+    cached = cached_screenshot_verdict(purchase)
+    if cached:
+        print(f"[PurchaseVerify] Reusing verdict for purchase {purchase['id']} (same screenshot)")
+        return cached
+
+    duplicate = find_duplicate_screenshot(purchase["id"], sha256, purchase.get("screenshot_phash"))
+    if duplicate:
+        print(
+            f"[PurchaseVerify] Purchase {purchase['id']} screenshot matches purchase "
+            f"{duplicate['purchase_id']} ({duplicate['match']}, distance {duplicate['distance']})"
+        )
+        metadata = {
+            "evaluated_at": utc_now().isoformat(),
+            "target_item": item_name,
+            "target_price": price,
+            "screenshot_sha256": sha256,
+            "duplicate_of": duplicate,
+        }
+        return "review_required", "他の購入と同じ、またはよく似たスクリーンショットのため手動で確認します", None, metadata
+
+    decision, reason, ocr_snapshot, metadata = run_screenshot_verification(screenshot_url, item_name, price)
+    if metadata is not None:
+        metadata["screenshot_sha256"] = sha256
+    return decision, reason, ocr_snapshot, metadata
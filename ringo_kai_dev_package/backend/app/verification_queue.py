@@ -0,0 +1,153 @@
+"""In-process job queue that runs purchase screenshot verification off the request path."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+JobHandler = Callable[[dict[str, Any]], Awaitable[dict[str, Any] | None]]
+
+
+class QueueFull(Exception):
+    """Raised when the backlog is at ``max_pending`` and a new job cannot be accepted."""
+
+
+class VerificationQueue:
+    """Bounded worker pool over an ``asyncio.Queue`` with queryable job state.
+
+    One job per purchase is in flight at a time: enqueueing a purchase that is already queued or
+    running returns the existing job. Finished jobs are kept (up to ``history``) so clients can
+    poll for the outcome. State lives in this process only; the purchase row stays the source of
+    truth once a job has finished.
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        *,
+        workers: int = 2,
+        max_pending: int = 200,
+        history: int = 1000,
+    ) -> None:
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.max_pending = max(max_pending, 1)
+        self.history = max(history, 1)
+        self._queue: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._jobs: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._active_by_purchase: dict[int, str] = {}
+        self._stats = {"enqueued": 0, "completed": 0, "failed": 0, "deduplicated": 0}
+
+    def start(self) -> None:
+        """Start the workers on the running loop; calling it again is a no-op."""
+
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self._queue = asyncio.Queue()
+        # A fresh context, so workers started lazily from a request do not inherit its request scope.
+        self._tasks = [
+            asyncio.create_task(self._worker(index), context=contextvars.Context()) for index in range(self.workers)
+        ]
+        # Jobs accepted before a restart of the workers would otherwise never run.
+        for job_id in self._active_by_purchase.values():
+            if self._jobs[job_id]["state"] == "queued":
+                self._queue.put_nowait(job_id)
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def enqueue(self, purchase_id: int, payload: dict[str, Any]) -> dict[str, Any]:
+        existing = self._active_by_purchase.get(purchase_id)
+        if existing:
+            self._stats["deduplicated"] += 1
+            return dict(self._jobs[existing])
+        if self.pending() >= self.max_pending:
+            raise QueueFull(f"{self.pending()} verification jobs pending")
+
+        self.start()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "purchase_id": purchase_id,
+            "state": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "payload": payload,
+        }
+        self._jobs[job["job_id"]] = job
+        self._active_by_purchase[purchase_id] = job["job_id"]
+        self._stats["enqueued"] += 1
+        self._trim()
+        assert self._queue is not None
+        self._queue.put_nowait(job["job_id"])
+        return dict(job)
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def latest_for_purchase(self, purchase_id: int) -> dict[str, Any] | None:
+        for job in reversed(self._jobs.values()):
+            if job["purchase_id"] == purchase_id:
+                return dict(job)
+        return None
+
+    def pending(self) -> int:
+        return len(self._active_by_purchase)
+
+    def stats(self) -> dict[str, int]:
+        running = sum(1 for job_id in self._active_by_purchase.values() if self._jobs[job_id]["state"] == "running")
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "queued": self.pending() - running,
+            "running": running,
+        }
+
+    def _trim(self) -> None:
+        while len(self._jobs) > self.history:
+            job_id, job = next(iter(self._jobs.items()))
+            if job["state"] in {"queued", "running"}:
+                break
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            job_id = await queue.get()
+            job = self._jobs.get(job_id)
+            try:
+                if job is None or job["state"] != "queued":
+                    continue
+                job["state"] = "running"
+                job["started_at"] = time.time()
+                try:
+                    job["result"] = await self.handler(job["payload"])
+                except asyncio.CancelledError:
+                    # Shutting down: leave the job queued so a later start() picks it up again.
+                    job["state"] = "queued"
+                    job["started_at"] = None
+                    raise
+                except Exception as exc:
+                    print(f"[VerificationQueue] Job {job_id} for purchase {job['purchase_id']} failed: {exc}")
+                    job["state"] = "failed"
+                    job["error"] = str(exc)
+                    self._stats["failed"] += 1
+                else:
+                    job["state"] = "completed"
+                    self._stats["completed"] += 1
+                job["finished_at"] = time.time()
+                self._active_by_purchase.pop(job["purchase_id"], None)
+            finally:
+                queue.task_done()
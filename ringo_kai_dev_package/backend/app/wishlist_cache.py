@@ -0,0 +1,206 @@
+"""Cache of parsed wishlist summaries keyed by normalized wishlist URL."""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Query parameters that only track where a link was shared from and never change the page content.
+TRACKING_QUERY_KEYS = {"ref", "ref_", "tag", "_encoding"}
+
+
+def cache_key(url: str) -> str:
+    parsed = urlparse(url.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if key not in TRACKING_QUERY_KEYS)
+    return urlunparse(
+        parsed._replace(
+            scheme=parsed.scheme.lower() or "https",
+            netloc=parsed.netloc.lower(),
+            path=parsed.path.rstrip("/") or "/",
+            query=urlencode(query),
+            fragment="",
+        )
+    )
+
+
+class WishlistCache:
+    """In-memory LRU cache with an optional JSON file store so entries survive restarts.
+
+    Each entry holds either the summary produced by ``extract_wishlist_items_summary`` or the
+    error message of a failed fetch (negative cache), plus the validators needed to revalidate.
+
+    Writes only mark the cache dirty; the file is rewritten from a timer thread at most every
+    ``flush_seconds`` (and by :meth:`flush` at shutdown), never on the caller's thread. Several
+    processes may share one file: each writes through its own temp file and merges what is on disk,
+    keeping the most recently checked copy of every entry.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        negative_ttl_seconds: float,
+        path: Path | None = None,
+        max_entries: int = 5000,
+        flush_seconds: float = 30.0,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        # Least recently used first.
+        self._entries: OrderedDict[str, dict[str, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        # Keys dropped since the last flush, so merging the file does not bring them back.
+        self._removed: set[str] = set()
+        self._timer: threading.Timer | None = None
+        self._entries.update(self._read_file())
+
+    def get(self, url: str) -> dict[str, object] | None:
+        """Return the entry for ``url`` even if stale; callers decide via :meth:`is_fresh`."""
+
+        key = cache_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def is_fresh(self, entry: dict[str, object], now: float | None = None) -> bool:
+        now = now if now is not None else time.time()
+        checked_at = float(entry.get("checked_at") or 0)
+        ttl = self.negative_ttl_seconds if entry.get("error") else self.ttl_seconds
+        return now - checked_at < ttl
+
+    def store_summary(
+        self,
+        url: str,
+        summary: dict[str, object],
+        *,
+        source_url: str | None = None,
+        source_label: str | None = None,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        now = time.time()
+        self._put(
+            url,
+            {
+                "summary": summary,
+                "error": None,
+                "source_url": source_url,
+                "source_label": source_label,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": now,
+                "checked_at": now,
+            },
+        )
+
+    def store_failure(self, url: str, error: str) -> None:
+        now = time.time()
+        self._put(url, {"summary": None, "error": error, "fetched_at": now, "checked_at": now})
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as revalidated (e.g. after a 304) without replacing its summary."""
+
+        key = cache_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return
+            entry["checked_at"] = time.time()
+            self._entries.move_to_end(key)
+            self._mark_dirty_locked()
+
+    def invalidate(self, url: str) -> None:
+        key = cache_key(url)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._removed.add(key)
+                self._mark_dirty_locked()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            failures = sum(1 for entry in self._entries.values() if entry.get("error"))
+            return {"entries": len(self._entries), "negative_entries": failures}
+
+    def _put(self, url: str, entry: dict[str, object]) -> None:
+        key = cache_key(url)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._removed.discard(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._removed.add(evicted)
+            self._mark_dirty_locked()
+
+    def _mark_dirty_locked(self) -> None:
+        if not self.path:
+            return
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write pending changes to the file store (blocking; call it off the event loop)."""
+
+        if not self.path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                entries = {key: dict(entry) for key, entry in self._entries.items()}
+                removed, self._removed = self._removed, set()
+                self._dirty = False
+            merged = {key: entry for key, entry in self._read_file().items() if key not in removed}
+            for key, entry in entries.items():
+                on_disk = merged.get(key)
+                if on_disk is None or float(on_disk.get("checked_at") or 0) <= float(entry.get("checked_at") or 0):
+                    merged[key] = entry
+            newest = sorted(merged.items(), key=lambda item: float(item[1].get("checked_at") or 0))[-self.max_entries :]
+            self._write_file(dict(newest))
+
+    def _read_file(self) -> dict[str, dict[str, object]]:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            print(f"[WishlistCache] Ignoring unreadable cache file {self.path}: {exc}")
+            return {}
+        if not isinstance(raw, dict):
+            return {}
+        entries = [(key, value) for key, value in raw.items() if isinstance(value, dict)]
+        entries.sort(key=lambda item: float(item[1].get("checked_at") or 0))
+        return dict(entries[-self.max_entries :])
+
+    def _write_file(self, entries: dict[str, dict[str, object]]) -> None:
+        assert self.path is not None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # A temp file per write, so processes sharing the store never write into each other's.
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp", delete=False
+            ) as handle:
+                json.dump(entries, handle, ensure_ascii=False)
+            os.replace(handle.name, self.path)
+        except OSError as exc:  # pragma: no cover - disk store is best-effort
+            print(f"[WishlistCache] Failed to persist cache: {exc}")
@@ -0,0 +1,524 @@
+"""Fetching Amazon wishlists: URL normalization, variant racing, streaming parse, caching and throttling.
+
+Pages are fetched with httpx, streamed through :class:`~.wishlist_parser.WishlistStreamParser`,
+cached in :data:`wishlist_cache` (revalidated with ETag/Last-Modified) and paced per host by
+:data:`amazon_throttle`. Failures surface as HTTPException (400, or 503 while Amazon's hosts are
+cooling down), which the endpoints pass straight through.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import math
+import os
+from contextlib import asynccontextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from pathlib import Path
+from typing import AsyncIterator
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from fastapi import HTTPException, status
+import httpx
+
+from .db import track_http
+from .host_limiter import HostThrottle, HostThrottled
+from .wishlist_cache import WishlistCache
+from .wishlist_parser import WishlistStreamParser
+
+WISHLIST_ALLOWED_HOSTS = {
+    "amazon.co.jp",
+    "www.amazon.co.jp",
+    "amazon.com",
+    "www.amazon.com",
+    "amazon.jp",
+    "www.amazon.jp",
+}
+WISHLIST_PATH_KEYWORDS = ("wishlist", "registry", "hz/wishlist", "gp/registry")
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+AMAZON_DESKTOP_HEADERS = {
+    "User-Agent": DEFAULT_USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "Upgrade-Insecure-Requests": "1",
+}
+AMAZON_MOBILE_HEADERS = {
+    "User-Agent": MOBILE_USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+}
+WISHLIST_MAX_RESPONSE_BYTES = int(os.environ.get("WISHLIST_MAX_RESPONSE_BYTES", str(3 * 1024 * 1024)))
+WISHLIST_FETCH_TIMEOUT_SECONDS = float(os.environ.get("WISHLIST_FETCH_TIMEOUT_SECONDS", "10"))
+# "race" launches the desktop/mobile/host variants concurrently (staggered); "sequential" tries them one by one.
+WISHLIST_FETCH_MODE = os.environ.get("WISHLIST_FETCH_MODE", "race").lower()
+WISHLIST_RACE_STAGGER_SECONDS = float(os.environ.get("WISHLIST_RACE_STAGGER_SECONDS", "1.5"))
+# Sends wishlist fetches to this origin instead of Amazon (load tests run a local stand-in). Never set in production.
+WISHLIST_FETCH_ORIGIN = os.environ.get("WISHLIST_FETCH_ORIGIN")
+WISHLIST_CACHE_TTL_SECONDS = float(os.environ.get("WISHLIST_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+WISHLIST_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("WISHLIST_CACHE_NEGATIVE_TTL_SECONDS", "600"))
+WISHLIST_CACHE_PATH = os.environ.get("WISHLIST_CACHE_PATH")
+# The file store is rewritten at most this often (and at shutdown), off the event loop.
+WISHLIST_CACHE_FLUSH_SECONDS = float(os.environ.get("WISHLIST_CACHE_FLUSH_SECONDS", "30"))
+AMAZON_MAX_REQUESTS_PER_SECOND = float(os.environ.get("AMAZON_MAX_REQUESTS_PER_SECOND", "2.0"))
+AMAZON_MIN_REQUESTS_PER_SECOND = float(os.environ.get("AMAZON_MIN_REQUESTS_PER_SECOND", "0.05"))
+AMAZON_REQUEST_BURST = float(os.environ.get("AMAZON_REQUEST_BURST", "4"))
+AMAZON_BREAKER_THRESHOLD = int(os.environ.get("AMAZON_BREAKER_THRESHOLD", "3"))
+AMAZON_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("AMAZON_BREAKER_COOLDOWN_SECONDS", "60"))
+# Statuses Amazon uses for throttling; they count as blocks just like robot-check pages.
+AMAZON_THROTTLE_STATUSES = {429, 503}
+# Statuses that say the list itself is gone (deleted, or private to anonymous visitors).
+WISHLIST_GONE_STATUSES = {404, 410}
+wishlist_cache = WishlistCache(
+    ttl_seconds=WISHLIST_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=WISHLIST_CACHE_NEGATIVE_TTL_SECONDS,
+    path=Path(WISHLIST_CACHE_PATH) if WISHLIST_CACHE_PATH else None,
+    flush_seconds=WISHLIST_CACHE_FLUSH_SECONDS,
+)
+amazon_throttle = HostThrottle(
+    max_rate=AMAZON_MAX_REQUESTS_PER_SECOND,
+    min_rate=AMAZON_MIN_REQUESTS_PER_SECOND,
+    burst=AMAZON_REQUEST_BURST,
+    breaker_threshold=AMAZON_BREAKER_THRESHOLD,
+    cooldown_seconds=AMAZON_BREAKER_COOLDOWN_SECONDS,
+)
+
+
+class WishlistNotFound(HTTPException):
+    """The 400 raised when every variant answered 404/410, i.e. the list is gone rather than unreachable."""
+
+
+# Shared client (keep-alive pool) while the API runs; see open_http_client. None means one client per fetch.
+_http_client: httpx.AsyncClient | None = None
+
+
+def open_http_client() -> None:
+    """Create the pooled client the API's wishlist fetches share, so they reuse Amazon connections.
+
+    Cookies are never stored, so one user's fetch does not carry Amazon's session cookies into the
+    next, just as with the per-fetch clients used without it (scripts, tests).
+    """
+
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=WISHLIST_FETCH_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+
+
+async def close_http_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def _amazon_client() -> AsyncIterator[httpx.AsyncClient]:
+    if _http_client is not None:
+        yield _http_client
+        return
+    async with httpx.AsyncClient(timeout=WISHLIST_FETCH_TIMEOUT_SECONDS, follow_redirects=True) as client:
+        yield client
+
+
+def normalize_wishlist_url(raw_url: str) -> str:
+    if not raw_url:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "URLを入力してください。")
+
+    candidate = raw_url.strip()
+    if not candidate.startswith(("http://", "https://")):
+        candidate = f"https://{candidate}"
+
+    parsed = urlparse(candidate)
+    if not parsed.netloc:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "有効なURL形式ではありません。")
+
+    scheme = parsed.scheme.lower()
+    if scheme not in {"http", "https"}:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "http または https のURLを使用してください。")
+
+    host = parsed.netloc.lower()
+    if host not in WISHLIST_ALLOWED_HOSTS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Amazonの欲しいものリストURLのみ登録できます。")
+
+    path = parsed.path.lower()
+    if not any(keyword in path for keyword in WISHLIST_PATH_KEYWORDS):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "欲しいものリストのURLを入力してください（wishlist/registry パスが必要です）。")
+
+    normalized = parsed._replace(scheme="https")
+    return normalized.geturl()
+
+
+def _replace_host(url: str, new_host: str) -> str:
+    parsed = urlparse(url)
+    if not new_host or parsed.netloc == new_host:
+        return url
+    return urlunparse(parsed._replace(netloc=new_host))
+
+
+def _ensure_query_params(url: str, updates: dict[str, str]) -> str:
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    changed = False
+    for key, value in updates.items():
+        if query.get(key) != value:
+            query[key] = value
+            changed = True
+    if not changed:
+        return url
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
+
+
+def _ensure_mobile_view(url: str) -> str:
+    return _ensure_query_params(
+        url,
+        {
+            "viewType": "mobile",
+            "sort": "default",
+            "language": "ja_JP",
+        },
+    )
+
+
+def _fetch_target(url: str) -> str:
+    if not WISHLIST_FETCH_ORIGIN:
+        return url
+    origin = urlparse(WISHLIST_FETCH_ORIGIN)
+    return urlunparse(urlparse(url)._replace(scheme=origin.scheme, netloc=origin.netloc))
+
+
+def _build_wishlist_variants(url: str) -> list[tuple[str, dict[str, str], str]]:
+    parsed = urlparse(url)
+    host_variants = [parsed.netloc]
+    if parsed.netloc.endswith(".amazon.jp") and parsed.netloc != "www.amazon.co.jp":
+        host_variants.append("www.amazon.co.jp")
+    if parsed.netloc.endswith(".amazon.com") and parsed.netloc != "www.amazon.com":
+        host_variants.append("www.amazon.com")
+
+    variants: list[tuple[str, dict[str, str], str]] = []
+    seen: set[str] = set()
+    for host in host_variants:
+        base = _replace_host(url, host)
+        for label, transformer, headers in (
+            ("desktop", lambda value: value, AMAZON_DESKTOP_HEADERS),
+            ("mobile", _ensure_mobile_view, AMAZON_MOBILE_HEADERS),
+        ):
+            candidate = transformer(base)
+            if candidate in seen:
+                continue
+            seen.add(candidate)
+            variants.append((candidate, headers, f"{host or parsed.netloc}:{label}"))
+    return variants
+
+
+async def _read_wishlist_stream(response: httpx.Response, parser: WishlistStreamParser) -> tuple[int, bool]:
+    """Feed the body into ``parser`` chunk by chunk.
+
+    Reading stops as soon as the parser has decided the item-count verdict or after
+    ``WISHLIST_MAX_RESPONSE_BYTES``. Returns ``(bytes_read, truncated)``.
+    """
+
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    bytes_read = 0
+    truncated = False
+    async for chunk in response.aiter_bytes():
+        remaining = WISHLIST_MAX_RESPONSE_BYTES - bytes_read
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+            truncated = True
+        bytes_read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if truncated or parser.decided:
+            break
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    return bytes_read, truncated
+
+
+async def _fetch_wishlist_variant(
+    candidate: str,
+    headers: dict[str, str],
+    label: str,
+    validators: dict[str, str] | None = None,
+    *,
+    keep_html: bool = False,
+) -> tuple[dict[str, object] | None, str]:
+    """Fetch one variant and return ``(page, "")`` on success or ``(None, error)`` otherwise.
+
+    The body is streamed through :class:`WishlistStreamParser`, so ``page["summary"]`` is ready
+    without holding the whole document; ``page["html"]`` is only filled when ``keep_html`` is set
+    (which also disables early termination). ``page`` also carries the validators needed for a
+    later conditional request; when ``validators`` are sent and the server answers 304,
+    ``page["not_modified"]`` is True.
+    """
+
+    request_headers = {**headers, **(validators or {})}
+    if validators:
+        # Conditional requests only work when the server is allowed to answer from its cache.
+        request_headers.pop("Cache-Control", None)
+        request_headers.pop("Pragma", None)
+    fetch_url = _fetch_target(candidate)
+    host = urlparse(fetch_url).netloc
+    try:
+        await amazon_throttle.acquire(host)
+    except HostThrottled as exc:
+        return None, f"{label} {exc}"
+    parser = WishlistStreamParser(keep_html=keep_html, stop_when_decided=not keep_html)
+    # Until a response has been read, any way out (HTTP error, cancellation by the race, a bug) must
+    # release a half-open probe, or the host would report "is being probed" forever.
+    fetched = False
+    try:
+        with track_http("amazon"):
+            async with _amazon_client() as client:
+                async with client.stream("GET", fetch_url, headers=request_headers) as response:
+                    page: dict[str, object] = {
+                        "url": candidate,
+                        "label": label,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "not_modified": False,
+                        "html": "",
+                        "summary": None,
+                    }
+                    status_code = response.status_code
+                    if status_code < 300:
+                        page["bytes_read"], page["truncated"] = await _read_wishlist_stream(response, parser)
+        fetched = True
+    except httpx.HTTPError as exc:
+        return None, f"{label} fetch error: {exc}"
+    finally:
+        if not fetched:
+            amazon_throttle.release(host)
+
+    if validators and status_code == 304:
+        amazon_throttle.record_success(host)
+        page["not_modified"] = True
+        return page, ""
+
+    if status_code in AMAZON_THROTTLE_STATUSES:
+        amazon_throttle.record_block(host)
+        return None, f"{label} HTTP {status_code}"
+    if status_code >= 300:
+        amazon_throttle.record_success(host)
+        return None, f"{label} HTTP {status_code}"
+
+    if parser.is_robot_block:
+        amazon_throttle.record_block(host)
+        return None, f"{label} blocked by Amazon"
+    amazon_throttle.record_success(host)
+
+    if parser.looks_like_wishlist:
+        page["summary"] = parser.summary()
+        page["html"] = parser.html
+        return page, ""
+    return None, f"{label} unexpected HTML structure"
+
+
+async def _fetch_wishlist_sequential(
+    variants: list[tuple[str, dict[str, str], str]],
+    *,
+    keep_html: bool = False,
+) -> tuple[dict[str, object] | None, list[str]]:
+    errors: list[str] = []
+    for candidate, headers, label in variants:
+        page, error = await _fetch_wishlist_variant(candidate, headers, label, keep_html=keep_html)
+        if page is not None:
+            return page, []
+        errors.append(error)
+    return None, errors
+
+
+async def _fetch_wishlist_race(
+    variants: list[tuple[str, dict[str, str], str]],
+    stagger: float = WISHLIST_RACE_STAGGER_SECONDS,
+    *,
+    keep_html: bool = False,
+) -> tuple[dict[str, object] | None, list[str]]:
+    """Race the variants and return the first usable page, or None and every variant's error.
+
+    A new variant is launched every ``stagger`` seconds, or immediately when a running one fails,
+    so a healthy first variant still costs a single request. Losers are cancelled.
+    """
+
+    remaining = list(variants)
+    pending: set[asyncio.Task[tuple[dict[str, object] | None, str]]] = set()
+    errors: list[str] = []
+
+    def launch_next() -> None:
+        if remaining:
+            candidate, headers, label = remaining.pop(0)
+            pending.add(asyncio.create_task(_fetch_wishlist_variant(candidate, headers, label, keep_html=keep_html)))
+
+    launch_next()
+    if stagger <= 0:
+        while remaining:
+            launch_next()
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=stagger if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch_next()
+                continue
+            for task in done:
+                pending.discard(task)
+                page, error = task.result()
+                if page is not None:
+                    return page, []
+                errors.append(error)
+            # A failed variant frees its slot right away instead of waiting for the stagger.
+            launch_next()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return None, errors
+
+
+def _raise_if_hosts_cooling_down(variants: list[tuple[str, dict[str, str], str]]) -> None:
+    """Fail fast with 503 when every host we could try is behind an open circuit breaker."""
+
+    remaining = [amazon_throttle.cooldown_remaining(urlparse(candidate).netloc) for candidate, _, _ in variants]
+    if remaining and all(value > 0 for value in remaining):
+        wait_seconds = math.ceil(min(remaining))
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            f"Amazonへのアクセスが一時的に制限されているため、取得を停止しています。約{wait_seconds}秒後に再試行してください。",
+            headers={"Retry-After": str(wait_seconds)},
+        )
+
+
+async def fetch_wishlist_page(url: str, *, mode: str | None = None, keep_html: bool = False) -> dict[str, object]:
+    variants = _build_wishlist_variants(url)
+    _raise_if_hosts_cooling_down(variants)
+    if (mode or WISHLIST_FETCH_MODE) == "sequential":
+        page, errors = await _fetch_wishlist_sequential(variants, keep_html=keep_html)
+    else:
+        page, errors = await _fetch_wishlist_race(variants, keep_html=keep_html)
+
+    if page is not None:
+        return page
+
+    # The breaker may have tripped while this fetch was running.
+    _raise_if_hosts_cooling_down(variants)
+    detail = f"欲しいものリストを取得できませんでした。公開設定やURLをご確認ください。({errors[-1] if errors else 'unknown error'})"
+    gone_suffixes = tuple(f" HTTP {code}" for code in WISHLIST_GONE_STATUSES)
+    if errors and all(error.endswith(gone_suffixes) for error in errors):
+        raise WishlistNotFound(status.HTTP_400_BAD_REQUEST, detail)
+    raise HTTPException(status.HTTP_400_BAD_REQUEST, detail)
+
+
+async def fetch_wishlist_html(url: str, *, mode: str | None = None) -> str:
+    page = await fetch_wishlist_page(url, mode=mode, keep_html=True)
+    return str(page["html"])
+
+
+async def _revalidate_wishlist_entry(url: str, entry: dict[str, object]) -> dict[str, object] | None:
+    """Conditionally re-request the variant that produced ``entry``; None means a full fetch is needed."""
+
+    source_url = entry.get("source_url")
+    validators: dict[str, str] = {}
+    if isinstance(entry.get("etag"), str):
+        validators["If-None-Match"] = entry["etag"]
+    if isinstance(entry.get("last_modified"), str):
+        validators["If-Modified-Since"] = entry["last_modified"]
+    if not isinstance(source_url, str) or not validators or not isinstance(entry.get("summary"), dict):
+        return None
+
+    label = str(entry.get("source_label") or "cached")
+    headers = AMAZON_MOBILE_HEADERS if label.endswith(":mobile") else AMAZON_DESKTOP_HEADERS
+    page, _ = await _fetch_wishlist_variant(source_url, headers, label, validators=validators)
+    if page is None:
+        return None
+    if page["not_modified"]:
+        wishlist_cache.touch(url)
+        return entry["summary"]
+
+    summary = page["summary"]
+    _store_wishlist_summary(url, summary, page)
+    return summary
+
+
+def _store_wishlist_summary(url: str, summary: dict[str, object], page: dict[str, object]) -> None:
+    wishlist_cache.store_summary(
+        url,
+        summary,
+        source_url=page.get("url"),
+        source_label=page.get("label"),
+        etag=page.get("etag"),
+        last_modified=page.get("last_modified"),
+    )
+
+
+async def fetch_wishlist_summary(url: str, *, refresh: bool = False) -> dict[str, object]:
+    """Return ``extract_wishlist_items_summary`` for ``url``, served from ``wishlist_cache`` when possible.
+
+    Fresh entries (including cached failures) are returned without touching Amazon. Stale entries
+    are revalidated with ETag/Last-Modified when available. ``refresh`` skips the fresh-entry and
+    negative-cache shortcuts, which registration needs because users fix their list and retry.
+    """
+
+    entry = wishlist_cache.get(url)
+    if entry and not refresh and wishlist_cache.is_fresh(entry):
+        if entry.get("error"):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, str(entry["error"]))
+        if isinstance(entry.get("summary"), dict):
+            return entry["summary"]
+
+    if entry and not entry.get("error"):
+        summary = await _revalidate_wishlist_entry(url, entry)
+        if summary is not None:
+            return summary
+
+    try:
+        page = await fetch_wishlist_page(url)
+    except HTTPException as exc:
+        # Cooling-down errors say nothing about the wishlist itself, so they are not negatively cached.
+        if exc.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+            wishlist_cache.store_failure(url, str(exc.detail))
+        raise
+
+    summary = page["summary"]
+    _store_wishlist_summary(url, summary, page)
+    return summary
+
+
+async def fetch_wishlist_snapshot(url: str) -> dict[str, str | int | None]:
+    summary = await fetch_wishlist_summary(url)
+    return {
+        "title": summary.get("title"),
+        "price": summary.get("price"),
+    }
+
+
+def evaluate_wishlist_summary(summary: dict[str, object]) -> str | None:
+    """Return why a registered wishlist can no longer be assigned, or None while it still qualifies."""
+
+    item_count = summary.get("item_count") or 0
+    if item_count == 0:
+        return "empty"
+    if item_count > 1:
+        return "multiple_items"
+    price = summary.get("price")
+    if not isinstance(price, int):
+        return "price_not_detected"
+    if price < 3000 or price > 4000:
+        return "price_out_of_range"
+    return None
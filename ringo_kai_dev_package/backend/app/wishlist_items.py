@@ -0,0 +1,48 @@
+"""Reads and writes of the wishlist_items table shared by the API and the backfill script.
+
+Only the Supabase client and the clock are needed here, so scripts can import this module without
+building the API (importing app.main registers every route and middleware).
+"""
+
+from __future__ import annotations
+
+from .clients import supabase
+from .timeutil import utc_now
+
+
+def wishlist_item_row(user_id: str, title: str | None, price: int, url: str) -> dict[str, object]:
+    """Row for a wishlist that was just fetched and checked, so it also resets the eligibility verdict."""
+
+    now = utc_now().isoformat()
+    return {
+        "user_id": user_id,
+        "title": title or "Amazon欲しいもの",
+        "price": price,
+        "url": url,
+        "updated_at": now,
+        "last_validated_at": now,
+        "last_attempted_at": now,
+        "validation_failures": 0,
+        "is_eligible": True,
+        "ineligible_reason": None,
+    }
+
+
+def upsert_wishlist_items(rows: list[dict[str, object]]) -> None:
+    """Write many wishlist_items rows in one ``INSERT ... ON CONFLICT (user_id) DO UPDATE``.
+
+    Rows come from :func:`wishlist_item_row`. ``created_at`` is left to the column default so
+    existing rows keep theirs, and columns not in the rows (e.g. ``assigned_purchase_id``) are untouched.
+    """
+
+    if not rows:
+        return
+    supabase.table("wishlist_items").upsert(rows, on_conflict="user_id").execute()
+
+
+def upsert_wishlist_item(user_id: str, title: str | None, price: int, url: str) -> None:
+    upsert_wishlist_items([wishlist_item_row(user_id, title, price, url)])
+
+
+def release_wishlist_assignment(purchase_id: int) -> None:
+    supabase.table("wishlist_items").update({"assigned_purchase_id": None}).eq("assigned_purchase_id", purchase_id).execute()
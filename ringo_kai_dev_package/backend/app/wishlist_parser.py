@@ -0,0 +1,350 @@
+"""Regex-based extraction of Amazon wishlist pages, for whole documents and streamed responses."""
+
+from __future__ import annotations
+
+import re
+
+TITLE_PATTERN = re.compile(r"<title>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+PRICE_PATTERN = re.compile(r"[¥￥]\s?([0-9][0-9,]{2,})")
+WISHLIST_ASIN_PATTERN = re.compile(r"href=\"/dp/([A-Z0-9]{10})(?:/|\?)", re.IGNORECASE)
+WISHLIST_ASIN_TITLE_PATTERN = re.compile(
+    r"href=\"/dp/([A-Z0-9]{10})(?:/|\?)[^\"]*\"[^>]*title=\"([^\"]+)\"",
+    re.IGNORECASE,
+)
+WISHLIST_ITEM_PRICE_PATTERN = re.compile(
+    r"id=\"itemPrice_[^\"]+\"[\s\S]{0,1200}?<span class=\"a-offscreen\">[¥￥]\s*([0-9][0-9,]{2,})",
+    re.IGNORECASE,
+)
+WISHLIST_MOBILE_PRICE_PATTERN = re.compile(
+    r"data-cy=\"price-recipe\"[\s\S]{0,1200}?<span class=\"a-offscreen\">[¥￥]\s*([0-9][0-9,]{2,})",
+    re.IGNORECASE,
+)
+ROBOT_MARKERS = ("robot check", "enter the characters you see below", "api-services-support@amazon.com")
+WISHLIST_MARKERS = ("itemPrice_", "wl-list-item", "g-items")
+TARGET_PRICE_RANGE = (3000, 4000)
+
+# Every pattern above folded into one alternation so a page is scanned once. Each branch starts
+# with a literal (case-sensitive) anchor character and checks the rest with look-behind and
+# look-ahead, case-insensitive parts scoped with (?i:...). That keeps the engine's first-character
+# prefilter, so it only tries a match at a few positions, and branches consume so little text that
+# they never hide what another branch needs. WishlistScan.add replays finditer's non-overlap rules.
+WISHLIST_SCAN_PATTERN = re.compile(
+    r'/(?<=(?i:href="/))(?i:dp/(?P<asin>[A-Z0-9]{10})(?:/|\?)(?:(?=[^"]*"[^>]*title="(?P<asin_title>[^"]+)"))?)'
+    r'|_(?<=(?i:id="itemPrice_))(?=(?i:[^"]+"[\s\S]{0,1200}?<span class="a-offscreen">[¥￥]\s*)(?P<item_price>[0-9][0-9,]{2,}))'
+    r'|-(?<=(?i:data-cy="price-))(?=(?i:recipe"[\s\S]{0,1200}?<span class="a-offscreen">[¥￥]\s*)(?P<mobile_price>[0-9][0-9,]{2,}))'
+    r'|¥\s?(?P<price>[0-9][0-9,]{2,})'
+    r'|￥\s?(?P<wide_price>[0-9][0-9,]{2,})'
+    r'|<(?i:title>)(?=(?P<title>[\s\S]*?)(?i:</title>))'
+    r'|\x20(?P<robot>(?<=(?i:robot\x20))(?i:check)|(?<=(?i:enter\x20))(?i:the characters you see below))'
+    r'|@(?<=(?i:api-services-support@))(?P<api_robot>(?i:amazon\.com))'
+    r'|_(?<=itemPrice_)(?P<marker>)'
+    r'|-(?P<list_marker>(?<=wl-)list-item|(?<=g-)items)'
+)
+# Distance from each branch's anchor back to where the standalone pattern's match starts.
+_ASIN_ANCHOR_OFFSET = len('href="')
+_ITEM_PRICE_ANCHOR_OFFSET = len('id="itemPrice')
+_MOBILE_PRICE_ANCHOR_OFFSET = len('data-cy="price')
+
+
+def _in_target_range(value: int) -> bool:
+    return TARGET_PRICE_RANGE[0] <= value <= TARGET_PRICE_RANGE[1]
+
+
+def _parse_price(raw: str) -> int | None:
+    try:
+        return int(raw.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _clean_text(raw: str) -> str:
+    return re.sub(r"\s+", " ", raw.strip())
+
+
+def extract_price_snapshot(html: str) -> int | None:
+    candidates: list[int] = []
+    for match in PRICE_PATTERN.finditer(html):
+        value = _parse_price(match.group(1))
+        if value is not None:
+            candidates.append(value)
+
+    if not candidates:
+        return None
+
+    # Prefer values in the expected range so we don't accidentally pick shipping/other UI values.
+    in_range = [value for value in candidates if _in_target_range(value)]
+    if in_range:
+        return in_range[0]
+
+    return candidates[0]
+
+
+def extract_title(html: str) -> str | None:
+    match = TITLE_PATTERN.search(html)
+    if not match:
+        return None
+    return _clean_text(match.group(1))
+
+
+def _looks_like_wishlist_html(html: str) -> bool:
+    if not html:
+        return False
+    if WISHLIST_ASIN_PATTERN.search(html):
+        return True
+    if any(marker in html for marker in WISHLIST_MARKERS):
+        return True
+    return False
+
+
+def _is_robot_block(html: str) -> bool:
+    if not html:
+        return True
+    lowered = html.lower()
+    return any(marker in lowered for marker in ROBOT_MARKERS)
+
+
+def summarize_wishlist(
+    asins: list[str],
+    titles_by_asin: dict[str, str],
+    prices: list[int],
+    page_title: str | None,
+    fallback_price: int | None,
+) -> dict[str, object]:
+    """Turn extracted matches into the summary returned by :func:`extract_wishlist_items_summary`.
+
+    ``titles_by_asin`` maps upper-cased ASINs to their first (whitespace-normalized) link title and
+    ``fallback_price`` is the :func:`extract_price_snapshot` value, used only without item prices.
+    """
+
+    item_count = max(len(asins), len(prices))
+
+    title: str | None = None
+    if len(asins) == 1:
+        title = titles_by_asin.get(asins[0].upper())
+    if not title:
+        title = page_title
+
+    unique_prices = list(dict.fromkeys(prices))
+    if not unique_prices and isinstance(fallback_price, int):
+        unique_prices = [fallback_price]
+    unique_in_range = [p for p in unique_prices if _in_target_range(p)]
+
+    price: int | None = None
+    if item_count == 1:
+        if len(unique_in_range) == 1:
+            price = unique_in_range[0]
+        elif len(unique_prices) == 1:
+            # Still return the price so we can show an out-of-range error.
+            price = unique_prices[0]
+    # For multi-item lists we only care about count; returning a price would be misleading.
+
+    return {
+        "item_count": item_count,
+        "title": title,
+        "price": price,
+        "asins": asins,
+        "prices": unique_prices,
+    }
+
+
+class WishlistScan:
+    """Compact result of one :data:`WISHLIST_SCAN_PATTERN` pass over a wishlist page.
+
+    Holds everything the separate extractors used to compute: ASINs and their link titles, item
+    prices (desktop and mobile), the ``extract_price_snapshot`` candidates, the page title and the
+    robot-check / wishlist markers.
+    """
+
+    __slots__ = (
+        "chars",
+        "asins",
+        "titles_by_asin",
+        "item_prices",
+        "mobile_prices",
+        "first_price",
+        "first_in_range_price",
+        "page_title",
+        "robot_marker_found",
+        "wishlist_marker_found",
+        "_title_end",
+        "_item_price_end",
+        "_mobile_price_end",
+    )
+
+    def __init__(self) -> None:
+        self.chars = 0
+        self.asins: dict[str, None] = {}
+        self.titles_by_asin: dict[str, str] = {}
+        self.item_prices: list[int] = []
+        self.mobile_prices: list[int] = []
+        self.first_price: int | None = None
+        self.first_in_range_price: int | None = None
+        self.page_title: str | None = None
+        self.robot_marker_found = False
+        self.wishlist_marker_found = False
+        self._title_end = -1
+        self._item_price_end = -1
+        self._mobile_price_end = -1
+
+    @property
+    def item_count(self) -> int:
+        return max(len(self.asins), len(self.item_prices) + len(self.mobile_prices))
+
+    @property
+    def is_robot_block(self) -> bool:
+        return self.chars == 0 or self.robot_marker_found
+
+    @property
+    def looks_like_wishlist(self) -> bool:
+        return bool(self.asins) or self.wishlist_marker_found
+
+    def price_snapshot(self) -> int | None:
+        return self.first_in_range_price if self.first_in_range_price is not None else self.first_price
+
+    def summary(self) -> dict[str, object]:
+        prices = self.item_prices + self.mobile_prices
+        asins = list(self.asins)
+        titles_by_asin = self.titles_by_asin if len(asins) == 1 else {}
+        fallback_price = None if prices else self.price_snapshot()
+        return summarize_wishlist(asins, titles_by_asin, prices, self.page_title, fallback_price)
+
+    def add(self, match: re.Match[str], base: int = 0) -> None:
+        """Record one match; ``base`` is the absolute offset of the text the match was found in."""
+
+        kind = match.lastgroup
+        start = base + match.start()
+        if kind == "asin" or kind == "asin_title":
+            self.asins.setdefault(match.group("asin"), None)
+            raw_title = match.group("asin_title")
+            if raw_title is not None and start - _ASIN_ANCHOR_OFFSET >= self._title_end:
+                self._title_end = base + match.end("asin_title") + 1
+                self.titles_by_asin.setdefault(match.group("asin").upper(), _clean_text(raw_title))
+        elif kind == "item_price":
+            if match.string.startswith("itemPrice", match.start() - 9):
+                self.wishlist_marker_found = True
+            if start - _ITEM_PRICE_ANCHOR_OFFSET >= self._item_price_end:
+                self._item_price_end = base + match.end("item_price")
+                value = _parse_price(match.group("item_price"))
+                if value is not None:
+                    self.item_prices.append(value)
+        elif kind == "mobile_price":
+            if start - _MOBILE_PRICE_ANCHOR_OFFSET >= self._mobile_price_end:
+                self._mobile_price_end = base + match.end("mobile_price")
+                value = _parse_price(match.group("mobile_price"))
+                if value is not None:
+                    self.mobile_prices.append(value)
+        elif kind == "price" or kind == "wide_price":
+            value = _parse_price(match.group(kind))
+            if value is not None:
+                if self.first_price is None:
+                    self.first_price = value
+                if self.first_in_range_price is None and _in_target_range(value):
+                    self.first_in_range_price = value
+        elif kind == "title":
+            if self.page_title is None:
+                self.page_title = _clean_text(match.group("title"))
+        elif kind == "robot" or kind == "api_robot":
+            self.robot_marker_found = True
+        elif kind == "marker" or kind == "list_marker":
+            self.wishlist_marker_found = True
+
+
+def scan_wishlist_html(html: str) -> WishlistScan:
+    scan = WishlistScan()
+    scan.chars = len(html)
+    for match in WISHLIST_SCAN_PATTERN.finditer(html):
+        scan.add(match)
+    return scan
+
+
+def extract_wishlist_items_summary(html: str) -> dict[str, object]:
+    """Extract wishlist item count and (when possible) a single target item's title/price.
+
+    This is intentionally regex-based to avoid brittle DOM parsing and to work in server environments.
+    """
+
+    return scan_wishlist_html(html).summary()
+
+
+class WishlistStreamParser:
+    """Incremental version of :func:`scan_wishlist_html` for chunked responses.
+
+    Feed decoded chunks with :meth:`feed`; once :attr:`decided` is True (two or more items found,
+    so the verdict is "too many items") callers can stop reading. :meth:`close` flushes the window
+    and :meth:`summary` returns the same dict the whole-document extractor would.
+
+    A match is only accepted once ``max_span`` characters after its start are buffered, because
+    until then more input could change what the engine picks; matches (including look-aheads)
+    longer than that are not supported, which bounds the window the parser has to keep.
+    """
+
+    max_span = 4096
+    # Characters kept before the resume point so look-behinds still see their context.
+    lookbehind_context = 64
+
+    def __init__(self, *, keep_html: bool = False, stop_when_decided: bool = True) -> None:
+        self.keep_html = keep_html
+        self.stop_when_decided = stop_when_decided
+        self.closed = False
+        self.scan = WishlistScan()
+        self._chunks: list[str] = []
+        self._buffer = ""
+        self._offset = 0
+        self._resume = 0
+
+    @property
+    def chars_read(self) -> int:
+        return self.scan.chars
+
+    @property
+    def html(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def item_count(self) -> int:
+        return self.scan.item_count
+
+    @property
+    def decided(self) -> bool:
+        return self.stop_when_decided and self.scan.item_count >= 2
+
+    @property
+    def is_robot_block(self) -> bool:
+        return self.scan.is_robot_block
+
+    @property
+    def looks_like_wishlist(self) -> bool:
+        return self.scan.looks_like_wishlist
+
+    def feed(self, text: str) -> None:
+        if self.closed or not text:
+            return
+        self.scan.chars += len(text)
+        if self.keep_html:
+            self._chunks.append(text)
+        self._buffer += text
+        self._scan(final=False)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._scan(final=True)
+        self.closed = True
+
+    def summary(self) -> dict[str, object]:
+        return self.scan.summary()
+
+    def _scan(self, final: bool) -> None:
+        buffer = self._buffer
+        pos = self._resume
+        for match in WISHLIST_SCAN_PATTERN.finditer(buffer, pos):
+            if not final and match.start() + self.max_span > len(buffer):
+                break
+            self.scan.add(match, self._offset)
+            pos = match.end()
+        # Nothing starting before this point can still match once more text arrives.
+        pos = len(buffer) if final else max(pos, len(buffer) - self.max_span)
+        keep_from = max(pos - self.lookbehind_context, 0)
+        self._buffer = buffer[keep_from:]
+        self._offset += keep_from
+        self._resume = pos - keep_from
@@ -1,40 +1,57 @@
 #!/usr/bin/env python3
-"""Backfill wishlist_items from existing users.wishlist_url values."""
+"""Backfill wishlist_items from existing users.wishlist_url values.
+
+Users are paged with keyset pagination on (created_at, id) and processed by a bounded pool of
+concurrent workers. Each page is written with one bulk upsert, and only then is the cursor saved
+to the checkpoint file, so an interrupted run resumes from the last completed page. A page whose
+upsert fails, or that hit Amazon's throttling, stops the run without moving the cursor. The
+checkpoint is removed once a run reaches the end of the users table.
+"""
 
 from __future__ import annotations
 
 import argparse
 import asyncio
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
 from typing import Iterable
 
 from dotenv import load_dotenv
+from fastapi import HTTPException, status
 
-from app.main import (
-    fetch_wishlist_snapshot,
-    normalize_wishlist_url,
-    supabase,
-    upsert_wishlist_item,
-)
+from app.clients import supabase
+from app.timeutil import utc_now
+from app.wishlist_fetch import fetch_wishlist_snapshot, normalize_wishlist_url
+from app.wishlist_items import upsert_wishlist_items, wishlist_item_row
 
 
 load_dotenv()
 
 BATCH_SIZE = 50
+CONCURRENCY = 4
+DEFAULT_CHECKPOINT = Path(__file__).resolve().parent / ".backfill_wishlist_items.checkpoint.json"
 
 
-def fetch_users(offset: int, limit: int) -> list[dict[str, object]]:
-    response = (
+def fetch_users(cursor: dict[str, str] | None, limit: int) -> list[dict[str, object]]:
+    query = (
         supabase.table("users")
-        .select("id,wishlist_url")
+        .select("id,wishlist_url,created_at")
         .filter("wishlist_url", "not.is", "null")
-        .order("created_at")
-        .range(offset, offset + limit - 1)
-        .execute()
     )
+    if cursor:
+        created_at = cursor["created_at"]
+        query = query.or_(
+            f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{cursor["id"]})'
+        )
+    response = query.order("created_at").order("id").limit(limit).execute()
     return response.data or []
 
 
 def filter_missing(users: Iterable[dict[str, object]]) -> list[dict[str, object]]:
+    users = list(users)
     user_ids = [user["id"] for user in users if user.get("id")]
     if not user_ids:
         return []
@@ -48,61 +65,155 @@ def filter_missing(users: Iterable[dict[str, object]]) -> list[dict[str, object]
     return [user for user in users if user.get("id") not in existing_ids]
 
 
-async def process_user(user: dict[str, object], *, dry_run: bool = False) -> bool:
+def load_checkpoint(path: Path) -> dict[str, str] | None:
+    if not path.exists():
+        return None
+    data = json.loads(path.read_text(encoding="utf-8"))
+    cursor = data.get("cursor")
+    return cursor if isinstance(cursor, dict) else None
+
+
+def save_checkpoint(path: Path, cursor: dict[str, str], outcomes: Counter[str]) -> None:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    payload = {"cursor": cursor, "outcomes": dict(outcomes), "saved_at": utc_now().isoformat()}
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+async def process_user(user: dict[str, object]) -> tuple[str, dict[str, object] | None]:
+    """Return an outcome category and, when the wishlist qualifies, the wishlist_items row."""
+
     user_id = user["id"]
     raw_url = user.get("wishlist_url")
     if not isinstance(raw_url, str):
-        return False
+        return "invalid_url", None
     try:
         normalized = normalize_wishlist_url(raw_url)
+    except HTTPException as exc:
+        print(f"Skipping {user_id}: {exc.detail}")
+        return "invalid_url", None
+    try:
         metadata = await fetch_wishlist_snapshot(normalized)
-    except Exception as exc:  # pragma: no cover - network/validation errors
+    except HTTPException as exc:
+        print(f"Skipping {user_id}: {exc.detail}")
+        if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            return "throttled", None
+        return "fetch_failed", None
+    except Exception as exc:  # pragma: no cover - network errors
         print(f"Skipping {user_id}: {exc}")
-        return False
+        return "error", None
 
     price = metadata.get("price")
     if not isinstance(price, int):
         print(f"Skipping {user_id}: price not detected")
-        return False
+        return "price_not_detected", None
     if price < 3000 or price > 4000:
         print(f"Skipping {user_id}: price {price} out of range")
-        return False
+        return "price_out_of_range", None
+
+    return "upserted", wishlist_item_row(user_id, metadata.get("title"), price, normalized)
 
-    if dry_run:
-        print(f"Would upsert wishlist for {user_id}: {metadata.get('title')} (¥{price})")
-        return True
 
-    upsert_wishlist_item(user_id, metadata.get("title"), price, normalized)
-    print(f"Upserted wishlist for {user_id}")
-    return True
+async def process_page(
+    users: list[dict[str, object]], semaphore: asyncio.Semaphore
+) -> list[tuple[str, dict[str, object] | None]]:
+    async def run(user: dict[str, object]) -> tuple[str, dict[str, object] | None]:
+        async with semaphore:
+            return await process_user(user)
 
+    return await asyncio.gather(*(run(user) for user in users))
 
-async def backfill_all(*, batch_size: int, dry_run: bool) -> None:
-    offset = 0
-    total_processed = 0
-    total_upserted = 0
+
+async def backfill_all(
+    *,
+    batch_size: int,
+    concurrency: int,
+    dry_run: bool,
+    checkpoint: Path,
+    resume: bool,
+) -> None:
+    cursor = load_checkpoint(checkpoint) if resume else None
+    if cursor:
+        print(f"Resuming after user {cursor['id']} (created_at {cursor['created_at']})")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes: Counter[str] = Counter()
+    scanned = 0
+    started = time.monotonic()
+    finished = False
 
     while True:
-        users = fetch_users(offset, batch_size)
+        users = fetch_users(cursor, batch_size)
         if not users:
+            finished = True
+            break
+        scanned += len(users)
+        results = await process_page(filter_missing(users), semaphore)
+        page_outcomes = Counter(outcome for outcome, _ in results)
+        rows = [row for _, row in results if row is not None]
+
+        if dry_run:
+            for row in rows:
+                print(f"Would upsert wishlist for {row['user_id']}: {row['title']} (¥{row['price']})")
+        else:
+            try:
+                upsert_wishlist_items(rows)
+            except Exception as exc:  # pragma: no cover - network errors
+                print(f"Bulk upsert of {len(rows)} rows failed: {exc}")
+                page_outcomes["upsert_failed"] += len(rows)
+                page_outcomes["upserted"] -= len(rows)
+        outcomes.update(page_outcomes)
+
+        if page_outcomes["upsert_failed"]:
+            # Same as throttling: the page's users must be retried, so the cursor stays before it.
+            print("Stopping after the failed upsert. Re-run to resume from the checkpoint.")
+            break
+        if page_outcomes["throttled"]:
+            # Leave the cursor before this page so a later run retries the throttled users.
+            print("Amazon is throttling requests; stopping. Re-run later to resume from the checkpoint.")
             break
-        missing = filter_missing(users)
-        for user in missing:
-            if await process_user(user, dry_run=dry_run):
-                total_upserted += 1
-            total_processed += 1
-        offset += batch_size
+        last = users[-1]
+        cursor = {"created_at": str(last["created_at"]), "id": str(last["id"])}
+        if not dry_run:
+            save_checkpoint(checkpoint, cursor, outcomes)
+        if len(users) < batch_size:
+            finished = True
+            break
+
+    if finished and not dry_run:
+        # A completed run must not make the next one skip every user.
+        checkpoint.unlink(missing_ok=True)
 
-    print(f"Processed {total_processed} users, upserted {total_upserted} entries.")
+    elapsed = time.monotonic() - started
+    processed = sum(outcomes.values())
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Scanned {scanned} users, processed {processed} without a wishlist item in {elapsed:.1f}s "
+        f"({rate:.2f} users/s), upserted {outcomes['upserted']} entries."
+    )
+    for category, count in sorted(outcomes.items()):
+        if category != "upserted" and count:
+            print(f"  {category}: {count}")
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Backfill wishlist_items from users table")
     parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Number of users to fetch per batch")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Number of wishlists fetched at once")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="File that stores the resume cursor")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start from the beginning")
     parser.add_argument("--dry-run", action="store_true", help="Only log actions without writing to Supabase")
     args = parser.parse_args()
 
-    asyncio.run(backfill_all(batch_size=args.batch_size, dry_run=args.dry_run))
+    asyncio.run(
+        backfill_all(
+            batch_size=args.batch_size,
+            concurrency=max(args.concurrency, 1),
+            dry_run=args.dry_run,
+            checkpoint=args.checkpoint,
+            resume=not args.restart,
+        )
+    )
 
 
 if __name__ == "__main__":
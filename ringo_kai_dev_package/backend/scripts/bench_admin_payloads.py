@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Serialization time and bytes on the wire for the large admin responses.
+
+Seeds the in-memory Supabase fake with ``--purchases`` submitted purchases (OCR snapshot,
+verification metadata and an assigned wishlist item each), ``--apples`` apples and their users,
+then fetches /api/admin/verifications and /api/admin/dashboard through the app and reports:
+
+- serialization: the old path (jsonable_encoder + stdlib json via JSONResponse), jsonable_encoder
+  + orjson (what the default ORJSONResponse does for a plain return value) and orjson alone (what
+  the two admin endpoints now return), after checking all three produce the same JSON;
+- compression: bytes and time for gzip (the middleware's level 6, and 9) and brotli (quality 4
+  and 11; only when the ``brotli`` package is installed);
+- end to end: median latency and bytes on the wire per Accept-Encoding through the middleware stack.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+import httpx
+
+ADMIN_TOKEN = "bench-admin"
+ENDPOINTS = ("/api/admin/verifications", "/api/admin/dashboard")
+
+
+def seed(fake: Any, purchases: int, apples: int) -> None:
+    now = datetime.now(timezone.utc)
+    user_count = max(purchases, apples) + 1
+    users = [
+        {
+            "id": f"00000000-0000-4000-8000-{index:012d}",
+            "email": f"user{index}@example.com",
+            "status": "active" if index % 3 else "ready_to_draw",
+            "referral_code": f"RK{index:06d}",
+            "purchase_obligation": 1,
+            "purchase_available": 1,
+            "created_at": (now - timedelta(days=index % 90)).isoformat(),
+        }
+        for index in range(user_count)
+    ]
+    fake.tables["users"] = users
+    fake.tables["purchases"] = [
+        {
+            "id": index + 1,
+            "purchaser_id": users[index]["id"],
+            "target_user_id": users[index + 1]["id"],
+            "status": "submitted" if index % 4 else "review_required",
+            "verification_status": "review",
+            "verification_result": "注文番号と商品名は一致しましたが、金額の確認が必要です。",
+            "screenshot_url": f"https://fake-supabase.local/storage/v1/object/sign/purchase-screenshots/{index}.webp?token=abc",
+            "screenshot_thumbnail_url": f"https://fake-supabase.local/storage/v1/object/sign/purchase-screenshots/{index}_thumb.webp?token=abc",
+            "admin_notes": None,
+            "created_at": (now - timedelta(minutes=index)).isoformat(),
+            "verified_at": None,
+            "target_item_name": f"ステンレス製 真空断熱タンブラー 600ml #{index}",
+            "target_item_price": 2980 + index,
+            "target_wishlist_url": "https://www.amazon.co.jp/hz/wishlist/ls/33U0W5W9VAU29",
+            "ocr_snapshot": {
+                "item_name": f"ステンレス製 真空断熱タンブラー 600ml #{index}",
+                "order_id": f"250-{index:07d}-{index * 7 % 10_000_000:07d}",
+                "price": 2980 + index,
+                "confidence": 0.82,
+                "matched_name": True,
+                "matched_price": index % 5 != 0,
+            },
+            "verification_metadata": {
+                "model": "gpt-4o-mini",
+                "screenshot_sha256": f"{index:064x}",
+                "llm": {
+                    "decision": "review",
+                    "reason": "金額の表示が一部隠れているため確認が必要です。",
+                    "checks": {"order_id": True, "item_name": True, "price": index % 5 != 0, "recipient": True},
+                },
+                "latency_ms": 1830 + index,
+            },
+        }
+        for index in range(purchases)
+    ]
+    fake.tables["wishlist_items"] = [
+        {
+            "id": index + 1,
+            "user_id": users[index + 1]["id"],
+            "title": f"ステンレス製 真空断熱タンブラー 600ml #{index}",
+            "price": 2980 + index,
+            "url": f"https://www.amazon.co.jp/dp/B0{index:08d}",
+            "assigned_purchase_id": index + 1,
+            "is_eligible": True,
+            "created_at": (now - timedelta(days=3)).isoformat(),
+            "updated_at": (now - timedelta(minutes=index)).isoformat(),
+        }
+        for index in range(purchases)
+    ]
+    apple_types = ("bronze", "silver", "gold", "red", "poison")
+    fake.tables["apples"] = [
+        {
+            "id": index + 1,
+            "user_id": users[index % user_count]["id"],
+            "apple_type": apple_types[index % len(apple_types)],
+            "status": "revealed",
+            "draw_time": (now - timedelta(hours=index)).isoformat(),
+            "reveal_time": (now - timedelta(hours=index) + timedelta(minutes=10)).isoformat(),
+            "is_revealed": True,
+            "purchase_available": index % 3,
+            "purchase_obligation": 1,
+            "purchase_id": None,
+        }
+        for index in range(apples)
+    ]
+    fake.tables["rtp_snapshots"] = [
+        {
+            "rtp": 0.97,
+            "probabilities": {"bronze": 0.4, "silver": 0.25, "gold": 0.1, "red": 0.05, "poison": 0.2},
+            "captured_at": now.isoformat(),
+        }
+    ]
+
+
+def median_ms(func: Callable[[], Any], rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def serialization(name: str, payload: Any, rounds: int) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+
+    variants = {
+        "jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(payload)).body,
+        "jsonable_encoder + orjson": lambda: ORJSONResponse(jsonable_encoder(payload)).body,
+        "orjson": lambda: ORJSONResponse(payload).body,
+    }
+    bodies = {label: render() for label, render in variants.items()}
+    decoded = {label: json.loads(body) for label, body in bodies.items()}
+    if any(value != decoded["jsonable_encoder + json"] for value in decoded.values()):
+        raise SystemExit(f"{name}: serializers disagree on the JSON produced")
+
+    print(f"\n{name}: {len(bodies['orjson']):,} bytes of JSON")
+    baseline = median_ms(variants["jsonable_encoder + json"], rounds)
+    for label, render in variants.items():
+        elapsed = baseline if label == "jsonable_encoder + json" else median_ms(render, rounds)
+        print(f"  {label:28s} {elapsed:8.3f} ms  {baseline / elapsed:5.1f}x")
+    return bodies["orjson"]
+
+
+def compression(body: bytes, rounds: int) -> None:
+    def gzip_body(level: int) -> bytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+
+    codecs: dict[str, Callable[[], bytes]] = {"gzip -6": lambda: gzip_body(6), "gzip -9": lambda: gzip_body(9)}
+    try:
+        import brotli
+    except ImportError:
+        print("  (brotli is not installed; pip install brotli to compare it)")
+    else:
+        codecs["brotli q4"] = lambda: brotli.compress(body, quality=4)
+        codecs["brotli q11"] = lambda: brotli.compress(body, quality=11)
+    for label, compress in codecs.items():
+        size = len(compress())
+        print(f"  {label:28s} {median_ms(compress, rounds):8.3f} ms  {size:9,} bytes ({size / len(body):6.1%})")
+
+
+async def end_to_end(app_main: Any, rounds: int) -> None:
+    encodings = ["identity", "gzip"]
+    if importlib.import_module("app.compression").brotli is not None:
+        encodings.append("br")
+    transport = httpx.ASGITransport(app=app_main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"X-Admin-Token": ADMIN_TOKEN}) as client:
+        print(f"\n{'endpoint':28s} {'encoding':9s} {'median':>9s} {'bytes':>10s}")
+        for path in ENDPOINTS:
+            for encoding in encodings:
+                samples = []
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    async with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+                        response.raise_for_status()
+                        # Count the encoded bytes; responses streamed by the middleware carry no Content-Length.
+                        size = sum([len(chunk) async for chunk in response.aiter_raw()])
+                    samples.append(time.perf_counter() - started)
+                served = response.headers.get("content-encoding", "identity")
+                print(f"{path:28s} {served:9s} {statistics.median(samples) * 1000:7.2f}ms {size:10,}")
+
+
+async def fetch_payloads(app_main: Any) -> dict[str, Any]:
+    transport = httpx.ASGITransport(app=app_main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"X-Admin-Token": ADMIN_TOKEN}) as client:
+        payloads = {}
+        for path in ENDPOINTS:
+            response = await client.get(path, headers={"Accept-Encoding": "identity"})
+            response.raise_for_status()
+            payloads[path] = response.json()
+        return payloads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serialization and compression of the admin responses")
+    parser.add_argument("--purchases", type=int, default=200, help="Submitted purchases (the endpoint returns at most 200)")
+    parser.add_argument("--apples", type=int, default=40, help="Apples (the dashboard lists the latest 40)")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    # app.main reads its configuration at import time.
+    os.environ.update({"SUPABASE_BACKEND": "memory", "FAKE_SUPABASE_LATENCY_MS": "0", "ADMIN_API_KEY": ADMIN_TOKEN})
+    app_main = importlib.import_module("app.main")
+    fake = importlib.import_module("app.clients").supabase_client.instance()
+    seed(fake, args.purchases, args.apples)
+
+    payloads = asyncio.run(fetch_payloads(app_main))
+    for path, payload in payloads.items():
+        body = serialization(path, payload, args.rounds)
+        compression(body, args.rounds)
+    asyncio.run(end_to_end(app_main, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
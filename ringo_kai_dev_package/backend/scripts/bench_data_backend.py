@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Latency of the hot read paths through PostgREST vs. the direct psycopg pool.
+
+Calls the same helpers the endpoints use (fetch_user_row, fetch_current_apple_rows,
+fetch_current_purchase_rows, fetch_available_wishlist_items, fetch_purchase_balances), once with
+PostgREST and once with a PostgresHotPaths instance, checks that both return the same data and
+prints p50/p99 per query. Needs SUPABASE_URL/SUPABASE_SERVICE_KEY, SUPABASE_DB_URL and the id of
+an existing user.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+import app.main as app_main
+from app.pg_backend import PostgresHotPaths
+
+load_dotenv()
+
+def hot_queries(user_id: str) -> dict[str, Callable[[], Any]]:
+    return {
+        "user_row": lambda: app_main.fetch_user_row(user_id),
+        "current_apple": lambda: app_main.fetch_current_apple_rows(user_id),
+        "current_purchase": lambda: app_main.fetch_current_purchase_rows(user_id),
+        "assignable_wishlist_items": lambda: app_main.fetch_available_wishlist_items(user_id, limit=20),
+        "purchase_balances": app_main.fetch_purchase_balances,
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int) -> tuple[Any, dict[str, float]]:
+    result = None
+    for _ in range(warmup):
+        result = func()
+    samples: list[float] = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, {
+        "p50_ms": statistics.median(samples),
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare PostgREST and direct Postgres latency for the hot queries")
+    parser.add_argument("--user-id", required=True, help="Existing users.id to query with")
+    parser.add_argument("--database-url", default=os.environ.get("SUPABASE_DB_URL"))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed calls first (connects, prepares statements)")
+    args = parser.parse_args()
+    if not args.database_url:
+        raise SystemExit("SUPABASE_DB_URL is required (or pass --database-url)")
+
+    pg = PostgresHotPaths(args.database_url, min_size=1, max_size=2)
+    pg.open()
+    mismatches = 0
+    try:
+        print(f"{'query':28s} {'postgrest p50':>14s} {'p99':>9s} {'postgres p50':>14s} {'p99':>9s}")
+        for name, func in hot_queries(args.user_id).items():
+            app_main.pg_hot_paths = None
+            rest_result, rest = measure(func, args.iterations, args.warmup)
+            app_main.pg_hot_paths = pg
+            pg_result, direct = measure(func, args.iterations, args.warmup)
+            if rest_result != pg_result:
+                mismatches += 1
+                print(f"[mismatch] {name}: postgrest={rest_result!r} postgres={pg_result!r}")
+            print(
+                f"{name:28s} {rest['p50_ms']:12.2f}ms {rest['p99_ms']:7.2f}ms "
+                f"{direct['p50_ms']:12.2f}ms {direct['p99_ms']:7.2f}ms"
+            )
+    finally:
+        app_main.pg_hot_paths = None
+        pg.close()
+    if mismatches:
+        raise SystemExit(f"{mismatches} query result(s) differ between the two backends")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""CPU cost of the probability and economy helpers, per call and per draw / probability view.
+
+Times the pure helpers behind /api/apple/probabilities and /api/apple/draw over a fixed mix of
+inputs (referral counts across every table row, RTP above/inside/below the dead band, every
+recency and completion bracket), plus two composites:
+
+- ``probability_view``: the pure part of calculate_probability_profile (table lookup, RTP and
+  predicted-RTP adjustment, recency and completion adjustments, final normalization) together
+  with build_thresholds and build_anonymous_alias, with the database lookups replaced by
+  fixed inputs.
+- ``draw``: ``probability_view`` plus the weighted choice draw_apple makes.
+
+Every run first checks that each adjusted distribution is non-negative and sums to 1, then
+prints calls/sec and p99 next to the stored baseline and fails when a helper regressed beyond
+the threshold. Baselines are machine-specific: refresh them with --update-baseline on the machine
+that runs the check (and after an intentional probability-rule change).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from app.main import build_anonymous_alias
+from app.rtp import (
+    BOOTSTRAP_PROBABILITY_TABLE,
+    STRICT_REFERRAL_PROBABILITY_TABLE,
+    adjust_probabilities_by_rtp,
+    apply_completion_adjustment,
+    apply_last_silver_gold_adjustment,
+    build_thresholds,
+    calculate_predictive_rtp,
+    normalize_probabilities,
+    select_probability_row,
+)
+from app.timeutil import parse_timestamp
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "fixtures" / "probability_benchmark_baseline.json"
+
+REFERRAL_COUNTS = (0, 1, 3, 4, 7, 12, 25, 100)
+RTPS = (0.6, 0.93, 1.0, 1.04, 1.12, 1.6)
+DAYS_SINCE = (None, 2, 9, 20, 45)
+COMPLETIONS = (0, 1, 2, 5)
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+TIMESTAMPS = (
+    "2026-01-10T08:30:00+00:00",
+    "2026-01-10T08:30:00.123456Z",
+    "2025-12-01T00:00:00Z",
+    NOW - timedelta(days=3),
+    None,
+)
+USER_IDS = (
+    "0b9f5e1c-3a77-4c1e-9d5e-2f6a1c9b7e41",
+    "7d2c4a90-51bb-4f0e-8c3a-9e1d2b6f0a13",
+    "not-a-uuid",
+    "",
+    None,
+)
+
+
+def _profile(referral_count: int, rtp: float, days_since: int | None, completions: int) -> dict[str, float]:
+    """Same order of operations as calculate_probability_profile with dynamic probabilities."""
+
+    probabilities = select_probability_row(referral_count, STRICT_REFERRAL_PROBABILITY_TABLE)
+    probabilities = adjust_probabilities_by_rtp(probabilities, rtp)
+    predicted = calculate_predictive_rtp(rtp, 40, 1200)
+    if abs(predicted - rtp) > 0.02:
+        probabilities = adjust_probabilities_by_rtp(probabilities, predicted)
+    probabilities, _ = apply_last_silver_gold_adjustment(probabilities, days_since)
+    probabilities, _ = apply_completion_adjustment(probabilities, completions)
+    return normalize_probabilities(probabilities)
+
+
+def probability_view(referral_count: int, rtp: float, days_since: int | None, completions: int, user_id: str) -> Any:
+    return _profile(referral_count, rtp, days_since, completions), build_thresholds(referral_count), build_anonymous_alias(user_id)
+
+
+def draw(referral_count: int, rtp: float, days_since: int | None, completions: int, user_id: str) -> str:
+    probabilities, _, _ = probability_view(referral_count, rtp, days_since, completions, user_id)
+    apples = list(probabilities.keys())
+    return random.choices(apples, weights=[probabilities[apple] for apple in apples], k=1)[0]
+
+
+def build_cases() -> dict[str, tuple[Callable[..., Any], list[tuple[Any, ...]]]]:
+    rng = random.Random(46)
+    base_rows = [select_probability_row(count, STRICT_REFERRAL_PROBABILITY_TABLE) for count in REFERRAL_COUNTS]
+    scenarios = [
+        (count, rtp, days, completions, rng.choice(USER_IDS))
+        for count in REFERRAL_COUNTS
+        for rtp in RTPS
+        for days in DAYS_SINCE
+        for completions in COMPLETIONS
+    ]
+    tables = (BOOTSTRAP_PROBABILITY_TABLE, STRICT_REFERRAL_PROBABILITY_TABLE)
+    return {
+        "select_probability_row": (select_probability_row, [(count, table) for count in REFERRAL_COUNTS for table in tables]),
+        "adjust_probabilities_by_rtp": (adjust_probabilities_by_rtp, [(base, rtp) for base in base_rows for rtp in RTPS]),
+        "apply_last_silver_gold_adjustment": (apply_last_silver_gold_adjustment, [(base, days) for base in base_rows for days in DAYS_SINCE]),
+        "apply_completion_adjustment": (apply_completion_adjustment, [(base, count) for base in base_rows for count in COMPLETIONS]),
+        "normalize_probabilities": (normalize_probabilities, [(base,) for base in base_rows] + [({key: 0.0 for key in base_rows[0]},)]),
+        "build_thresholds": (build_thresholds, [(count,) for count in REFERRAL_COUNTS]),
+        "parse_timestamp": (parse_timestamp, [(value,) for value in TIMESTAMPS]),
+        "build_anonymous_alias": (build_anonymous_alias, [(user_id,) for user_id in USER_IDS]),
+        "probability_view": (probability_view, scenarios),
+        "draw": (draw, scenarios),
+    }
+
+
+def check_distributions(cases: dict[str, tuple[Callable[..., Any], list[tuple[Any, ...]]]]) -> list[str]:
+    failures: list[str] = []
+    for name in ("adjust_probabilities_by_rtp", "apply_last_silver_gold_adjustment", "apply_completion_adjustment", "normalize_probabilities"):
+        func, inputs = cases[name]
+        for args in inputs:
+            result = func(*args)
+            probabilities = result[0] if isinstance(result, tuple) else result
+            if any(value < 0 for value in probabilities.values()) or not math.isclose(sum(probabilities.values()), 1.0, abs_tol=1e-9):
+                failures.append(f"{name}{args[1:]}: {probabilities}")
+    for args in cases["probability_view"][1]:
+        probabilities = _profile(*args[:4])
+        if any(value < 0 for value in probabilities.values()) or not math.isclose(sum(probabilities.values()), 1.0, abs_tol=1e-9):
+            failures.append(f"probability_view{args[:4]}: {probabilities}")
+    return failures
+
+
+def measure(func: Callable[..., Any], inputs: list[tuple[Any, ...]], rounds: int, trials: int) -> dict[str, float]:
+    """Best throughput and p99 over ``trials`` runs, which filters out most scheduler noise.
+
+    Throughput comes from an untimed loop: most helpers take about a microsecond, so timing each
+    call would mostly measure the timer. p99 comes from a second, per-call pass.
+    """
+
+    for args in inputs:
+        func(*args)
+    best_rate = 0.0
+    best_p99 = float("inf")
+    for _ in range(trials):
+        started = time.perf_counter_ns()
+        for _ in range(rounds):
+            for args in inputs:
+                func(*args)
+        elapsed = (time.perf_counter_ns() - started) / 1e9
+        best_rate = max(best_rate, rounds * len(inputs) / elapsed)
+        samples: list[int] = []
+        for args in inputs * max(rounds // 10, 1):
+            call_started = time.perf_counter_ns()
+            func(*args)
+            samples.append(time.perf_counter_ns() - call_started)
+        samples.sort()
+        best_p99 = min(best_p99, samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e3)
+    return {"calls_per_second": round(best_rate, 1), "p99_us": round(best_p99, 3)}
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+    p99_threshold: float,
+) -> list[str]:
+    regressions: list[str] = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if current["calls_per_second"] < reference["calls_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {current['calls_per_second']:.0f} calls/s vs baseline {reference['calls_per_second']:.0f}"
+            )
+        if current["p99_us"] > reference["p99_us"] * (1 + p99_threshold):
+            regressions.append(f"{name}: p99 {current['p99_us']:.2f}us vs baseline {reference['p99_us']:.2f}us")
+    return regressions
+
+
+def report(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]]) -> None:
+    print(f"{'helper':36s} {'calls/s':>12s} {'µs/call':>9s} {'p99 µs':>9s} {'baseline/s':>12s} {'change':>8s}")
+    for name, result in results.items():
+        rate = result["calls_per_second"]
+        reference = baseline.get(name, {}).get("calls_per_second")
+        change = f"{(rate / reference - 1) * 100:+7.1f}%" if reference else "     new"
+        reference_text = f"{reference:12,.0f}" if reference else f"{'-':>12s}"
+        print(f"{name:36s} {rate:12,.0f} {1e6 / rate:9.2f} {result['p99_us']:9.2f} {reference_text} {change}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the probability and economy helpers against a stored baseline")
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the input mix per trial")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="Benchmark only these helpers")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.3, help="Allowed throughput regression (0.3 = 30%%)")
+    parser.add_argument("--p99-threshold", type=float, default=0.6, help="Allowed p99 regression; tail latency is noisier")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run's numbers as the new baseline")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    failures = check_distributions(cases)
+    if failures:
+        for failure in failures[:20]:
+            print(f"[invalid] {failure}")
+        raise SystemExit(f"{len(failures)} distribution(s) are negative or do not sum to 1")
+
+    selected = {name: case for name, case in cases.items() if not args.only or name in args.only}
+    # The composites walk every scenario, so they get fewer passes to keep the run short.
+    results = {
+        name: measure(func, inputs, max(args.rounds // 10, 1) if name in {"probability_view", "draw"} else args.rounds, args.trials)
+        for name, (func, inputs) in selected.items()
+    }
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    report(results, baseline)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    regressions = compare(results, baseline, args.threshold, args.p99_threshold)
+    if regressions:
+        for regression in regressions:
+            print(f"[regression] {regression}")
+        raise SystemExit(f"{len(regressions)} metric(s) regressed beyond the allowed threshold")
+
+
+if __name__ == "__main__":
+    main()
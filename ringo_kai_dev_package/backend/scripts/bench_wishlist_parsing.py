@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Regression and throughput check for wishlist parsing against the offline fixture corpus.
+
+scripts/fixtures/wishlist holds anonymized desktop, mobile, robot-check and multi-item pages
+together with expected.json. Every run first checks that the parsers still return the expected
+values, then times extract_wishlist_items_summary, extract_price_snapshot and
+normalize_wishlist_url and compares pages/sec and p99 against the stored baseline.
+
+Baselines are machine-specific: refresh them with --update-baseline on the machine that runs
+the check.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+from fastapi import HTTPException
+
+from app.wishlist_fetch import normalize_wishlist_url
+from app.wishlist_parser import extract_price_snapshot, extract_wishlist_items_summary
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "wishlist"
+DEFAULT_BASELINE = FIXTURE_DIR / "benchmark_baseline.json"
+
+
+def load_corpus() -> tuple[dict[str, str], dict[str, object]]:
+    expected = json.loads((FIXTURE_DIR / "expected.json").read_text(encoding="utf-8"))
+    pages = {name: (FIXTURE_DIR / name).read_text(encoding="utf-8") for name in expected["pages"]}
+    return pages, expected
+
+
+def _normalize_or_status(url: str) -> dict[str, object]:
+    try:
+        return {"normalized": normalize_wishlist_url(url)}
+    except HTTPException as exc:
+        return {"status_code": exc.status_code}
+
+
+def check_expected(pages: dict[str, str], expected: dict[str, object]) -> list[str]:
+    failures: list[str] = []
+    for name, html in pages.items():
+        want = expected["pages"][name]
+        summary = extract_wishlist_items_summary(html)
+        if summary != want["summary"]:
+            failures.append(f"{name}: summary {summary} != {want['summary']}")
+        snapshot = extract_price_snapshot(html)
+        if snapshot != want["price_snapshot"]:
+            failures.append(f"{name}: price snapshot {snapshot} != {want['price_snapshot']}")
+    for url, want in expected["urls"].items():
+        got = _normalize_or_status(url)
+        if got != want:
+            failures.append(f"normalize_wishlist_url({url!r}): {got} != {want}")
+    return failures
+
+
+def measure(func: Callable[[str], object], inputs: list[str], rounds: int, trials: int) -> dict[str, float]:
+    """Best throughput and p99 over ``trials`` runs, which filters out most scheduler noise."""
+
+    for value in inputs:
+        func(value)
+    best_rate = 0.0
+    best_p99 = float("inf")
+    for _ in range(trials):
+        samples: list[int] = []
+        started = time.perf_counter_ns()
+        for _ in range(rounds):
+            for value in inputs:
+                call_started = time.perf_counter_ns()
+                func(value)
+                samples.append(time.perf_counter_ns() - call_started)
+        elapsed = (time.perf_counter_ns() - started) / 1e9
+        samples.sort()
+        best_rate = max(best_rate, len(samples) / elapsed)
+        best_p99 = min(best_p99, samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e6)
+    return {"pages_per_second": round(best_rate, 1), "p99_ms": round(best_p99, 4)}
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+    p99_threshold: float,
+) -> list[str]:
+    regressions: list[str] = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if current["pages_per_second"] < reference["pages_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {current['pages_per_second']:.0f} pages/s vs baseline {reference['pages_per_second']:.0f}"
+            )
+        if current["p99_ms"] > reference["p99_ms"] * (1 + p99_threshold):
+            regressions.append(f"{name}: p99 {current['p99_ms']:.3f}ms vs baseline {reference['p99_ms']:.3f}ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check wishlist parsing output and speed against the fixture corpus")
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the corpus per trial")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.3, help="Allowed throughput regression (0.3 = 30%%)")
+    parser.add_argument("--p99-threshold", type=float, default=0.6, help="Allowed p99 regression; tail latency is noisier")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run's numbers as the new baseline")
+    args = parser.parse_args()
+
+    pages, expected = load_corpus()
+    failures = check_expected(pages, expected)
+    if failures:
+        for failure in failures:
+            print(f"[mismatch] {failure}")
+        raise SystemExit(f"{len(failures)} fixture expectation(s) failed")
+
+    html_inputs = list(pages.values())
+    results = {
+        "extract_wishlist_items_summary": measure(extract_wishlist_items_summary, html_inputs, args.rounds, args.trials),
+        "extract_price_snapshot": measure(extract_price_snapshot, html_inputs, args.rounds, args.trials),
+        "normalize_wishlist_url": measure(_normalize_or_status, list(expected["urls"]), args.rounds, args.trials),
+    }
+    for name, result in results.items():
+        print(f"{name:32s} {result['pages_per_second']:>12,.0f} pages/s   p99 {result['p99_ms']:.4f}ms")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare(results, baseline, args.threshold, args.p99_threshold)
+    if regressions:
+        for regression in regressions:
+            print(f"[regression] {regression}")
+        raise SystemExit(f"{len(regressions)} metric(s) regressed beyond the allowed threshold")
+
+
+if __name__ == "__main__":
+    main()
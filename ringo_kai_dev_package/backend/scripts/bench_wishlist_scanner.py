@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Compare the single-pass wishlist scanner against the previous multi-pass extraction.
+
+Generates representative desktop and mobile wishlist pages (plus robot-check pages), checks
+that ``scan_wishlist_html`` returns exactly what the per-pattern pipeline returned, then times
+both. Exits non-zero on any parity mismatch.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import statistics
+import time
+
+from app.wishlist_parser import (
+    WISHLIST_ASIN_PATTERN,
+    WISHLIST_ASIN_TITLE_PATTERN,
+    WISHLIST_ITEM_PRICE_PATTERN,
+    WISHLIST_MOBILE_PRICE_PATTERN,
+    _is_robot_block,
+    _looks_like_wishlist_html,
+    extract_price_snapshot,
+    extract_title,
+    scan_wishlist_html,
+    summarize_wishlist,
+)
+
+FILLER = (
+    '<div class="a-row">',
+    "<span>",
+    "</span>",
+    "</div>",
+    "配送料無料",
+    "¥ 1,200",
+    "ポイント",
+    '<a href="/gp/help">help</a>',
+    "lorem ipsum ",
+    "\n   ",
+)
+
+
+def _filler(rng: random.Random, count: int) -> str:
+    return "".join(rng.choice(FILLER) for _ in range(count))
+
+
+def make_page(seed: int, *, items: int, mobile: bool, robot: bool = False) -> str:
+    rng = random.Random(seed)
+    parts = ["<html><head><title>\n Amazon.co.jp: 欲しいものリスト  テスト \n</title></head><body>", _filler(rng, 300)]
+    if robot:
+        parts.append("<p>Enter the characters you see below</p>")
+    else:
+        parts.append('<div class="wl-list-item">' if mobile else '<ul id="g-items">')
+    for index in range(items):
+        asin = "B0%08d" % rng.randint(0, 10**8 - 1)
+        price = rng.choice([3590, 3980, 1200, 5000, 3000])
+        parts.append(f'<li><a href="/dp/{asin}/?coliid=I{index}" class="a-link" title="商品 {index}  タイトル">商品</a>')
+        parts.append(_filler(rng, rng.randint(5, 60)))
+        anchor = 'data-cy="price-recipe"' if mobile else f'id="itemPrice_I{index}"'
+        parts.append(f'<span {anchor}>{_filler(rng, rng.randint(1, 20))}<span class="a-offscreen">￥{price:,}</span></span>')
+        parts.append(_filler(rng, rng.randint(50, 400)))
+    parts.append(_filler(rng, 2000) + "</body></html>")
+    return "".join(parts)
+
+
+def multi_pass(html: str) -> tuple[dict[str, object], bool, bool]:
+    """The extraction as it was before the combined pattern: one regex pass per field."""
+
+    asins = list(dict.fromkeys(WISHLIST_ASIN_PATTERN.findall(html)))
+    prices: list[int] = []
+    for pattern in (WISHLIST_ITEM_PRICE_PATTERN, WISHLIST_MOBILE_PRICE_PATTERN):
+        for raw in pattern.findall(html):
+            prices.append(int(raw.replace(",", "")))
+    titles_by_asin: dict[str, str] = {}
+    if len(asins) == 1:
+        for asin, raw_title in WISHLIST_ASIN_TITLE_PATTERN.findall(html):
+            titles_by_asin.setdefault(asin.upper(), re.sub(r"\s+", " ", raw_title).strip())
+    fallback = None if prices else extract_price_snapshot(html)
+    summary = summarize_wishlist(asins, titles_by_asin, prices, extract_title(html), fallback)
+    return summary, _is_robot_block(html), _looks_like_wishlist_html(html)
+
+
+def single_pass(html: str) -> tuple[dict[str, object], bool, bool]:
+    scan = scan_wishlist_html(html)
+    return scan.summary(), not html or scan.is_robot_block, bool(html) and scan.looks_like_wishlist
+
+
+def _time(func, pages: list[str], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html in pages:
+            func(html)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark single-pass vs multi-pass wishlist extraction")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per shape")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    shapes = {
+        "desktop single": dict(items=1, mobile=False),
+        "desktop multi": dict(items=25, mobile=False),
+        "mobile single": dict(items=1, mobile=True),
+        "mobile multi": dict(items=25, mobile=True),
+        "robot check": dict(items=0, mobile=False, robot=True),
+    }
+
+    mismatches = 0
+    for name, options in shapes.items():
+        pages = [make_page(seed, **options) for seed in range(args.pages)]
+        for seed, html in enumerate(pages):
+            if multi_pass(html) != single_pass(html):
+                mismatches += 1
+                print(f"[mismatch] {name} seed={seed}")
+        before = _time(multi_pass, pages, args.repeat)
+        after = _time(single_pass, pages, args.repeat)
+        avg_kb = sum(len(html) for html in pages) / len(pages) / 1024
+        print(
+            f"{name:15s} {avg_kb:7.1f}KB/page  multi-pass {before / len(pages) * 1000:7.3f}ms"
+            f"  single-pass {after / len(pages) * 1000:7.3f}ms  speedup {before / after:5.2f}x"
+        )
+
+    if mismatches:
+        raise SystemExit(f"{mismatches} page(s) differ between single-pass and multi-pass extraction")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Check the screenshot duplicate threshold against synthetic order-page screenshots.
+
+Renders phone-sized "order details" pages (same template, per-order date, order number, item,
+price and card digits; several orders share an item, as buyers of one wishlist would) and compares
+perceptual hashes of:
+
+- each page and copies of it (JPEG q60, WebP q85, bilinear and Lanczos downscales): light
+  re-encodes and plain resizes must all stay at or below SCREENSHOT_DUPLICATE_MAX_DISTANCE, the
+  heavier ones are reported;
+- every pair of different orders: at most ``--max-false-rate`` of them may fall within it;
+- blank and flat-colour screenshots: these must carry too little detail to be matched at all.
+
+Exits non-zero when a check fails, so a change to the hash grid or the threshold can be checked
+with ``PYTHONPATH=. python scripts/check_phash_threshold.py``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import random
+import statistics
+from typing import Callable
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.image_pipeline import hamming_distance, hash_detail_bits, perceptual_hash
+from app.verification import SCREENSHOT_DUPLICATE_MAX_DISTANCE, SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS
+
+WIDTH, HEIGHT = 1170, 2532
+ITEMS = (
+    "Stainless vacuum tumbler 600ml",
+    "Wireless earbuds, noise cancelling",
+    "Hand cream set of 3",
+    "Paperback novel (Japanese edition)",
+    "USB-C cable 2m, braided",
+    "Ceramic mug with lid",
+    "Notebook A5 dotted, 5 pack",
+    "Bath towel, organic cotton",
+)
+
+
+def order_page(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    draw = ImageDraw.Draw(image)
+    font, heading = ImageFont.load_default(size=40), ImageFont.load_default(size=52)
+    draw.rectangle((0, 0, WIDTH, 180), fill=(35, 47, 62))
+    draw.text((60, 90), "amazon.co.jp", font=heading, fill="white")
+    draw.text((60, 240), "Order Details", font=heading, fill=(15, 17, 17))
+    price = rng.randint(500, 9000)
+    rows = [
+        ("Ordered on", f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"),
+        ("Order #", f"249-{rng.randint(0, 9_999_999):07d}-{rng.randint(0, 9_999_999):07d}"),
+        ("Item", rng.choice(ITEMS)),
+        ("Sold by", rng.choice(("Amazon.co.jp", "Shop Ringo", "Tokyo Goods"))),
+        ("Ship to", "Wishlist recipient"),
+        ("Item subtotal", f"JPY {price:,}"),
+        ("Shipping", "JPY 0"),
+        ("Order total", f"JPY {price:,}"),
+        ("Payment", f"Visa ending in {rng.randint(0, 9999):04d}"),
+        ("Delivery", f"Arriving {rng.randint(1, 28)} Jan"),
+    ]
+    y = 340
+    for index, (label, value) in enumerate(rows):
+        draw.text((60, y), label, font=font, fill=(86, 89, 89))
+        draw.text((460, y), value, font=font, fill=(15, 17, 17))
+        y += 88
+        if index == 3:
+            # Product photo.
+            shade = rng.randint(40, 220)
+            draw.rectangle((60, y, 360, y + 300), fill=(shade, 255 - shade, rng.randint(0, 255)))
+            y += 340
+    draw.rounded_rectangle((60, HEIGHT - 260, WIDTH - 60, HEIGHT - 150), radius=30, fill=(255, 216, 20))
+    draw.text((WIDTH // 2 - 200, HEIGHT - 230), "Track package", font=font, fill=(15, 17, 17))
+    return image
+
+
+def reencoded(image: Image.Image, fmt: str, quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+def resized(image: Image.Image, height: int, resample: Image.Resampling) -> Image.Image:
+    return image.resize((round(WIDTH * height / HEIGHT), height), resample)
+
+
+# Copies that must always match: what messaging apps and our own pipeline do to a screenshot.
+REQUIRED_COPIES: dict[str, Callable[[Image.Image], Image.Image]] = {
+    "webp q85": lambda image: reencoded(image, "WEBP", 85),
+    "half size (bilinear)": lambda image: resized(image, HEIGHT // 2, Image.Resampling.BILINEAR),
+}
+# Heavier edits some matches are expected to miss; reported, not enforced.
+REPORTED_COPIES: dict[str, Callable[[Image.Image], Image.Image]] = {
+    "jpeg q60": lambda image: reencoded(image, "JPEG", 60),
+    "half size (lanczos)": lambda image: resized(image, HEIGHT // 2, Image.Resampling.LANCZOS),
+    "2048 tall (lanczos)": lambda image: resized(image, 2048, Image.Resampling.LANCZOS),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the perceptual-hash duplicate threshold")
+    parser.add_argument("--orders", type=int, default=40, help="Distinct synthetic order pages to compare")
+    parser.add_argument("--max-false-rate", type=float, default=0.02, help="Tolerated share of distinct pairs matched")
+    args = parser.parse_args()
+
+    threshold = SCREENSHOT_DUPLICATE_MAX_DISTANCE
+    failures = 0
+    pages = [order_page(seed) for seed in range(args.orders)]
+    hashes = [perceptual_hash(page) for page in pages]
+    print(f"threshold {threshold} of 2048 bits, detail floor {SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS} bits")
+
+    print(f"\n{'same order':24s} {'max':>5s} {'median':>7s} {'missed':>8s}")
+    for label, copy in {**REQUIRED_COPIES, **REPORTED_COPIES}.items():
+        distances = [hamming_distance(phash, perceptual_hash(copy(page))) for page, phash in zip(pages, hashes)]
+        missed = sum(distance > threshold for distance in distances)
+        print(f"{label:24s} {max(distances):5d} {statistics.median(distances):7.1f} {missed:5d}/{len(distances)}")
+        if missed and label in REQUIRED_COPIES:
+            failures += 1
+            print(f"  FAIL {label}: {missed} copies fall outside the threshold")
+
+    different = [
+        hamming_distance(hashes[left], hashes[right])
+        for left in range(len(hashes))
+        for right in range(left + 1, len(hashes))
+    ]
+    matched = sum(distance <= threshold for distance in different)
+    print(
+        f"\ndistinct orders: min {min(different)}, median {statistics.median(different):.1f}, "
+        f"{matched}/{len(different)} pairs within the threshold"
+    )
+    if matched > args.max_false_rate * len(different):
+        failures += 1
+        print(f"  FAIL more than {args.max_false_rate:.0%} of distinct pairs would be flagged as duplicates")
+
+    details = [hash_detail_bits(phash) for phash in hashes]
+    print(f"order pages carry {min(details)}-{max(details)} detail bits")
+    if min(details) < SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS:
+        failures += 1
+        print("  FAIL an order page falls under the detail floor and would never be matched")
+
+    blanks = {
+        "white": Image.new("RGB", (WIDTH, HEIGHT), "white"),
+        "black": Image.new("RGB", (WIDTH, HEIGHT), "black"),
+        "dark mode grey": Image.new("RGB", (WIDTH, HEIGHT), (28, 28, 30)),
+        "gradient": Image.linear_gradient("L").rotate(90).resize((WIDTH, HEIGHT)).convert("RGB"),
+    }
+    for label, blank in blanks.items():
+        detail = hash_detail_bits(perceptual_hash(reencoded(blank, "JPEG", 80)))
+        skipped = detail < SCREENSHOT_DUPLICATE_MIN_DETAIL_BITS
+        print(f"blank ({label}): {detail} detail bits -> {'skipped' if skipped else 'MATCHABLE'}")
+        if not skipped:
+            failures += 1
+
+    if failures:
+        raise SystemExit(f"{failures} check(s) failed")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
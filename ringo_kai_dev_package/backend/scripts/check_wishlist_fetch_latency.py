@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Compare sequential vs racing wishlist fetches against a local fake Amazon server.
+
+The fake server serves a robot-check page slowly for the desktop variant and a
+valid single-item wishlist for the mobile variant, which is the common case where
+sequential fetching pays the full desktop latency before trying mobile.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.wishlist_fetch import fetch_wishlist_html
+
+ROBOT_HTML = "<html><head><title>Robot Check</title></head><body>Enter the characters you see below</body></html>"
+WISHLIST_HTML = (
+    "<html><head><title>Amazon.co.jp: テストリスト</title></head><body>"
+    '<ul id="g-items"><li><a href="/dp/B0TESTASIN/?coliid=1" title="テスト商品">テスト商品</a>'
+    '<span id="itemPrice_1"><span class="a-offscreen">￥3,590</span></span></li></ul>'
+    "</body></html>"
+)
+
+
+def make_handler(desktop_delay: float, mobile_delay: float) -> type[BaseHTTPRequestHandler]:
+    class FakeAmazonHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            is_mobile = "viewType=mobile" in self.path
+            time.sleep(mobile_delay if is_mobile else desktop_delay)
+            body = (WISHLIST_HTML if is_mobile else ROBOT_HTML).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002 - http.server API
+            return
+
+    return FakeAmazonHandler
+
+
+async def measure(url: str, mode: str) -> float:
+    started = time.perf_counter()
+    await fetch_wishlist_html(url, mode=mode)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure wishlist fetch latency against a local fake Amazon server")
+    parser.add_argument("--desktop-delay", type=float, default=3.0, help="Seconds before the desktop variant responds")
+    parser.add_argument("--mobile-delay", type=float, default=0.1, help="Seconds before the mobile variant responds")
+    parser.add_argument("--max-race-seconds", type=float, default=None, help="Fail if racing mode is slower than this")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.desktop_delay, args.mobile_delay))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/hz/wishlist/ls/TESTLIST"
+
+    try:
+        sequential = asyncio.run(measure(url, "sequential"))
+        race = asyncio.run(measure(url, "race"))
+    finally:
+        server.shutdown()
+
+    print(f"sequential: {sequential:.3f}s")
+    print(f"race:       {race:.3f}s")
+    if args.max_race_seconds is not None and race > args.max_race_seconds:
+        raise SystemExit(f"race mode took {race:.3f}s (limit {args.max_race_seconds:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Concurrent throughput of one API worker with database calls inline vs. on the thread pool.
+
+Runs the app in-process over httpx's ASGI transport against the in-memory Supabase fake
+(SUPABASE_BACKEND=memory), whose queries sleep for ``--latency-ms`` as a stand-in for the Supabase
+round trip. "inline" runs every query on the event loop, as the endpoints did before app/db.py;
+"pooled" uses the DB_THREADS-sized pool. No request leaves the process.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any
+
+import httpx
+
+os.environ.setdefault("SUPABASE_BACKEND", "memory")
+
+from app import db
+import app.main as app_main
+from app.db import CountingClient
+from app.fake_supabase import FakeSupabase
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+ROWS: dict[str, list[dict[str, Any]]] = {
+    "apples": [
+        {
+            "id": 1,
+            "user_id": USER_ID,
+            "apple_type": "red",
+            "draw_time": "2025-01-01T00:00:00+00:00",
+            "reveal_time": "2025-01-01T00:10:00+00:00",
+            "status": "revealed",
+        }
+    ],
+    "purchases": [
+        {
+            "id": 1,
+            "purchaser_id": USER_ID,
+            "target_user_id": "00000000-0000-0000-0000-00000000beef",
+            "target_item_name": "テスト商品",
+            "target_item_price": 3500,
+            "target_wishlist_url": "https://www.amazon.co.jp/hz/wishlist/ls/TEST",
+            "status": "pending",
+            "screenshot_url": None,
+            "created_at": "2025-01-01T00:00:00+00:00",
+        }
+    ],
+}
+ENDPOINTS = ("/api/apple/current", "/api/purchase/current")
+
+
+async def run_load(total: int, concurrency: int) -> dict[str, float]:
+    transport = httpx.ASGITransport(app=app_main.api)
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+
+        async def user() -> None:
+            nonlocal errors
+            for index in remaining:
+                started = time.perf_counter()
+                response = await client.get(ENDPOINTS[index % len(ENDPOINTS)], headers={"X-User-Id": USER_ID})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests_per_second": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-worker throughput with inline vs pooled Supabase calls")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32, help="Simultaneous clients")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated Supabase round trip per query")
+    parser.add_argument("--db-threads", type=int, default=db.DB_THREADS)
+    args = parser.parse_args()
+
+    app_main.supabase = CountingClient(FakeSupabase(ROWS, latency=args.latency_ms / 1000))
+    results = {}
+    for mode, threads in (("inline", 0), ("pooled", args.db_threads)):
+        db.configure(db_threads=threads)
+        results[mode] = asyncio.run(run_load(args.requests, args.concurrency))
+        result = results[mode]
+        print(
+            f"{mode:7s} threads={threads:<3d} {result['requests_per_second']:8.1f} req/s   "
+            f"p50 {result['p50_ms']:7.1f}ms   p99 {result['p99_ms']:7.1f}ms   errors {result['errors']}"
+        )
+    db.shutdown()
+    speedup = results["pooled"]["requests_per_second"] / results["inline"]["requests_per_second"]
+    print(f"pooled/inline throughput: {speedup:.1f}x at concurrency {args.concurrency}")
+
+
+if __name__ == "__main__":
+    main()
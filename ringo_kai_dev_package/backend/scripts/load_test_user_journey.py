@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Capacity test: virtual users walk the whole purchase → draw → consume journey against one API worker.
+
+Each virtual user runs /api/user/status → /api/purchase/start → /api/purchase/upload →
+/api/purchase/verify (then polls the job) → /api/wishlist/register → /api/apple/draw →
+/api/apple/result → /api/apple/consume. The app runs in-process over httpx's ASGI transport with:
+
+- the in-memory Supabase fake (SUPABASE_BACKEND=memory) with ``--db-latency-ms`` per query,
+- a local fake Amazon serving scripts/fixtures/wishlist/desktop_single_in_range.html
+  (WISHLIST_FETCH_ORIGIN), after ``--amazon-latency-ms``,
+- a local fake OpenAI chat completions endpoint approving every screenshot (OPENAI_BASE_URL),
+  after ``--openai-latency-ms``.
+
+The ten-minute reveal wait is skipped by backdating the drawn apple's reveal_time in the fake
+database. Consuming a bronze/poison apple is answered with 400 by design and is counted as
+"no ticket", not as an error.
+
+Prints throughput, per-step latency percentiles and error rates, then checks invariants on the
+final database state (no negative balances, user tickets equal the sum of their apples, no
+wishlist item assigned twice, ...). Exits non-zero when an invariant fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import httpx
+from PIL import Image
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "wishlist" / "desktop_single_in_range.html"
+STEPS = ("status", "start", "upload", "verify", "verify_poll", "register", "draw", "result", "consume")
+VERIFY_POLL_INTERVAL = 0.05
+VERIFY_TIMEOUT = 60.0
+
+
+def serve(handler: type[BaseHTTPRequestHandler]) -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fake_amazon(latency: float) -> type[BaseHTTPRequestHandler]:
+    body = FIXTURE.read_bytes()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def fake_openai(latency: float) -> type[BaseHTTPRequestHandler]:
+    verdict = {
+        "decision": "APPROVED",
+        "reason": "負荷試験用の自動承認",
+        "ocr": {"item_name": "負荷試験", "price": 3500, "order_id": "000-0000000-0000000", "confidence": 0.99},
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:  # noqa: N802 - http.server API
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            body = json.dumps(
+                {
+                    "id": "chatcmpl-load-test",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "gpt-4o-mini",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": json.dumps(verdict, ensure_ascii=False)},
+                        }
+                    ],
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def screenshot(seed: int) -> bytes:
+    """A distinct image per user, so the duplicate-receipt check does not flag the load itself."""
+
+    rng = random.Random(seed)
+    image = Image.frombytes("L", (240, 480), bytes(rng.getrandbits(8) for _ in range(240 * 480))).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class Journey:
+    def __init__(self, app_main: Any, fake: Any, client: httpx.AsyncClient) -> None:
+        self.app_main = app_main
+        self.fake = fake
+        self.client = client
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.outcomes: Counter[str] = Counter()
+        self.requests = 0
+
+    async def call(self, step: str, method: str, url: str, user_id: str, ok: tuple[int, ...] = (200,), **kwargs: Any) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={"X-User-Id": user_id}, **kwargs)
+        except Exception as exc:  # transport-level failure inside the app
+            self.errors[step] += 1
+            self.outcomes[f"{step}: {type(exc).__name__}"] += 1
+            return None
+        finally:
+            self.latencies[step].append(time.perf_counter() - started)
+            self.requests += 1
+        if response.status_code not in ok:
+            self.errors[step] += 1
+            self.outcomes[f"{step}: HTTP {response.status_code} {response.text[:80]}"] += 1
+            return None
+        return response
+
+    async def run(self, index: int, user_id: str) -> bool:
+        if not await self.call("status", "POST", "/api/user/status", user_id, json={"status": "tutorial_completed"}):
+            return False
+        start = await self.call("start", "POST", "/api/purchase/start", user_id)
+        if not start:
+            return False
+        purchase_id = start.json()["purchase_id"]
+        files = {"file": ("receipt.png", screenshot(index), "image/png")}
+        if not await self.call("upload", "POST", "/api/purchase/upload", user_id, data={"purchase_id": str(purchase_id)}, files=files):
+            return False
+        if not await self.call("verify", "POST", "/api/purchase/verify", user_id, json={"purchase_id": purchase_id}):
+            return False
+        deadline = time.monotonic() + VERIFY_TIMEOUT
+        while True:
+            state = await self.call("verify_poll", "GET", f"/api/purchase/verify/{purchase_id}", user_id)
+            if not state:
+                return False
+            body = state.json()
+            if body.get("state") in {"completed", "failed", "unknown"}:
+                break
+            if time.monotonic() > deadline:
+                self.errors["verify_poll"] += 1
+                self.outcomes["verify_poll: timed out"] += 1
+                return False
+            await asyncio.sleep(VERIFY_POLL_INTERVAL)
+        if body.get("status") != "approved":
+            self.errors["verify_poll"] += 1
+            self.outcomes[f"verify_poll: {body.get('status')}"] += 1
+            return False
+        wishlist_url = f"https://www.amazon.co.jp/hz/wishlist/ls/LOADTEST{index:06d}"
+        if not await self.call("register", "POST", "/api/wishlist/register", user_id, json={"url": wishlist_url}):
+            return False
+        draw = await self.call("draw", "POST", "/api/apple/draw", user_id, json={})
+        if not draw:
+            return False
+        apple_id = draw.json()["id"]
+        self.backdate_reveal(apple_id)
+        if not await self.call("result", "GET", f"/api/apple/result/{apple_id}", user_id):
+            return False
+        consume = await self.call("consume", "POST", f"/api/apple/consume/{apple_id}", user_id, ok=(200, 400))
+        if not consume:
+            return False
+        self.outcomes["consumed" if consume.status_code == 200 else "no ticket (bronze/poison)"] += 1
+        return True
+
+    def backdate_reveal(self, apple_id: int) -> None:
+        past = (self.app_main.utc_now() - timedelta(minutes=11)).isoformat()
+        with self.fake._lock:
+            for row in self.fake.tables.get("apples", []):
+                if row["id"] == apple_id:
+                    row["reveal_time"] = past
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+def check_invariants(fake: Any, journey_users: set[str], completed: set[str]) -> list[str]:
+    failures: list[str] = []
+    users = {row["id"]: row for row in fake.rows("users")}
+    apples = fake.rows("apples")
+    purchases = fake.rows("purchases")
+    items = fake.rows("wishlist_items")
+
+    for user_id, row in users.items():
+        for field in ("purchase_available", "purchase_obligation", "apple_draw_rights"):
+            if (row.get(field) or 0) < 0:
+                failures.append(f"user {user_id} has negative {field}={row.get(field)}")
+    for apple in apples:
+        if (apple.get("purchase_available") or 0) < 0:
+            failures.append(f"apple {apple['id']} has negative purchase_available")
+
+    apples_by_user: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for apple in apples:
+        apples_by_user[apple["user_id"]].append(apple)
+    for user_id in journey_users:
+        row = users[user_id]
+        tickets = sum(apple.get("purchase_available") or 0 for apple in apples_by_user[user_id])
+        if (row.get("purchase_available") or 0) != tickets:
+            failures.append(f"user {user_id} purchase_available={row.get('purchase_available')} but apples hold {tickets}")
+        open_purchases = [p for p in purchases if p["purchaser_id"] == user_id and p["status"] in {"pending", "submitted"}]
+        if len(open_purchases) > 1:
+            failures.append(f"user {user_id} has {len(open_purchases)} open purchases")
+    for user_id in completed:
+        row = users[user_id]
+        approved = [p for p in purchases if p["purchaser_id"] == user_id and p["status"] == "approved"]
+        if len(approved) != 1 or len(apples_by_user[user_id]) != 1:
+            failures.append(f"user {user_id} finished with {len(approved)} approved purchases and {len(apples_by_user[user_id])} apples")
+        if row.get("apple_draw_rights") or row.get("purchase_obligation"):
+            failures.append(
+                f"user {user_id} finished with apple_draw_rights={row.get('apple_draw_rights')} "
+                f"purchase_obligation={row.get('purchase_obligation')}"
+            )
+
+    assigned = Counter(item["assigned_purchase_id"] for item in items if item.get("assigned_purchase_id") is not None)
+    failures += [f"purchase {purchase_id} holds {count} wishlist items" for purchase_id, count in assigned.items() if count > 1]
+    targets = Counter(
+        (p["target_user_id"], p["target_wishlist_url"]) for p in purchases if p["purchaser_id"] in journey_users
+    )
+    failures += [f"wishlist {target[1]} assigned to {count} purchases" for target, count in targets.items() if count > 1]
+    return failures
+
+
+async def run(args: argparse.Namespace, app_main: Any, fake: Any) -> int:
+    journey_users = {f"00000000-0000-4000-8000-{index:012d}" for index in range(args.users)}
+    ordered_users = sorted(journey_users)
+    fake.seed(
+        "users",
+        [
+            {"id": user_id, "email": f"load{index}@example.com", "status": "registered", "purchase_obligation": 0,
+             "purchase_available": 0, "apple_draw_rights": 0, "referral_count": 0}
+            for index, user_id in enumerate(ordered_users)
+        ],
+    )
+    # One eligible list per virtual user, owned by separate seed users so nobody is assigned their own.
+    owners = [f"00000000-0000-4000-9000-{index:012d}" for index in range(args.users + 1)]
+    fake.seed("users", [{"id": owner, "email": f"owner{index}@example.com", "status": "active"} for index, owner in enumerate(owners)])
+    fake.seed(
+        "wishlist_items",
+        [
+            {"user_id": owner, "title": "負荷試験の商品", "price": 3500, "url": f"https://www.amazon.co.jp/hz/wishlist/ls/OWNER{index:06d}",
+             "assigned_purchase_id": None, "is_eligible": True}
+            for index, owner in enumerate(owners)
+        ],
+    )
+
+    transport = httpx.ASGITransport(app=app_main.api)
+    completed: set[str] = set()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with app_main.api.router.lifespan_context(app_main.api):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=VERIFY_TIMEOUT) as client:
+            journey = Journey(app_main, fake, client)
+
+            async def virtual_user(index: int, user_id: str) -> None:
+                async with semaphore:
+                    if await journey.run(index, user_id):
+                        completed.add(user_id)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(virtual_user(index, user_id) for index, user_id in enumerate(ordered_users)))
+            elapsed = time.perf_counter() - started
+        queue_stats = app_main.verification_queue.stats()
+
+    print(f"\n{args.users} virtual users, concurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"journeys completed {len(completed)}/{args.users}  ({len(completed) / elapsed:.2f} journeys/s, {journey.requests / elapsed:.1f} req/s)")
+    print(f"\n{'step':12s} {'requests':>9s} {'errors':>7s} {'error%':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for step in STEPS:
+        samples = journey.latencies.get(step, [])
+        errors = journey.errors.get(step, 0)
+        rate = errors / len(samples) * 100 if samples else 0.0
+        print(
+            f"{step:12s} {len(samples):9d} {errors:7d} {rate:6.1f}% "
+            f"{percentile(samples, 0.50):7.1f}ms {percentile(samples, 0.95):7.1f}ms {percentile(samples, 0.99):7.1f}ms"
+        )
+    print(f"\nverification queue: {queue_stats}")
+    for outcome, count in journey.outcomes.most_common():
+        print(f"  {count:6d}  {outcome}")
+
+    failures = check_invariants(fake, journey_users, completed)
+    if failures:
+        print(f"\nINVARIANTS FAILED ({len(failures)}):")
+        for failure in failures[:50]:
+            print(f"  - {failure}")
+        return 1
+    if queue_stats.get("failed"):
+        print(f"\n{queue_stats['failed']} verification job(s) failed")
+        return 1
+    print("\ninvariants OK")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive virtual users through the full purchase/draw journey")
+    parser.add_argument("--users", type=int, default=200, help="Virtual users (each runs the journey once)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Journeys in flight at once")
+    parser.add_argument("--db-latency-ms", type=float, default=20.0, help="Simulated Supabase round trip per query")
+    parser.add_argument("--amazon-latency-ms", type=float, default=300.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    _, amazon_origin = serve(fake_amazon(args.amazon_latency_ms / 1000))
+    _, openai_origin = serve(fake_openai(args.openai_latency_ms / 1000))
+    # app.main reads its configuration at import time, so the stand-ins are wired up first.
+    os.environ.update(
+        {
+            "SUPABASE_BACKEND": "memory",
+            "FAKE_SUPABASE_LATENCY_MS": str(args.db_latency_ms),
+            "WISHLIST_FETCH_ORIGIN": amazon_origin,
+            "OPENAI_API_KEY": "load-test",
+            "OPENAI_BASE_URL": f"{openai_origin}/v1",
+            "AMAZON_MAX_REQUESTS_PER_SECOND": "100000",
+            "AMAZON_REQUEST_BURST": "100000",
+        }
+    )
+    os.environ.pop("RESEND_API_KEY", None)
+    app_main = importlib.import_module("app.main")
+    fake = importlib.import_module("app.clients").supabase_client.instance()
+    raise SystemExit(asyncio.run(run(args, app_main, fake)))
+
+
+if __name__ == "__main__":
+    main()
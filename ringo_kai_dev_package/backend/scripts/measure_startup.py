@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Import time of the app and its modules, and cold start to the first answered request.
+
+Every measurement runs in a fresh interpreter (``--runs`` times, median reported), so nothing is
+already imported or cached:
+
+- import: ``import app.main`` and each helper module scripts import on their own, plus which of
+  the heavy SDKs (supabase, openai, psycopg) each import dragged in;
+- cold start: import app.main, run the lifespan startup (client warm-up, verification workers),
+  then the first ``GET /health``, polling until it reports ready (the background warm-up of the
+  bucket, caches and pools has finished), and the first ``GET /api/apple/probabilities``.
+
+The child processes use the in-memory Supabase fake unless --use-env is given, in which case the
+real configuration from the environment / .env is used (and warm-up builds the real clients).
+``--importtime N`` also prints the N slowest modules from ``python -X importtime``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MODULES = (
+    "app.main",
+    "app.rtp",
+    "app.wishlist_fetch",
+    "app.wishlist_items",
+    "app.verification",
+    "app.chatbot",
+    "app.clients",
+)
+HEAVY_PACKAGES = ("fastapi", "supabase", "openai", "psycopg")
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+COLD_START_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import httpx
+import app.main as app_main
+imported = time.perf_counter()
+
+async def main():
+    phases = {"import": imported - started}
+    async with app_main.api.router.lifespan_context(app_main.api):
+        phases["startup"] = time.perf_counter() - imported
+        transport = httpx.ASGITransport(app=app_main.api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            mark = time.perf_counter()
+            response = await client.get("/health")
+            phases["first_health"] = time.perf_counter() - mark
+            phases["health_status"] = response.status_code
+            while response.status_code != 200:
+                await asyncio.sleep(0.005)
+                response = await client.get("/health")
+            phases["ready"] = time.perf_counter() - imported
+            mark = time.perf_counter()
+            await client.get("/api/apple/probabilities", headers={"X-User-Id": "00000000-0000-0000-0000-000000000001"})
+            phases["first_api"] = time.perf_counter() - mark
+        phases["to_first_response"] = time.perf_counter() - started - phases["first_api"]
+    print(json.dumps(phases))
+
+asyncio.run(main())
+"""
+
+
+def run_probe(code: str, env: dict[str, str]) -> dict[str, object]:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"probe failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_times(env: dict[str, str], runs: int) -> None:
+    print(f"{'module':22s} {'median':>9s} {'min':>9s}   heavy packages loaded")
+    for module in MODULES:
+        samples = [run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_PACKAGES), env) for _ in range(runs)]
+        seconds = [float(sample["seconds"]) for sample in samples]
+        loaded = ", ".join(samples[-1]["loaded"]) or "-"
+        print(f"{module:22s} {statistics.median(seconds) * 1000:7.0f}ms {min(seconds) * 1000:7.0f}ms   {loaded}")
+
+
+def cold_start(env: dict[str, str], runs: int) -> None:
+    samples = [run_probe(COLD_START_PROBE, env) for _ in range(runs)]
+    print()
+    for phase in ("import", "startup", "first_health", "ready", "first_api", "to_first_response"):
+        values = [float(sample[phase]) for sample in samples]
+        print(f"{phase:22s} {statistics.median(values) * 1000:7.0f}ms {min(values) * 1000:7.0f}ms")
+    statuses = {sample["health_status"] for sample in samples}
+    print(f"first /health status: {', '.join(str(status) for status in sorted(statuses))}")
+
+
+def slowest_imports(env: dict[str, str], limit: int) -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    rows: list[tuple[int, str]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    print(f"\nslowest imports (cumulative, {limit} of {len(rows)}):")
+    for cumulative, name in sorted(rows, reverse=True)[:limit]:
+        print(f"  {cumulative / 1000:8.1f}ms {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time and cold start to the first request")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--use-env", action="store_true", help="Use the configured Supabase/OpenAI instead of the in-memory fake")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Also list the N slowest imports")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(BACKEND_DIR), os.environ.get("PYTHONPATH")]))}
+    if not args.use_env:
+        env["SUPABASE_BACKEND"] = "memory"
+
+    import_times(env, args.runs)
+    cold_start(env, args.runs)
+    if args.importtime:
+        slowest_imports(env, args.importtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+-- Small re-encoded copy of the purchase screenshot for admin list views
+ALTER TABLE purchases
+  ADD COLUMN IF NOT EXISTS screenshot_thumbnail_url TEXT;
+
+COMMENT ON COLUMN purchases.screenshot_thumbnail_url IS 'Thumbnail generated by the upload image pipeline (null for uploads stored as-is)';
@@ -0,0 +1,22 @@
+-- Track when each wishlist item was last re-checked against Amazon and whether it can still be assigned.
+-- last_validated_at: set by /api/batch/revalidate-wishlists (null = never re-checked since registration)
+-- last_attempted_at / validation_failures: every re-check attempt, and how many in a row could not fetch or read the list
+-- is_eligible / ineligible_reason: items that became empty, multi-item, private or out of range are skipped by assignment
+
+alter table public.wishlist_items
+    add column if not exists last_validated_at timestamptz,
+    add column if not exists last_attempted_at timestamptz,
+    add column if not exists validation_failures integer not null default 0,
+    add column if not exists is_eligible boolean not null default true,
+    add column if not exists ineligible_reason text;
+
+-- Revalidation picks the least recently attempted unassigned rows first.
+drop index if exists public.wishlist_items_revalidation_idx;
+create index if not exists wishlist_items_revalidation_idx
+    on public.wishlist_items (last_attempted_at asc nulls first, created_at)
+    where assigned_purchase_id is null;
+
+-- Assignment only looks at unassigned, eligible rows.
+create index if not exists wishlist_items_available_idx
+    on public.wishlist_items (created_at)
+    where assigned_purchase_id is null and is_eligible;
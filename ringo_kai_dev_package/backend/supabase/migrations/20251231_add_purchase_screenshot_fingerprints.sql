@@ -0,0 +1,15 @@
+-- Content and perceptual hashes of the uploaded screenshot, used to reuse verdicts and spot reused receipts
+ALTER TABLE purchases
+  ADD COLUMN IF NOT EXISTS screenshot_sha256 TEXT,
+  ADD COLUMN IF NOT EXISTS screenshot_phash TEXT;
+
+CREATE INDEX IF NOT EXISTS purchases_screenshot_sha256_idx
+  ON purchases (screenshot_sha256)
+  WHERE screenshot_sha256 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS purchases_screenshot_phash_recent_idx
+  ON purchases (created_at DESC)
+  WHERE screenshot_phash IS NOT NULL;
+
+COMMENT ON COLUMN purchases.screenshot_sha256 IS 'SHA-256 of the uploaded bytes (before normalization)';
+COMMENT ON COLUMN purchases.screenshot_phash IS '2048-bit difference hash (hex) of the uploaded screenshot';
@@ -0,0 +1,9 @@
+-- When the purchase was last submitted for verification; the API re-queues stale submissions after a restart
+ALTER TABLE purchases
+  ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS purchases_submitted_pending_idx
+  ON purchases (submitted_at)
+  WHERE status = 'submitted';
+
+COMMENT ON COLUMN purchases.submitted_at IS 'Last submission for screenshot verification (set by POST /api/purchase/verify)';